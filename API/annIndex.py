@@ -0,0 +1,277 @@
+import os
+import json
+import threading
+import contextlib
+import numpy as np
+
+from embeddingStore import normalize_rows, top_k_rows, exclusive_lock, read_generation, write_generation
+
+# File names used inside EMBEDDINGS_DIRECTORY
+CENTROIDS_FILE = "ivf_centroids.npy"
+ASSIGNMENTS_FILE = "ivf_assignments.json"
+IVF_LOCK_FILE = "ivf.lock"
+
+# Tuning knobs (overridable from the .env file)
+IVF_NLIST = int(os.getenv("IVF_NLIST", 0))  # 0 picks 4 * sqrt(corpus size)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", 8))
+IVF_TRAIN_SAMPLE = int(os.getenv("IVF_TRAIN_SAMPLE", 50000))
+IVF_TRAIN_ITERATIONS = int(os.getenv("IVF_TRAIN_ITERATIONS", 20))
+
+# Rows assigned to centroids per matrix product while building
+ASSIGN_BLOCK_ROWS = 65536
+
+
+def train_centroids(vectors, nlist, iterations=IVF_TRAIN_ITERATIONS, seed=42):
+    """
+    Clusters unit-length vectors with spherical k-means.
+
+    Args:
+        vectors (array): (n, dim) normalized training vectors.
+        nlist (int): Number of clusters.
+        iterations (int): Number of Lloyd iterations.
+        seed (int): Seed for the initial centroid sample.
+
+    Returns:
+        array: (nlist, dim) normalized centroids.
+    """
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    nlist = min(nlist, vectors.shape[0])
+    centroids = vectors[rng.choice(vectors.shape[0], nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=nlist)
+
+        # Re-seed empty clusters from random training vectors
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            sums[empty] = vectors[rng.choice(vectors.shape[0], empty.size, replace=False)]
+        centroids = normalize_rows(sums)
+
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index over an EmbeddingStore.
+
+    The corpus is clustered into `nlist` centroids and every note is assigned to
+    its closest one. A search only scores the notes in the `nprobe` clusters
+    closest to the query, so raising nprobe trades latency for recall (probing
+    every cluster is an exact search). Vectors are read from the store's
+    memmap, so the index itself only keeps the centroids and the note -> cluster
+    assignments.
+
+    Like the store, every change to the assignments holds an exclusive flock on
+    IVF_LOCK_FILE, reloads whatever other writers saved first and bumps the
+    write counter kept in that file.
+    """
+
+    def __init__(self, store, nprobe=IVF_NPROBE):
+        self.store = store
+        self.nprobe = nprobe
+        self.centroids_path = os.path.join(store.directory, CENTROIDS_FILE)
+        self.assignments_path = os.path.join(store.directory, ASSIGNMENTS_FILE)
+        self.lock_path = os.path.join(store.directory, IVF_LOCK_FILE)
+        self._lock_file = None
+        self._thread_lock = threading.Lock()
+        self._load()
+
+    # Hold the index's write lock for one change, picking up whatever other
+    # writers saved first
+    @contextlib.contextmanager
+    def _write_lock(self):
+        with self._thread_lock, exclusive_lock(self.lock_path) as lock_file:
+            self._lock_file = lock_file
+            try:
+                self.refresh()
+                yield
+            finally:
+                self._lock_file = None
+
+    def _load(self):
+        # Read the write counter first, so it is never newer than the files
+        self._generation = read_generation(self.lock_path)
+        if os.path.exists(self.centroids_path) and os.path.exists(self.assignments_path):
+            self.centroids = np.load(self.centroids_path)
+            with open(self.assignments_path, 'r', encoding='utf-8') as file:
+                self.assignments = json.load(file)
+            self._assignments_mtime = os.path.getmtime(self.assignments_path)
+        else:
+            self.centroids = None
+            self.assignments = {}
+            self._assignments_mtime = None
+        self._lists = None
+        self._lists_key = None
+
+    # Called with the write lock held
+    def _save_assignments(self):
+        tmp_path = self.assignments_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.assignments, file)
+        os.replace(tmp_path, self.assignments_path)
+        self._assignments_mtime = os.path.getmtime(self.assignments_path)
+        self._generation += 1
+        write_generation(self._lock_file, self._generation)
+        self._lists = None
+
+    def refresh(self):
+        """
+        Reloads the index if another process has changed it since it was last read.
+        """
+        mtime = os.path.getmtime(self.assignments_path) if os.path.exists(self.assignments_path) else None
+        if mtime != self._assignments_mtime or read_generation(self.lock_path) != self._generation:
+            self._load()
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def build(self, nlist=IVF_NLIST, sample_size=IVF_TRAIN_SAMPLE, iterations=IVF_TRAIN_ITERATIONS):
+        """
+        Trains the centroids on a sample of the store and assigns every stored note.
+
+        Args:
+            nlist (int): Number of clusters; 0 picks 4 * sqrt(corpus size).
+            sample_size (int): Maximum number of vectors used for training.
+            iterations (int): Number of k-means iterations.
+        """
+        names = self.store.names()
+        if not names:
+            raise ValueError("Cannot build an ANN index over an empty embedding store.")
+        if not nlist:
+            nlist = max(1, int(4 * np.sqrt(len(names))))
+
+        matrix = self.store.matrix()
+        rows = np.array([self.store.rows[name] for name in names])
+        rng = np.random.default_rng(42)
+        sample = np.sort(rng.choice(rows, min(sample_size, rows.size), replace=False))
+        self.centroids = train_centroids(matrix[sample], nlist, iterations)
+
+        self.assignments = {}
+        for start in range(0, rows.size, ASSIGN_BLOCK_ROWS):
+            block_rows = rows[start:start + ASSIGN_BLOCK_ROWS]
+            clusters = self._assign(matrix[block_rows])
+            for name, cluster in zip(names[start:start + ASSIGN_BLOCK_ROWS], clusters):
+                self.assignments[name] = int(cluster)
+
+        centroids, assignments = self.centroids, self.assignments
+        with self._write_lock():
+            self.centroids, self.assignments = centroids, assignments
+            np.save(self.centroids_path, self.centroids)
+            self._save_assignments()
+        print(f"Built IVF index with {self.centroids.shape[0]} lists over {len(names)} chunks.")
+
+    def _assign(self, vectors):
+        return np.argmax(np.asarray(vectors, dtype=np.float32) @ self.centroids.T, axis=1)
+
+    def add(self, name, vector):
+        """
+        Assigns a newly indexed note to its closest cluster (no-op until the index is built).
+        """
+        self.add_many([(name, vector)])
+
+    def add_many(self, items):
+        """
+        Assigns several (name, vector) pairs with a single update of the assignments file.
+        """
+        items = list(items)
+        if not items:
+            return
+        with self._write_lock():
+            if not self.trained:
+                return
+            vectors = normalize_rows(np.stack([np.asarray(vector).reshape(-1) for _, vector in items]))
+            for (name, _), cluster in zip(items, self._assign(vectors)):
+                self.assignments[name] = int(cluster)
+            self._save_assignments()
+
+    def delete(self, name):
+        """
+        Removes an entry from its cluster.
+        """
+        self.delete_many([name])
+
+    def delete_many(self, names):
+        """
+        Removes several entries with a single update of the assignments file.
+        """
+        names = list(names)
+        if not names:
+            return
+        with self._write_lock():
+            removed = [name for name in names if self.assignments.pop(name, None) is not None]
+            if removed:
+                self._save_assignments()
+
+    # Group store rows by cluster; rebuilt whenever the store or index changes
+    def _inverted_lists(self):
+        key = (self.store.version, self._generation, self._assignments_mtime)
+        if self._lists is None or self._lists_key != key:
+            nlist = self.centroids.shape[0]
+            clusters = [[] for _ in range(nlist)]
+            for name, cluster in self.assignments.items():
+                row = self.store.rows.get(name)
+                if row is not None:
+                    clusters[cluster].append(row)
+            self._lists = [np.array(sorted(rows), dtype=np.int64) for rows in clusters]
+            self._lists_key = key
+        return self._lists
+
+    def search(self, query_vector, k, nprobe=None):
+        """
+        Returns approximately the k stored entries most similar to `query_vector`.
+
+        Args:
+            query_vector (array): Query embedding; it is normalized here.
+            k (int): Number of results.
+            nprobe (int): Clusters to scan; defaults to the index's nprobe.
+
+        Returns:
+            list: (name, cosine similarity) pairs, best first.
+        """
+        if not self.trained:
+            raise ValueError("The IVF index has not been built yet.")
+        nprobe = min(nprobe or self.nprobe, self.centroids.shape[0])
+        query_vector = normalize_rows(np.asarray(query_vector).reshape(-1))
+
+        centroid_scores = self.centroids @ query_vector
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        lists = self._inverted_lists()
+        candidates = np.concatenate([lists[probe] for probe in probes])
+        if candidates.size == 0:
+            return []
+
+        candidates.sort()
+        vectors = self.store.matrix()[candidates]
+        positions, scores = top_k_rows(vectors, query_vector, k)
+        return [(self.store.ids[candidates[pos]], float(score)) for pos, score in zip(positions, scores)]
+
+
+def measure_recall(store, index, k=10, queries=100, seed=42, **search_options):
+    """
+    Estimates recall@k of an approximate index (IVF or compressed) against an exact search.
+
+    Randomly chosen stored vectors are used as queries, and the share of the exact
+    top-k that the index also returns is averaged over them. `search_options`
+    (such as nprobe) are passed on to index.search.
+
+    Returns:
+        float: Mean recall@k between 0 and 1.
+    """
+    names = store.names()
+    if not names:
+        return 0.0
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(names), min(queries, len(names)), replace=False)
+
+    recalls = []
+    for position in sample:
+        query_vector = store.get(names[position])
+        exact = {name for name, _ in store.search(query_vector, k)}
+        approximate = {name for name, _ in index.search(query_vector, k, **search_options)}
+        recalls.append(len(exact & approximate) / len(exact))
+    return float(np.mean(recalls))
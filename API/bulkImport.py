@@ -0,0 +1,299 @@
+import os
+import csv
+import json
+import time
+import queue
+import threading
+import contextvars
+
+import indexerAPI
+from TenglishFormatter import process_user_inputs
+from noteManifest import content_hash
+from embeddingStore import note_of
+from lexicalIndex import lexical_terms
+from metrics import span, count
+
+# Notes handed from one stage to the next at a time, batches each queue may
+# hold (which bounds memory), and how often progress is checkpointed
+IMPORT_BATCH_NOTES = int(os.getenv("IMPORT_BATCH_NOTES", 64))
+IMPORT_QUEUE_SIZE = int(os.getenv("IMPORT_QUEUE_SIZE", 4))
+IMPORT_CHECKPOINT_NOTES = int(os.getenv("IMPORT_CHECKPOINT_NOTES", 5000))
+
+# File inside EMBEDDINGS_DIRECTORY recording how far each import got
+CHECKPOINT_FILE = "import_checkpoint.json"
+
+# How often blocked stages check whether another stage failed
+STAGE_POLL_SECONDS = 0.5
+
+_DONE = object()
+
+
+class ImportCheckpoint:
+    """
+    Remembers, per input file, the position of the last record whose note and
+    embeddings were written, so an interrupted import resumes after it.
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, CHECKPOINT_FILE)
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as file:
+                self.sources = json.load(file)
+        else:
+            self.sources = {}
+
+    def get(self, source):
+        return self.sources.get(source, {'position': -1, 'imported': 0})
+
+    def save(self, source, position, imported):
+        self.sources[source] = {'position': position, 'imported': imported}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.sources, file, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def read_records(path, fmt, name_field, text_field, skip_through=-1):
+    """
+    Yields (position, name, text) for every note of a JSONL or CSV file after
+    record `skip_through`, where position counts records from 0.
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        if fmt == "csv":
+            rows = enumerate(csv.DictReader(file))
+        else:
+            # Skipped JSON lines are not parsed
+            lines = enumerate(line for line in file if line.strip())
+            rows = ((position, json.loads(line)) for position, line in lines if position > skip_through)
+        for position, row in rows:
+            if position <= skip_through:
+                continue
+            name = row.get(name_field)
+            if not name or os.sep in name or (os.altsep and os.altsep in name):
+                raise ValueError(f"Record {position} of '{path}' has no valid '{name_field}' field.")
+            yield position, name, row.get(text_field) or ""
+
+
+class BulkImporter:
+    """
+    Streams notes from a JSONL or CSV file into the index through four
+    pipelined stages, each in its own thread:
+
+        transliterate -> tokenize and chunk -> embed -> write
+
+    Stages pass batches of IMPORT_BATCH_NOTES notes through queues holding at
+    most IMPORT_QUEUE_SIZE batches, so memory stays bounded however large the
+    input is, and the model runs while the next batches are transliterated
+    (torch releases the GIL during the forward pass). The writer is the only
+    stage that touches the store, notes and manifests; every
+    IMPORT_CHECKPOINT_NOTES notes it saves the manifests and a checkpoint, and
+    a later run over the same file skips everything up to it.
+    """
+
+    def __init__(self, path, fmt=None, name_field="name", text_field="text", batch_notes=IMPORT_BATCH_NOTES,
+                 queue_size=IMPORT_QUEUE_SIZE, checkpoint_every=IMPORT_CHECKPOINT_NOTES):
+        self.path = os.path.abspath(path)
+        self.fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+        if self.fmt not in ("jsonl", "csv"):
+            raise ValueError(f"Unknown import format '{self.fmt}' (expected jsonl or csv)")
+        self.name_field = name_field
+        self.text_field = text_field
+        self.batch_notes = batch_notes
+        self.queue_size = queue_size
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint = ImportCheckpoint(indexerAPI.EMBEDDINGS_DIRECTORY)
+        self._stop = threading.Event()
+        self._errors = []
+        # Held by the writer while it writes and by the embed stage while it
+        # reads which chunks are stored, so neither sees a half-written store
+        self._store_lock = threading.Lock()
+
+    def _put(self, target, item):
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=STAGE_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source):
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=STAGE_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    # Run one stage: apply `work` to every batch from `source` and pass the
+    # result on; the first failure stops every stage
+    def _stage(self, work, source, target):
+        try:
+            while True:
+                batch = self._get(source)
+                if batch is _DONE:
+                    break
+                if not self._put(target, work(batch)):
+                    return
+            self._put(target, _DONE)
+        except Exception as e:
+            self._errors.append(e)
+            self._stop.set()
+
+    def _read(self, target, resume_after):
+        try:
+            # Keyed by note, so a note repeated within a batch keeps only its
+            # last record (which moves to the end, keeping positions ascending)
+            batch = {}
+            for position, name, text in read_records(self.path, self.fmt, self.name_field, self.text_field,
+                                                     skip_through=resume_after):
+                batch.pop(name, None)
+                batch[name] = (position, name, text)
+                if len(batch) == self.batch_notes:
+                    if not self._put(target, list(batch.values())):
+                        return
+                    batch = {}
+            if batch:
+                self._put(target, list(batch.values()))
+            self._put(target, _DONE)
+        except Exception as e:
+            self._errors.append(e)
+            self._stop.set()
+
+    def _transliterate(self, batch):
+        with span('transliteration'):
+            processed = process_user_inputs([text for _, _, text in batch])
+        return [(position, name, text, processed_text) for (position, name, text), processed_text in zip(batch, processed)]
+
+    def _tokenize(self, batch):
+        with span('tokenization'):
+            token_ids = indexerAPI.engine.tokenizer([processed for _, _, _, processed in batch],
+                                                    add_special_tokens=False)['input_ids']
+        return [note + (indexerAPI.chunk_token_ids(ids),) for note, ids in zip(batch, token_ids)]
+
+    def _embed(self, batch):
+        # Chunks already stored (a re-imported or unchanged note) are not embedded again
+        chunked = [(name, chunks) for _, name, _, _, chunks in batch]
+        with self._store_lock:
+            existing = {name: indexerAPI.store.chunk_ids(name) for name, _ in chunked}
+        items, _, _ = indexerAPI.embed_changed_chunks(chunked, existing)
+        return batch, items
+
+    def _write(self, batch, items):
+        with self._store_lock:
+            self._write_locked(batch, items)
+
+    def _write_locked(self, batch, items):
+        chunked = [(name, chunks) for _, name, _, _, chunks in batch]
+        stored = {name: indexerAPI.store.chunk_ids(name) for name, _ in chunked}
+
+        # A batch written after this one was embedded may have dropped chunks it
+        # counted on reusing (the same note, imported again); embed those now
+        embedded = {}
+        for chunk_id, _ in items:
+            embedded.setdefault(note_of(chunk_id), []).append(chunk_id)
+        missing, _, _ = indexerAPI.embed_changed_chunks(
+            chunked, {name: stored[name] + embedded.get(name, []) for name, _ in chunked})
+        items = items + missing
+
+        # Everything else stored for these notes belongs to earlier versions
+        wanted = {f"{name}#{digest}" for name, chunks in chunked for digest, _ in chunks}
+        stale = [chunk_id for name, _ in chunked for chunk_id in stored[name] if chunk_id not in wanted]
+
+        if indexerAPI.note_db is not None:
+            with span('store_write'):
+                indexerAPI.note_db.save_notes([(name, text, processed) for _, name, text, processed, _ in batch],
+                                              items, stale)
+            count('notes_indexed', len(batch))
+            count('chunks_embedded', len(items))
+        else:
+            # Note files first, so a note is on disk before its embeddings are
+            with span('write_notes'):
+                for _, name, _, processed, _ in batch:
+                    with open(os.path.join(indexerAPI.NOTES_DIRECTORY, f"{name}.txt"), 'w', encoding='utf-8') as file:
+                        file.write(processed)
+            indexerAPI.write_chunks(items, stale, len(batch), len(wanted) - len(items))
+            model_id = indexerAPI.engine.fingerprint()
+            for _, name, _, processed, _ in batch:
+                file_path = os.path.join(indexerAPI.NOTES_DIRECTORY, f"{name}.txt")
+                indexerAPI.manifest.record(name, content_hash(processed.encode('utf-8')), os.stat(file_path), model_id)
+
+        if indexerAPI.lexical_index is not None:
+            indexerAPI.lexical_index.update_many((name, lexical_terms(processed)) for _, name, _, processed, _ in batch)
+
+    def _save_checkpoint(self, position, imported):
+        if indexerAPI.note_db is None:
+            indexerAPI.manifest.save()
+        self.checkpoint.save(self.path, position, imported)
+
+    def run(self, restart=False):
+        """
+        Imports the file, resuming after its checkpoint unless `restart` (so
+        records appended to an imported file are picked up by the next run).
+
+        Returns:
+            int: Number of notes imported by this run.
+        """
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"The file '{self.path}' does not exist.")
+        state = {'position': -1, 'imported': 0} if restart else self.checkpoint.get(self.path)
+        if state['position'] >= 0:
+            print(f"Resuming '{self.path}' after record {state['position']} ({state['imported']} notes already imported)")
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(4)]
+        stages = [
+            (self._read, (queues[0], state['position'])),
+            (self._stage, (self._transliterate, queues[0], queues[1])),
+            (self._stage, (self._tokenize, queues[1], queues[2])),
+            (self._stage, (self._embed, queues[2], queues[3])),
+        ]
+        # Each thread runs in a copy of this context so its spans and counters
+        # land in the running operation's profile
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(target,) + args,
+                                    name=f"import-{target.__name__}", daemon=True) for target, args in stages]
+        for thread in threads:
+            thread.start()
+
+        start_time = time.perf_counter()
+        position = state['position']
+        imported = 0
+        since_checkpoint = 0
+        try:
+            while True:
+                result = self._get(queues[3])
+                if result is _DONE:
+                    break
+                batch, items = result
+                self._write(batch, items)
+                position = batch[-1][0]
+                imported += len(batch)
+                since_checkpoint += len(batch)
+                if since_checkpoint >= self.checkpoint_every:
+                    self._save_checkpoint(position, state['imported'] + imported)
+                    since_checkpoint = 0
+                    elapsed = time.perf_counter() - start_time
+                    print(f"Imported {imported} notes ({imported / elapsed:.1f} notes/sec), checkpoint at record {position}")
+        except BaseException:
+            self._stop.set()
+            raise
+        finally:
+            # Everything written so far is kept, whatever stopped the import
+            self._save_checkpoint(position, state['imported'] + imported)
+            for thread in threads:
+                thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+        elapsed = time.perf_counter() - start_time
+        print(f"Imported {imported} notes from '{self.path}' in {elapsed:.1f}s "
+              f"({imported / elapsed if elapsed else 0.0:.1f} notes/sec)")
+        return imported
+
+
+def import_notes(path, fmt=None, name_field="name", text_field="text", batch_notes=IMPORT_BATCH_NOTES,
+                 queue_size=IMPORT_QUEUE_SIZE, checkpoint_every=IMPORT_CHECKPOINT_NOTES, restart=False):
+    """
+    Imports every note of a JSONL or CSV file (see BulkImporter).
+    """
+    importer = BulkImporter(path, fmt, name_field, text_field, batch_notes, queue_size, checkpoint_every)
+    return importer.run(restart=restart)
@@ -0,0 +1,220 @@
+import os
+import json
+import numpy as np
+
+from embeddingStore import normalize_rows, top_k_rows
+
+# File names used inside EMBEDDINGS_DIRECTORY
+PROJECTION_FILE = "compressed_projection.npz"
+CODES_FILE = "compressed_codes.bin"
+CODES_MANIFEST_FILE = "compressed_manifest.json"
+
+# Tuning knobs (overridable from the .env file)
+COMPRESSED_DIM = int(os.getenv("COMPRESSED_DIM", 128))
+COMPRESSED_DTYPE = os.getenv("COMPRESSED_DTYPE", "int8").lower()
+COMPRESSED_TRAIN_SAMPLE = int(os.getenv("COMPRESSED_TRAIN_SAMPLE", 50000))
+COMPRESSED_RERANK = int(os.getenv("COMPRESSED_RERANK", 10))  # shortlist size as a multiple of k
+
+COMPRESSED_DTYPES = {"int8": np.int8, "float16": np.float16}
+
+# Rows projected per matrix product while encoding
+ENCODE_BLOCK_ROWS = 65536
+
+
+def train_projection(vectors, dim):
+    """
+    Fits a PCA projection on unit-length vectors.
+
+    Args:
+        vectors (array): (n, full_dim) normalized training vectors.
+        dim (int): Number of principal components kept.
+
+    Returns:
+        tuple: (mean, components) with shapes (full_dim,) and (dim, full_dim).
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    mean = vectors.mean(axis=0)
+    _, _, components = np.linalg.svd(vectors - mean, full_matrices=False)
+    return mean, components[:min(dim, components.shape[0])].astype(np.float32)
+
+
+class CompressedIndex:
+    """
+    Low-precision copy of the embedding store used for a fast first pass.
+
+    Every row of the store is centred, projected onto the top principal
+    components of the corpus and stored as int8 (with a per-component scale) or
+    float16, so a 768-dim float32 row shrinks to COMPRESSED_DIM bytes. Since the
+    mean's dot product with a query is the same for every row, the projected
+    dot product ranks rows almost like the full cosine does. A search scans the
+    compressed rows, keeps a shortlist of COMPRESSED_RERANK * k rows and
+    re-ranks it against the full-precision matrix.
+
+    Compressed rows line up with the store's rows. Rows the store appended since
+    the last update are projected on the next update() or refresh(); if the
+    store was compacted every row is projected again with the same PCA.
+    """
+
+    def __init__(self, store, rerank=COMPRESSED_RERANK):
+        self.store = store
+        self.rerank = rerank
+        self.projection_path = os.path.join(store.directory, PROJECTION_FILE)
+        self.codes_path = os.path.join(store.directory, CODES_FILE)
+        self.manifest_path = os.path.join(store.directory, CODES_MANIFEST_FILE)
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.projection_path) and os.path.exists(self.manifest_path):
+            projection = np.load(self.projection_path)
+            self.mean = projection['mean']
+            self.components = projection['components']
+            self.scales = projection['scales']
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                manifest = json.load(file)
+            self.dtype = manifest['dtype']
+            self.ids = manifest['ids']
+            self.codes = np.fromfile(self.codes_path, dtype=COMPRESSED_DTYPES[self.dtype]).reshape(len(self.ids), -1)
+            self._manifest_mtime = os.path.getmtime(self.manifest_path)
+        else:
+            self.components = None
+            self.ids = []
+            self.codes = None
+            self._manifest_mtime = None
+        self._store_version = None
+
+    def _save(self, appended_from=None):
+        # Append only the new rows when possible, otherwise rewrite the codes
+        if appended_from is None:
+            tmp_path = self.codes_path + ".tmp"
+            with open(tmp_path, 'wb') as file:
+                file.write(self.codes.tobytes())
+            os.replace(tmp_path, self.codes_path)
+        else:
+            row_bytes = self.codes.shape[1] * self.codes.itemsize
+            with open(self.codes_path, 'ab') as file:
+                file.truncate(appended_from * row_bytes)
+                file.write(self.codes[appended_from:].tobytes())
+
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'dtype': self.dtype, 'dim': int(self.components.shape[0]), 'ids': self.ids}, file)
+        os.replace(tmp_path, self.manifest_path)
+        self._manifest_mtime = os.path.getmtime(self.manifest_path)
+
+    @property
+    def trained(self):
+        return self.components is not None
+
+    def build(self, dim=COMPRESSED_DIM, dtype=COMPRESSED_DTYPE, sample_size=COMPRESSED_TRAIN_SAMPLE):
+        """
+        Trains the PCA on a sample of the store and encodes every stored row.
+
+        Args:
+            dim (int): Number of principal components kept.
+            dtype (str): "int8" or "float16".
+            sample_size (int): Maximum number of vectors used for training.
+        """
+        if dtype not in COMPRESSED_DTYPES:
+            raise ValueError(f"Unknown COMPRESSED_DTYPE '{dtype}' (expected one of {', '.join(COMPRESSED_DTYPES)})")
+        names = self.store.names()
+        if not names:
+            raise ValueError("Cannot build a compressed index over an empty embedding store.")
+
+        matrix = self.store.matrix()
+        rows = np.array([self.store.rows[name] for name in names])
+        rng = np.random.default_rng(42)
+        sample = np.sort(rng.choice(rows, min(sample_size, rows.size), replace=False))
+        self.mean, self.components = train_projection(matrix[sample], dim)
+        self.dtype = dtype
+
+        # int8 codes use one scale per component, taken from the training sample
+        if dtype == "int8":
+            projected = (np.asarray(matrix[sample]) - self.mean) @ self.components.T
+            self.scales = np.maximum(np.abs(projected).max(axis=0), 1e-6).astype(np.float32) / 127
+        else:
+            self.scales = np.ones(self.components.shape[0], dtype=np.float32)
+        np.savez(self.projection_path, mean=self.mean, components=self.components, scales=self.scales)
+
+        self.ids = list(self.store.ids)
+        self.codes = self._encode(matrix)
+        self._save()
+        self._store_version = self.store.version
+        print(f"Built {dtype} compressed index with {self.components.shape[0]} dimensions "
+              f"over {len(names)} chunks ({self.codes.nbytes / 1e6:.1f} MB).")
+
+    def _encode(self, vectors):
+        codes = []
+        for start in range(0, vectors.shape[0], ENCODE_BLOCK_ROWS):
+            projected = (np.asarray(vectors[start:start + ENCODE_BLOCK_ROWS]) - self.mean) @ self.components.T
+            if self.dtype == "int8":
+                projected = np.clip(np.rint(projected / self.scales), -127, 127)
+            codes.append(projected.astype(COMPRESSED_DTYPES[self.dtype]))
+        if not codes:
+            return np.empty((0, self.components.shape[0]), dtype=COMPRESSED_DTYPES[self.dtype])
+        return np.concatenate(codes)
+
+    # Bring the codes in line with the store's rows; returns the first row that
+    # changed, or None if every row had to be encoded again
+    def _catch_up(self):
+        store_ids = self.store.ids
+        known = len(self.ids)
+        aligned = known <= len(store_ids) and all(
+            store_id is None or store_id == own_id for store_id, own_id in zip(store_ids, self.ids))
+        if aligned:
+            self.codes = np.concatenate([self.codes, self._encode(self.store.matrix()[known:])])
+            first_changed = known
+        else:
+            self.codes = self._encode(self.store.matrix())
+            first_changed = None
+        self.ids = list(store_ids)
+        self._store_version = self.store.version
+        return first_changed
+
+    def update(self):
+        """
+        Encodes rows the store gained since the last update and saves them
+        (no-op until the index is built).
+        """
+        if not self.trained or self._store_version == self.store.version:
+            return
+        self._save(appended_from=self._catch_up())
+
+    def refresh(self):
+        """
+        Reloads the codes if another process changed them, then encodes in memory
+        any rows the store has that are not saved yet.
+        """
+        mtime = os.path.getmtime(self.manifest_path) if os.path.exists(self.manifest_path) else None
+        if mtime != self._manifest_mtime:
+            self._load()
+        if self.trained and self._store_version != self.store.version:
+            self._catch_up()
+
+    def search(self, query_vector, k, shortlist=None):
+        """
+        Returns approximately the k stored entries most similar to `query_vector`.
+
+        Args:
+            query_vector (array): Query embedding; it is normalized here.
+            k (int): Number of results.
+            shortlist (int): Rows re-ranked at full precision; defaults to rerank * k.
+
+        Returns:
+            list: (name, cosine similarity) pairs, best first.
+        """
+        if not self.trained:
+            raise ValueError("The compressed index has not been built yet.")
+        query_vector = normalize_rows(np.asarray(query_vector).reshape(-1))
+
+        # First pass: score the compressed rows; folding the int8 scales into the
+        # query avoids dequantizing the codes
+        projected_query = (self.components @ query_vector) * self.scales
+        live = self.store.live_mask() if self.store.tombstones() else None
+        candidates, _ = top_k_rows(self.codes, projected_query, max(shortlist or self.rerank * k, k), live=live)
+        if candidates.size == 0:
+            return []
+
+        # Second pass: re-rank the shortlist against the full-precision rows
+        candidates.sort()
+        positions, scores = top_k_rows(self.store.matrix()[candidates], query_vector, k)
+        return [(self.store.ids[candidates[pos]], float(score)) for pos, score in zip(positions, scores)]
@@ -0,0 +1,83 @@
+import os
+import sys
+import zlib
+import tempfile
+
+import numpy as np
+import pytest
+
+# The API modules import the input processing modules (metrics.py,
+# TenglishFormatter.py, ...) as top-level modules, as CLIR does
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inputProcesser'))
+
+# indexerAPI and retrievalAPI open their stores at import time, so point them at
+# a scratch directory instead of the checkout's notes and embeddings; tests that
+# write swap the module-level stores for ones in their own tmp_path
+_scratch = tempfile.mkdtemp(prefix="csntr-tests-")
+for name in ("notes", "embeddings"):
+    os.makedirs(os.path.join(_scratch, name))
+os.environ["NOTES_DIRECTORY"] = os.path.join(_scratch, "notes")
+os.environ["EMBEDDINGS_DIRECTORY"] = os.path.join(_scratch, "embeddings")
+os.environ["QUERY_CACHE_PATH"] = ""
+os.environ["TRANSLIT_CACHE_PATH"] = ""
+# A small English vocabulary, so nothing downloads the NLTK word list
+os.environ["ENGLISH_VOCAB_PATH"] = os.path.join(_scratch, "english_vocab.txt")
+with open(os.environ["ENGLISH_VOCAB_PATH"], 'w', encoding='utf-8') as file:
+    file.write("\n".join(["book", "is", "on", "read", "table", "the"]))
+os.environ["METRICS_LOG"] = ""
+for name in ("STORAGE_BACKEND", "SHARDS", "SHARD_ADDRESSES", "ANN_INDEX", "COMPRESSED_INDEX", "LEXICAL_INDEX"):
+    os.environ.pop(name, None)
+
+
+class FakeTokenizer:
+    """
+    Stands in for the BERT tokenizer: one stable id per whitespace-separated word.
+    """
+
+    def __call__(self, texts, add_special_tokens=False):
+        if isinstance(texts, str):
+            return {'input_ids': self._ids(texts)}
+        return {'input_ids': [self._ids(text) for text in texts]}
+
+    def _ids(self, text):
+        return [zlib.crc32(word.encode('utf-8')) % 30000 + 3 for word in text.split()]
+
+    def build_inputs_with_special_tokens(self, token_ids):
+        return [1] + list(token_ids) + [2]
+
+
+@pytest.fixture
+def indexer(tmp_path, monkeypatch):
+    """
+    indexerAPI working on empty note and embedding directories under tmp_path,
+    with a fake tokenizer and a fake model (a bag-of-token-ids histogram) in
+    place of mBERT. `indexer.embedded` counts the chunks sent to the model.
+    """
+    import indexerAPI
+    from embeddingStore import EmbeddingStore
+    from noteManifest import NoteManifest
+
+    notes = tmp_path / "notes"
+    embeddings = tmp_path / "embeddings"
+    notes.mkdir()
+    embeddings.mkdir()
+    monkeypatch.setattr(indexerAPI, "NOTES_DIRECTORY", str(notes))
+    monkeypatch.setattr(indexerAPI, "EMBEDDINGS_DIRECTORY", str(embeddings))
+    monkeypatch.setattr(indexerAPI, "note_db", None)
+    monkeypatch.setattr(indexerAPI, "store", EmbeddingStore(str(embeddings)))
+    monkeypatch.setattr(indexerAPI, "manifest", NoteManifest(str(embeddings)))
+    monkeypatch.setattr(indexerAPI, "ann_index", None)
+    monkeypatch.setattr(indexerAPI, "compressed_index", None)
+    monkeypatch.setattr(indexerAPI, "lexical_index", None)
+
+    embedded = []
+
+    def embed_token_batch(token_id_lists):
+        embedded.extend(token_id_lists)
+        return np.stack([np.bincount(np.asarray(ids) % 32, minlength=32).astype(np.float32) + 0.01
+                         for ids in token_id_lists])
+
+    monkeypatch.setattr(indexerAPI.engine, "_tokenizer", FakeTokenizer())
+    monkeypatch.setattr(indexerAPI.engine, "embed_token_batch", embed_token_batch)
+    monkeypatch.setattr(indexerAPI, "embedded", embedded, raising=False)
+    return indexerAPI
@@ -0,0 +1,366 @@
+import io
+import os
+import sys
+import json
+import hmac
+import secrets
+import importlib
+import functools
+import time
+import threading
+import contextlib
+import contextvars
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Address of the warm daemon (localhost only)
+DAEMON_HOST = os.getenv("DAEMON_HOST", "127.0.0.1")
+DAEMON_PORT = int(os.getenv("DAEMON_PORT", 8765))
+
+# Answer concurrent find requests in micro-batches (see queryService.py)
+DAEMON_BATCH_QUERIES = os.getenv("DAEMON_BATCH_QUERIES", "").lower() in ("1", "on", "true")
+
+# How long a client waits to find out whether the daemon is up
+PING_TIMEOUT = 0.2
+
+# Commands must carry the secret kept in this file (readable by the user only)
+# in TOKEN_HEADER, so other local users and web pages cannot run them
+EMBEDDINGS_DIRECTORY = os.getenv("EMBEDDINGS_DIRECTORY")
+TOKEN_FILE = "daemon.token"
+TOKEN_HEADER = "X-Daemon-Token"
+
+# Host headers accepted besides the address the server listens on (anything
+# else is a page on another site resolved to this machine)
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+# Per-stage profile of the most recent command run through run_command
+last_profile = None
+
+# Exceptions that are sent back to the client and raised there again
+FORWARDED_ERRORS = {
+    'FileNotFoundError': FileNotFoundError,
+    'FileExistsError': FileExistsError,
+    'ValueError': ValueError,
+}
+
+
+# Module and function implementing each command. The modules are imported on
+# first use rather than at the top of the file, so a client talking to a running
+# daemon never loads them and a local command only loads its own module
+COMMANDS = {
+    'create': ('indexerAPI', 'createNote'),
+    'edit': ('indexerAPI', 'editNote'),
+    'index': ('indexerAPI', 'index'),
+    'delete': ('indexerAPI', 'deleteNote'),
+    'reindex': ('indexerAPI', 'index_all'),
+    'sync': ('indexerAPI', 'sync'),
+    'import_files': ('indexerAPI', 'import_note_files'),
+    'import': ('bulkImport', 'import_notes'),
+    'build_ann': ('indexerAPI', 'build_ann_index'),
+    'inference_check': ('indexerAPI', 'inference_check'),
+    'ann_recall': ('retrievalAPI', 'ann_recall'),
+    'build_compressed': ('indexerAPI', 'build_compressed_index'),
+    'compressed_recall': ('retrievalAPI', 'compressed_recall'),
+    'build_lexical': ('indexerAPI', 'build_lexical_index'),
+    'watch': ('noteWatcher', 'start_watching'),
+    'find': ('retrievalAPI', 'find'),
+    'cache_stats': ('retrievalAPI', 'cache_stats'),
+    'metrics': ('metrics', 'totals'),
+}
+
+
+# Buffer collecting what the command running in this context prints (None
+# outside a daemon command, so other threads print to the real stdout)
+_captured_output = contextvars.ContextVar('daemon_output', default=None)
+
+
+class CommandOutput(io.TextIOBase):
+    """
+    Stands in for sys.stdout in the daemon: writes go to the buffer of the
+    command running in the writing thread (and threads started in its context),
+    and to the real stdout from anywhere else, such as the note watcher.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def _target(self):
+        output = _captured_output.get()
+        return self.stream if output is None else output
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+    def writable(self):
+        return True
+
+
+@contextlib.contextmanager
+def capture_output():
+    """
+    Collects what the current command prints into the StringIO it yields.
+    """
+    output = io.StringIO()
+    token = _captured_output.set(output)
+    try:
+        yield output
+    finally:
+        _captured_output.reset(token)
+
+
+def resolve(command):
+    """
+    Imports the module implementing `command` and returns its function.
+    """
+    module, function = COMMANDS[command]
+    return getattr(importlib.import_module(module), function)
+
+
+def _commands():
+    """
+    Maps every command name to the API function that implements it (used by
+    the daemon, which loads them all up front).
+    """
+    return {command: resolve(command) for command in COMMANDS}
+
+
+def run_local(command, params):
+    """
+    Runs a command in this process, recording its profile in last_profile.
+    """
+    global last_profile
+    function = resolve(command)
+    from metrics import operation
+
+    profile = None
+    try:
+        with operation(command) as profile:
+            return function(**params)
+    finally:
+        # Left unset when the operation could not even start
+        last_profile = profile.report() if profile is not None else None
+
+
+def daemon_token(directory=None, create=False):
+    """
+    Returns the daemon's secret from TOKEN_FILE in `directory`
+    (EMBEDDINGS_DIRECTORY by default), or None if there is none yet.
+
+    With `create`, a missing token is generated and written with 0600
+    permissions, so the daemon and shard servers of one store share it.
+    """
+    path = os.path.join(directory or EMBEDDINGS_DIRECTORY or ".", TOKEN_FILE)
+    if create and not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        descriptor = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+            file.write(secrets.token_hex(32))
+        # Another server may have created it meanwhile; the first one wins
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def daemon_available(host=DAEMON_HOST, port=DAEMON_PORT):
+    """
+    Returns True if a daemon answers on host:port.
+    """
+    try:
+        with urllib.request.urlopen(f"http://{host}:{port}/ping", timeout=PING_TIMEOUT) as response:
+            return response.status == 200
+    except (OSError, urllib.error.URLError):
+        return False
+
+
+def call(command, params, host=DAEMON_HOST, port=DAEMON_PORT, token=None):
+    """
+    Runs a command on the daemon and returns its result.
+
+    The request carries `token` (read from TOKEN_FILE by default). Anything the
+    command printed on the daemon is printed here, its profile is kept in
+    last_profile, and forwarded exceptions are raised again with their
+    original type.
+    """
+    global last_profile
+    request = urllib.request.Request(
+        f"http://{host}:{port}/{command}",
+        data=json.dumps(params).encode('utf-8'),
+        headers={'Content-Type': 'application/json', TOKEN_HEADER: token or daemon_token() or ""},
+        method='POST'
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            reply = json.loads(response.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        reply = json.loads(e.read().decode('utf-8'))
+
+    if reply.get('output'):
+        print(reply['output'], end='')
+    last_profile = reply.get('profile')
+    if 'error' in reply:
+        raise FORWARDED_ERRORS.get(reply['error'], RuntimeError)(reply['message'])
+    return reply['result']
+
+
+def run_command(command, **params):
+    """
+    Runs a command on the daemon if one is running, otherwise in this process.
+    """
+    if daemon_available():
+        return call(command, params)
+    return run_local(command, params)
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    """
+    Handles one JSON request per POST /<command>.
+
+    Requests must be addressed to this machine by name or address, be sent as
+    application/json and carry `token` in TOKEN_HEADER; with no token set,
+    every command is refused.
+    """
+
+    commands = {}
+    lock = threading.Lock()
+    batcher = None
+    token = None
+
+    def do_GET(self):
+        if self.path == '/ping':
+            self._reply(200, {'status': 'ok'})
+        else:
+            self._reply(404, {'error': 'NotFound', 'message': f"Unknown path '{self.path}'."})
+
+    # Returns the (status, reply) refusing the request, or None to accept it
+    def _refusal(self):
+        host = (self.headers.get('Host') or "").rsplit(':', 1)[0].strip('[]').lower()
+        if host not in LOCAL_HOSTS + (self.server.server_address[0],):
+            return 403, {'error': 'Forbidden', 'message': f"Requests for host '{host}' are not accepted."}
+        content_type = (self.headers.get('Content-Type') or "").split(';')[0].strip().lower()
+        if content_type != 'application/json':
+            return 415, {'error': 'UnsupportedMediaType', 'message': "Commands must be sent as application/json."}
+        sent = self.headers.get(TOKEN_HEADER) or ""
+        if self.token is None or not hmac.compare_digest(sent.encode('utf-8'), self.token.encode('utf-8')):
+            return 403, {'error': 'Forbidden', 'message': f"Missing or wrong {TOKEN_HEADER}."}
+        return None
+
+    def do_POST(self):
+        refusal = self._refusal()
+        if refusal is not None:
+            self._reply(*refusal)
+            return
+
+        command = self.path.strip('/')
+        if command not in self.commands:
+            self._reply(404, {'error': 'NotFound', 'message': f"Unknown command '{command}'."})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        params = json.loads(self.rfile.read(length).decode('utf-8')) if length else {}
+
+        # Batched queries take the lock once per batch inside the batcher, so
+        # they skip the per-command lock (and output capture) below
+        if command == 'find' and self.batcher is not None:
+            start_time = time.perf_counter()
+            try:
+                status, reply = 200, {'result': self.batcher.find_blocking(**params)}
+            except tuple(FORWARDED_ERRORS.values()) as e:
+                status, reply = 400, {'error': type(e).__name__, 'message': str(e)}
+            except Exception as e:
+                status, reply = 500, {'error': type(e).__name__, 'message': str(e)}
+            reply['elapsed_ms'] = (time.perf_counter() - start_time) * 1000
+            self._reply(status, reply)
+            return
+
+        # Commands share the store and model, so they run one at a time, and
+        # whatever they print is sent back to the client with their profile
+        from metrics import operation
+        start_time = time.perf_counter()
+        with self.lock, capture_output() as output, operation(command) as profile:
+            try:
+                result = self.commands[command](**params)
+                status, reply = 200, {'result': result}
+            except tuple(FORWARDED_ERRORS.values()) as e:
+                status, reply = 400, {'error': type(e).__name__, 'message': str(e)}
+            except Exception as e:
+                status, reply = 500, {'error': type(e).__name__, 'message': str(e)}
+        reply['output'] = output.getvalue()
+        reply['profile'] = profile.report()
+        reply['elapsed_ms'] = (time.perf_counter() - start_time) * 1000
+        self._reply(status, reply)
+
+    def _reply(self, status, body):
+        data = json.dumps(body, default=float).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DaemonServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server with a listen backlog deep enough for bursts of
+    concurrent queries (the default of 5 resets connections under load).
+    """
+
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def serve(host=DAEMON_HOST, port=DAEMON_PORT, batch_queries=DAEMON_BATCH_QUERIES, watch=False):
+    """
+    Loads the model, vocabulary and embedding store once and serves commands
+    on host:port until interrupted. With `batch_queries`, concurrent find
+    requests are answered in micro-batches; with `watch`, notes edited in
+    NOTES_DIRECTORY are re-indexed as they change.
+    """
+    # Printing commands only capture their own output, so install the proxy once
+    # rather than swapping the process-wide sys.stdout per request
+    if not isinstance(sys.stdout, CommandOutput):
+        sys.stdout = CommandOutput(sys.stdout)
+    DaemonHandler.token = daemon_token(create=True)
+    DaemonHandler.commands = _commands()
+    # The watcher takes the command lock only around its reads and writes of the store
+    DaemonHandler.commands['watch'] = functools.partial(DaemonHandler.commands['watch'], lock=DaemonHandler.lock)
+    if batch_queries:
+        from retrievalAPI import find_many
+        from queryService import BatchingQueryService
+
+        DaemonHandler.batcher = BatchingQueryService(find_many, lock=DaemonHandler.lock)
+        DaemonHandler.batcher.run_in_thread()
+        DaemonHandler.commands['query_batches'] = DaemonHandler.batcher.stats
+
+    # Warm up the transliteration pipeline and the model before accepting requests
+    start_time = time.perf_counter()
+    DaemonHandler.commands['find']("nenu", k=1)
+    print(f"Daemon warmed up in {time.perf_counter() - start_time:.1f}s")
+    if watch:
+        DaemonHandler.commands['watch']()
+
+    server = DaemonServer((host, port), DaemonHandler)
+    print(f"Daemon listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
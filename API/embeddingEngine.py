@@ -0,0 +1,241 @@
+import os
+import time
+import random
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+from metrics import span, count
+
+load_dotenv()
+
+# Model shared by indexing and retrieval, and the intra-op thread count torch
+# should use (0 keeps torch's default)
+MODEL_NAME = os.getenv("MODEL_NAME", 'bert-base-multilingual-cased')
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", 0))
+
+# CPU inference mode: plain fp32, dynamic int8 quantization of the Linear
+# layers, a TorchScript-traced model, or both ("int8-traced")
+INFERENCE_MODE = os.getenv("INFERENCE_MODE", "fp32").lower()
+INFERENCE_MODES = ("fp32", "int8", "traced", "int8-traced")
+
+# Traced models are specialised per padded sequence length, so batches are
+# padded up to a multiple of this many tokens to keep the number of traces small
+TRACE_LENGTH_STEP = 64
+
+# Seed for reproducibility
+RANDOM_SEED = 42
+
+
+class EmbeddingEngine:
+    """
+    Owns the tokenizer and model used to embed notes and queries.
+
+    Nothing is loaded until the tokenizer or model is first needed, and both API
+    modules share one instance through get_engine(), so a process that indexes
+    and queries pays for loading mBERT once. The engine also owns the torch
+    setup: thread count, eval mode, no-grad inference and mean pooling.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, num_threads=TORCH_NUM_THREADS, mode=INFERENCE_MODE):
+        if mode not in INFERENCE_MODES:
+            raise ValueError(f"Unknown INFERENCE_MODE '{mode}' (expected one of {', '.join(INFERENCE_MODES)})")
+        self.model_name = model_name
+        self.num_threads = num_threads
+        self.mode = mode
+        self.quantized = mode.startswith("int8")
+        self.traced = mode.endswith("traced")
+        self._tokenizer = None
+        self._model = None
+        self._traces = {}
+        self._lock = threading.Lock()
+
+    def fingerprint(self):
+        """
+        Identifies everything that determines the embeddings this engine produces.
+        """
+        if self.mode == "fp32":
+            return self.model_name
+        return f"{self.model_name}|{self.mode}"
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            with self._lock:
+                if self._tokenizer is None:
+                    from transformers import BertTokenizer
+                    self._tokenizer = BertTokenizer.from_pretrained(self.model_name)
+        return self._tokenizer
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load_model()
+        return self._model
+
+    def _load_model(self):
+        with span('model_load'):
+            return self._build_model()
+
+    def _build_model(self):
+        import torch
+        from transformers import BertModel
+
+        random.seed(RANDOM_SEED)
+        torch.manual_seed(RANDOM_SEED)
+        if torch.cuda.is_available():
+            torch.cuda.manual_seed(RANDOM_SEED)
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+
+        # torchscript=True makes the model return plain tuples, which tracing needs
+        model = BertModel.from_pretrained(self.model_name, torchscript=self.traced)
+        model.eval()
+        if self.quantized:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    # Return the traced model for one padded sequence length, tracing it on first use
+    def _trace(self, input_ids, attention_mask):
+        import torch
+
+        length = input_ids.shape[1]
+        if length not in self._traces:
+            with self._lock:
+                if length not in self._traces:
+                    with torch.no_grad():
+                        self._traces[length] = torch.jit.trace(self.model, (input_ids, attention_mask), strict=False)
+        return self._traces[length]
+
+    def embed_token_batch(self, token_ids):
+        """
+        Embeds a batch of tokenized texts, padding only up to the longest one.
+
+        Args:
+            token_ids (list): Lists of token ids, each already wrapped in [CLS]/[SEP].
+
+        Returns:
+            np.ndarray: (batch, dim) float32 embeddings.
+        """
+        import torch
+
+        with span('padding'):
+            encoding = self.tokenizer.pad({'input_ids': token_ids}, padding=True, return_tensors='pt',
+                                          pad_to_multiple_of=TRACE_LENGTH_STEP if self.traced else None)
+        input_ids = encoding['input_ids']
+        attention_mask = encoding['attention_mask']
+
+        # Average only over real tokens so padding does not change a text's
+        # embedding compared with encoding it on its own
+        model = self.model
+        with span('bert_forward'), torch.inference_mode():
+            if self.traced:
+                hidden_state = self._trace(input_ids, attention_mask)(input_ids, attention_mask)[0]
+            else:
+                hidden_state = model(input_ids, attention_mask=attention_mask)[0]
+            mask = attention_mask.unsqueeze(-1).to(hidden_state.dtype)
+            embeddings = (hidden_state * mask).sum(dim=1) / mask.sum(dim=1)
+        count('sequences_embedded', len(token_ids))
+
+        return embeddings.numpy()
+
+    def compute_embeddings(self, texts, max_tokens=512):
+        """
+        Embeds whole texts, truncating each at `max_tokens`.
+
+        Returns:
+            np.ndarray: (len(texts), dim) float32 embeddings.
+        """
+        with span('tokenization'):
+            token_ids = self.tokenizer(list(texts), truncation=True, max_length=max_tokens,
+                                       add_special_tokens=True)['input_ids']
+        return self.embed_token_batch(token_ids)
+
+    def compute_embedding(self, text):
+        """
+        Embeds a single text (a note or a query).
+
+        Returns:
+            np.ndarray: (1, dim) float32 embedding.
+        """
+        return self.compute_embeddings([text])
+
+
+def compare_inference_modes(texts, modes=("int8", "traced", "int8-traced"), threads=(), batch_size=16, max_tokens=512):
+    """
+    Times each inference mode against fp32 on `texts` and measures how far its
+    embeddings drift from the fp32 ones.
+
+    Args:
+        texts (list): Sample texts to embed.
+        modes (tuple): Inference modes compared with fp32.
+        threads (tuple): Intra-op thread counts to try (empty keeps the current one).
+        batch_size (int): Texts per forward pass.
+        max_tokens (int): Tokens each text is truncated to.
+
+    Returns:
+        list: One dict per (mode, threads) with seconds, texts_per_sec, speedup
+        over fp32 at the same thread count, and mean/min cosine to fp32.
+    """
+    import torch
+
+    default_threads = torch.get_num_threads()
+    thread_counts = list(threads) or [default_threads]
+    reference = {}
+    results = []
+
+    try:
+        for mode in ("fp32",) + tuple(mode for mode in modes if mode != "fp32"):
+            engine = EmbeddingEngine(mode=mode)
+            # Warm up: load the model and (for traced modes) trace every length used
+            engine.compute_embeddings(texts[:batch_size], max_tokens)
+
+            for num_threads in thread_counts:
+                torch.set_num_threads(num_threads)
+                start_time = time.perf_counter()
+                embeddings = np.vstack([engine.compute_embeddings(texts[start:start + batch_size], max_tokens)
+                                        for start in range(0, len(texts), batch_size)])
+                seconds = time.perf_counter() - start_time
+                embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+                if mode == "fp32":
+                    reference[num_threads] = (embeddings, seconds)
+                fp32_embeddings, fp32_seconds = reference[num_threads]
+                cosines = np.sum(embeddings * fp32_embeddings, axis=1)
+                results.append({
+                    'mode': mode,
+                    'threads': num_threads,
+                    'seconds': seconds,
+                    'texts_per_sec': len(texts) / seconds,
+                    'speedup': fp32_seconds / seconds,
+                    'mean_cosine': float(cosines.mean()),
+                    'min_cosine': float(cosines.min()),
+                })
+            del engine
+    finally:
+        torch.set_num_threads(default_threads)
+
+    return results
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """
+    Returns the process-wide EmbeddingEngine, creating it on first call.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = EmbeddingEngine()
+    return _engine
+
+
+# Function to compute the embedding of a document or query
+def compute_embedding(text):
+    return get_engine().compute_embedding(text)
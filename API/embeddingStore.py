@@ -0,0 +1,532 @@
+import os
+import json
+import threading
+import contextlib
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not serialized across processes
+    fcntl = None
+
+from metrics import count
+
+# File names used inside EMBEDDINGS_DIRECTORY
+MATRIX_FILE = "embeddings.f32"
+MANIFEST_FILE = "embeddings_manifest.json"
+LOCK_FILE = "embeddings.lock"
+LEGACY_SUFFIX = "_embedding.npy"
+
+# Entries are keyed "{note}#{chunk hash}"; the note name is everything before the last separator
+CHUNK_SEPARATOR = "#"
+
+# Compact the matrix once this share of its rows are tombstones
+COMPACT_RATIO = 0.25
+
+# Number of rows scored per matrix-vector product during a search
+SCORE_BLOCK_ROWS = int(os.getenv("SCORE_BLOCK_ROWS", 65536))
+
+
+@contextlib.contextmanager
+def exclusive_lock(path):
+    """
+    Holds an exclusive flock on the file at `path` (created if missing) and
+    yields it open for reading and writing.
+    """
+    with open(path, 'a+b') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield lock_file
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_generation(path):
+    """
+    Returns the write counter kept in a lock file (0 if there is none yet).
+    """
+    try:
+        with open(path, 'rb') as file:
+            return int(file.read() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_generation(lock_file, generation):
+    """
+    Replaces the write counter in a lock file held through exclusive_lock.
+    """
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(str(generation).encode('ascii'))
+    lock_file.flush()
+
+
+def note_of(entry_id):
+    """
+    Returns the note an entry belongs to (entries without a chunk hash are whole notes).
+    """
+    return entry_id.rsplit(CHUNK_SEPARATOR, 1)[0] if CHUNK_SEPARATOR in entry_id else entry_id
+
+
+def normalize_rows(vectors):
+    """
+    Scales each row of `vectors` to unit length (zero rows are left as they are).
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k_rows(matrix, query_vector, k, live=None, block_rows=SCORE_BLOCK_ROWS):
+    """
+    Finds the k rows of `matrix` with the highest dot product against `query_vector`.
+
+    The matrix is scanned in blocks of `block_rows`, so only one block plus the
+    running top-k is held in memory at a time; this also works on a memmap larger
+    than RAM. Each block is reduced with argpartition before being merged.
+
+    Args:
+        matrix (array): (rows, dim) matrix, typically a memmap.
+        query_vector (array): (dim,) query.
+        k (int): Number of rows to return.
+        live (array): Optional boolean mask; rows where it is False are skipped.
+        block_rows (int): Rows scored per matrix-vector product.
+
+    Returns:
+        tuple: (rows, scores) arrays sorted by descending score.
+    """
+    best_rows = np.empty(0, dtype=np.int64)
+    best_scores = np.empty(0, dtype=np.float32)
+    if k <= 0:
+        return best_rows, best_scores
+    count('rows_scored', matrix.shape[0])
+
+    for start in range(0, matrix.shape[0], block_rows):
+        block = np.asarray(matrix[start:start + block_rows])
+        scores = block @ query_vector
+        rows = np.arange(start, start + block.shape[0])
+        if live is not None:
+            keep = live[start:start + block.shape[0]]
+            scores = scores[keep]
+            rows = rows[keep]
+
+        # Merge this block's scores with the running top-k and cut back to k
+        scores = np.concatenate([best_scores, scores])
+        rows = np.concatenate([best_rows, rows])
+        if scores.shape[0] > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            scores = scores[top]
+            rows = rows[top]
+        best_scores, best_rows = scores, rows
+
+    order = np.argsort(-best_scores, kind='stable')
+    return best_rows[order], best_scores[order]
+
+
+def top_k_rows_many(matrix, query_vectors, k, live=None, block_rows=SCORE_BLOCK_ROWS):
+    """
+    Runs top_k_rows for several queries in one pass over `matrix`.
+
+    Each block is scored against every query with a single matrix product, so
+    the matrix is read once per batch instead of once per query.
+
+    Args:
+        query_vectors (array): (queries, dim) queries.
+
+    Returns:
+        list: One (rows, scores) pair per query, sorted by descending score.
+    """
+    query_vectors = np.asarray(query_vectors, dtype=np.float32)
+    best = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in range(query_vectors.shape[0])]
+    if k <= 0:
+        return best
+    count('rows_scored', matrix.shape[0] * query_vectors.shape[0])
+
+    for start in range(0, matrix.shape[0], block_rows):
+        block = np.asarray(matrix[start:start + block_rows])
+        block_scores = block @ query_vectors.T
+        rows = np.arange(start, start + block.shape[0])
+        if live is not None:
+            keep = live[start:start + block.shape[0]]
+            block_scores = block_scores[keep]
+            rows = rows[keep]
+
+        # Merge each query's scores for this block with its running top-k
+        for position, (best_rows, best_scores) in enumerate(best):
+            scores = np.concatenate([best_scores, block_scores[:, position]])
+            merged_rows = np.concatenate([best_rows, rows])
+            if scores.shape[0] > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                scores = scores[top]
+                merged_rows = merged_rows[top]
+            best[position] = (merged_rows, scores)
+
+    results = []
+    for best_rows, best_scores in best:
+        order = np.argsort(-best_scores, kind='stable')
+        results.append((best_rows[order], best_scores[order]))
+    return results
+
+
+class EmbeddingStore:
+    """
+    Keeps every embedding as one row of a single contiguous float32 matrix.
+
+    The matrix file is read through np.memmap, so loading the corpus costs the
+    same two file opens whether it holds five notes or fifty thousand. A JSON
+    manifest maps each row to its entry id, which is normally
+    "{note}#{chunk hash}" since long notes are embedded as several chunks.
+    Deleting or replacing an entry tombstones its old row (the manifest entry becomes None); the dead rows are
+    reclaimed by compact() once they make up COMPACT_RATIO of the file.
+
+    Rows are normalized to unit length when they are added, so a dot product
+    against a normalized query is the cosine similarity.
+
+    Several processes may write to one store (the CLI, watch, the daemon):
+    every mutation holds an exclusive flock on LOCK_FILE and first reloads the
+    manifest if another writer changed it, so no writer appends or rewrites
+    from a stale view. The lock file also holds a counter bumped by every
+    write, which tells a writer reliably whether its view is stale.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.matrix_path = os.path.join(directory, MATRIX_FILE)
+        self.manifest_path = os.path.join(directory, MANIFEST_FILE)
+        self.lock_path = os.path.join(directory, LOCK_FILE)
+        self._lock_file = None
+        self._thread_lock = threading.RLock()
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._load_manifest()
+        self.migrate_legacy()
+
+    # Hold the store's write lock for one mutation, picking up whatever other
+    # writers changed first; nested mutations (add_many -> compact) reuse it
+    @contextlib.contextmanager
+    def _write_lock(self):
+        with self._thread_lock:
+            if self._lock_file is not None:
+                yield
+                return
+            with exclusive_lock(self.lock_path) as lock_file:
+                self._lock_file = lock_file
+                try:
+                    self.refresh()
+                    yield
+                finally:
+                    self._lock_file = None
+
+    # Read the manifest from disk (or start an empty store)
+    def _load_manifest(self):
+        # Read the write counter before the manifest: a writer bumps it after
+        # replacing the manifest, so a counter read here is never newer than it
+        self._generation = read_generation(self.lock_path)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                manifest = json.load(file)
+            self.dim = manifest['dim']
+            self.ids = manifest['ids']
+            normalized = manifest.get('normalized', False)
+            self._manifest_mtime = os.path.getmtime(self.manifest_path)
+        else:
+            self.dim = None
+            self.ids = []
+            normalized = True
+            self._manifest_mtime = None
+
+        self.rows = {name: row for row, name in enumerate(self.ids) if name is not None}
+        self._matrix = None
+        self._live = None
+        self._chunks = None
+        self.version = getattr(self, 'version', 0) + 1
+
+        # Stores written before rows were normalized are rewritten once
+        if not normalized:
+            self._normalize_matrix()
+
+    # Write the manifest atomically so a crash never leaves it half written
+    # (called with the write lock held)
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'dim': self.dim, 'ids': self.ids, 'normalized': True}, file)
+        os.replace(tmp_path, self.manifest_path)
+        self._manifest_mtime = os.path.getmtime(self.manifest_path)
+
+        self._generation += 1
+        write_generation(self._lock_file, self._generation)
+        self._matrix = None
+        self._live = None
+        self._chunks = None
+        self.version += 1
+
+    def _normalize_matrix(self):
+        with self._write_lock():
+            if self.ids:
+                normalized = normalize_rows(self.matrix())
+                tmp_path = self.matrix_path + ".tmp"
+                with open(tmp_path, 'wb') as file:
+                    file.write(normalized.tobytes())
+                os.replace(tmp_path, self.matrix_path)
+            self._save_manifest()
+
+    def refresh(self):
+        """
+        Reloads the manifest if another process has changed it since it was last read.
+        """
+        mtime = os.path.getmtime(self.manifest_path) if os.path.exists(self.manifest_path) else None
+        if mtime != self._manifest_mtime or read_generation(self.lock_path) != self._generation:
+            self._load_manifest()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, name):
+        return name in self.rows
+
+    def names(self):
+        """
+        Returns the ids of all live entries.
+        """
+        return list(self.rows)
+
+    def note_names(self):
+        """
+        Returns the names of all notes that have at least one stored chunk.
+        """
+        return list(self._chunk_map())
+
+    def chunk_ids(self, note):
+        """
+        Returns the ids of the entries stored for `note`.
+        """
+        return list(self._chunk_map().get(note, ()))
+
+    # Group entry ids by note; rebuilt lazily after every change to the store
+    def _chunk_map(self):
+        if self._chunks is None:
+            chunks = {}
+            for entry_id in self.rows:
+                chunks.setdefault(note_of(entry_id), []).append(entry_id)
+            self._chunks = chunks
+        return self._chunks
+
+    def matrix(self):
+        """
+        Returns a read-only memmap over every row of the matrix, tombstones included.
+
+        Use `rows` (name -> row) or `ids` (row -> name, None for tombstones) to
+        interpret it.
+        """
+        if self._matrix is None:
+            if not self.ids:
+                return np.empty((0, self.dim or 0), dtype=np.float32)
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r',
+                                     shape=(len(self.ids), self.dim))
+        return self._matrix
+
+    def live_mask(self):
+        """
+        Returns a boolean array marking which rows of matrix() are not tombstones.
+        """
+        if self._live is None:
+            self._live = np.fromiter((name is not None for name in self.ids), dtype=bool, count=len(self.ids))
+        return self._live
+
+    def search(self, query_vector, k, block_rows=SCORE_BLOCK_ROWS):
+        """
+        Returns the k stored notes most similar to `query_vector`.
+
+        Args:
+            query_vector (array): Query embedding; it is normalized here.
+            k (int): Number of results.
+            block_rows (int): Rows scored per matrix-vector product.
+
+        Returns:
+            list: (name, cosine similarity) pairs, best first.
+        """
+        if not self.rows:
+            return []
+        query_vector = normalize_rows(np.asarray(query_vector).reshape(-1))
+        live = self.live_mask() if self.tombstones() else None
+        rows, scores = top_k_rows(self.matrix(), query_vector, k, live=live, block_rows=block_rows)
+        return [(self.ids[row], float(score)) for row, score in zip(rows, scores)]
+
+    def search_many(self, query_vectors, k, block_rows=SCORE_BLOCK_ROWS):
+        """
+        Runs search() for several queries with a single scan of the matrix.
+
+        Returns:
+            list: One list of (name, cosine similarity) pairs per query.
+        """
+        query_vectors = normalize_rows(np.asarray(query_vectors).reshape(len(query_vectors), -1))
+        if not self.rows:
+            return [[] for _ in range(query_vectors.shape[0])]
+        live = self.live_mask() if self.tombstones() else None
+        results = top_k_rows_many(self.matrix(), query_vectors, k, live=live, block_rows=block_rows)
+        return [[(self.ids[row], float(score)) for row, score in zip(rows, scores)] for rows, scores in results]
+
+    def search_among(self, query_vector, names):
+        """
+        Scores `query_vector` against the given entries only (ids that are not
+        stored are skipped).
+
+        Returns:
+            list: (name, cosine similarity) pairs, best first.
+        """
+        rows = np.sort(np.array([self.rows[name] for name in names if name in self.rows], dtype=np.int64))
+        if rows.size == 0:
+            return []
+        query_vector = normalize_rows(np.asarray(query_vector).reshape(-1))
+        positions, scores = top_k_rows(self.matrix()[rows], query_vector, rows.size)
+        return [(self.ids[rows[position]], float(score)) for position, score in zip(positions, scores)]
+
+    def get(self, name):
+        """
+        Returns a copy of the embedding stored for `name`, or None.
+        """
+        row = self.rows.get(name)
+        if row is None:
+            return None
+        return np.array(self.matrix()[row])
+
+    def add(self, name, vector):
+        """
+        Stores the embedding for `name`, replacing any previous one.
+        """
+        self.add_many([(name, vector)])
+
+    def add_many(self, items):
+        """
+        Appends several (name, vector) pairs with a single write and manifest update.
+
+        Vectors are normalized to unit length before they are written.
+
+        Args:
+            items (iterable): Pairs of note name and embedding (any shape with `dim` elements).
+        """
+        items = [(name, np.asarray(vector, dtype=np.float32).reshape(-1)) for name, vector in items]
+        if not items:
+            return
+
+        with self._write_lock():
+            names = []
+            vectors = []
+            for name, vector in items:
+                if self.dim is None:
+                    self.dim = int(vector.shape[0])
+                if vector.shape[0] != self.dim:
+                    raise ValueError(f"Embedding for '{name}' has {vector.shape[0]} dimensions, expected {self.dim}.")
+                names.append(name)
+                vectors.append(vector)
+
+            # Drop any bytes past the last row the manifest knows about (left over
+            # from an append that crashed before its manifest update), then append
+            expected_size = len(self.ids) * self.dim * 4
+            with open(self.matrix_path, 'ab') as file:
+                file.truncate(expected_size)
+                file.write(normalize_rows(np.stack(vectors)).tobytes())
+
+            for name in names:
+                old_row = self.rows.get(name)
+                if old_row is not None:
+                    self.ids[old_row] = None
+                self.ids.append(name)
+                self.rows[name] = len(self.ids) - 1
+
+            self._save_manifest()
+            self._maybe_compact()
+
+    def delete(self, name):
+        """
+        Tombstones the embedding for `name`.
+
+        Returns:
+            bool: True if an embedding was deleted, False if none was stored.
+        """
+        return self.delete_many([name]) > 0
+
+    def delete_many(self, names):
+        """
+        Tombstones several entries with a single manifest update.
+
+        Returns:
+            int: Number of entries that were actually deleted.
+        """
+        names = list(names)
+        if not names:
+            return 0
+
+        with self._write_lock():
+            deleted = 0
+            for name in names:
+                row = self.rows.pop(name, None)
+                if row is not None:
+                    self.ids[row] = None
+                    deleted += 1
+            if deleted:
+                self._save_manifest()
+                self._maybe_compact()
+        return deleted
+
+    def tombstones(self):
+        """
+        Returns the number of dead rows still occupying space in the matrix.
+        """
+        return len(self.ids) - len(self.rows)
+
+    def _maybe_compact(self):
+        if self.ids and self.tombstones() >= COMPACT_RATIO * len(self.ids):
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrites the matrix without its tombstoned rows.
+        """
+        with self._write_lock():
+            live_rows = [row for row, name in enumerate(self.ids) if name is not None]
+            tmp_path = self.matrix_path + ".tmp"
+            if live_rows:
+                live = np.asarray(self.matrix()[live_rows], dtype=np.float32)
+                with open(tmp_path, 'wb') as file:
+                    file.write(live.tobytes())
+            else:
+                open(tmp_path, 'wb').close()
+            os.replace(tmp_path, self.matrix_path)
+
+            self.ids = [self.ids[row] for row in live_rows]
+            self.rows = {name: row for row, name in enumerate(self.ids)}
+            self._save_manifest()
+
+    def migrate_legacy(self):
+        """
+        Moves embeddings from the old one-.npy-per-note layout into the store.
+
+        Every `{name}_embedding.npy` file in the directory is loaded, appended to
+        the matrix and then removed, so this only does work the first time it runs.
+        """
+        if not any(f.endswith(LEGACY_SUFFIX) for f in os.listdir(self.directory)):
+            return
+
+        # List the files again under the lock, in case another process migrated them first
+        with self._write_lock():
+            legacy_files = [f for f in os.listdir(self.directory) if f.endswith(LEGACY_SUFFIX)]
+            if not legacy_files:
+                return
+
+            items = []
+            for filename in sorted(legacy_files):
+                document_name = filename[:-len(LEGACY_SUFFIX)]
+                items.append((document_name, np.load(os.path.join(self.directory, filename))))
+            self.add_many(items)
+
+            for filename in legacy_files:
+                os.remove(os.path.join(self.directory, filename))
+        print(f"Migrated {len(legacy_files)} embeddings into '{self.matrix_path}'.")
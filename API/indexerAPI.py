@@ -1,17 +1,26 @@
 
 import os
-import torch
+import time
 import random
+import multiprocessing
+import hashlib
 import numpy as np
 from dotenv import load_dotenv
-from transformers import BertTokenizer, BertModel
-from sklearn.metrics.pairwise import cosine_similarity
 import sys
 sys.path.append(os.path.abspath('../API/inputProcesser'))
 
 
 # Now import the function
 from TenglishFormatter import process_user_input
+from embeddingStore import EmbeddingStore
+from annIndex import IVFIndex
+from compressedIndex import CompressedIndex, COMPRESSED_DIM, COMPRESSED_DTYPE
+from embeddingEngine import get_engine, compute_embedding, compare_inference_modes
+from noteManifest import NoteManifest, content_hash
+from sqliteStore import open_note_db
+from shardedStore import open_embedding_store
+from lexicalIndex import LexicalIndex, LEXICAL_INDEX, lexical_terms
+from metrics import span, count
 
 # Load environment variables from .env file
 load_dotenv()
@@ -31,19 +40,58 @@ if not EMBEDDINGS_DIRECTORY:
 if not os.path.exists(EMBEDDINGS_DIRECTORY):
     os.makedirs(EMBEDDINGS_DIRECTORY)
 
-# Set random seed for reproducibility
-random_seed = 42
-random.seed(random_seed)
-torch.manual_seed(random_seed)
-if torch.cuda.is_available():
-    torch.cuda.manual_seed(random_seed)
+# Bulk indexing settings: chunks per forward pass, tokens per chunk (including
+# [CLS]/[SEP]), and how many batches worth of notes are tokenized together
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", 16))
+INDEX_MAX_TOKENS = int(os.getenv("INDEX_MAX_TOKENS", 512))
+INDEX_BUCKET_BATCHES = int(os.getenv("INDEX_BUCKET_BATCHES", 8))
 
-# Initialize the multilingual tokenizer and model
-tokenizer = BertTokenizer.from_pretrained('bert-base-multilingual-cased')
-model = BertModel.from_pretrained('bert-base-multilingual-cased')
+# Tokens shared by consecutive chunks of a long note
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 64))
+
+# Worker processes used by bulk indexing (0 or 1 indexes in this process), how
+# they are started ("spawn" loads the model in every worker, "fork" shares the
+# parent's copy), and the torch threads each one may use (0 splits the CPUs)
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", 0))
+INDEX_START_METHOD = os.getenv("INDEX_START_METHOD", "spawn")
+INDEX_WORKER_THREADS = int(os.getenv("INDEX_WORKER_THREADS", 0))
+
+# With STORAGE_BACKEND=sqlite, notes and embeddings live in one SQLite
+# database that also serves as the store; otherwise notes are .txt files and
+# embeddings go to the consolidated embedding store (migrating any legacy .npy
+# files), split into SHARDS stores when that is above 1
+note_db = open_note_db(EMBEDDINGS_DIRECTORY)
+store = note_db if note_db is not None else open_embedding_store(EMBEDDINGS_DIRECTORY)
+
+# Content hash, mtime, size and model of every note file as of its last indexing
+manifest = NoteManifest(EMBEDDINGS_DIRECTORY)
+
+# Optional approximate nearest-neighbour index, kept in step with the store
+ANN_INDEX = os.getenv("ANN_INDEX", "").lower()
+ann_index = IVFIndex(store) if ANN_INDEX == "ivf" else None
+
+# Optional compressed first-pass tier, kept in step with the store
+COMPRESSED_INDEX = os.getenv("COMPRESSED_INDEX", "").lower() in ("1", "on", "true")
+compressed_index = CompressedIndex(store) if COMPRESSED_INDEX else None
+
+# Optional BM25 index over the processed text, kept in step with the notes
+lexical_index = LexicalIndex(EMBEDDINGS_DIRECTORY) if LEXICAL_INDEX else None
+
+if not isinstance(store, EmbeddingStore) and (ann_index is not None or compressed_index is not None):
+    raise ValueError("ANN_INDEX and COMPRESSED_INDEX are built over a single file store and need "
+                     "STORAGE_BACKEND=files without SHARDS")
+
+# Shared embedding engine; the tokenizer and model load on first use
+engine = get_engine()
 
 # Function to create a note
 def createNote(fileName):
+    if note_db is not None:
+        if not note_db.create_note(fileName):
+            raise FileExistsError(f"The note '{fileName}' already exists.")
+        print(f"Note '{fileName}' created in: {note_db.path}")
+        return
+
     # Combine the path and file name to create the full file path
     file_path = os.path.join(NOTES_DIRECTORY, f"{fileName}.txt")
 
@@ -59,25 +107,57 @@ def createNote(fileName):
 
 # Function to edit a note by adding text
 def editNote(fileName, inputText):
+    if note_db is not None:
+        return _edit_db_note(fileName, inputText)
+
     # Combine the path and file name to get the file path
     file_path = os.path.join(NOTES_DIRECTORY, f"{fileName}.txt")
 
     # Check if the file exists
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"The file '{fileName}.txt' does not exist.")
-    processed_text = process_user_input(inputText)
+    with span('transliteration'):
+        processed_text = process_user_input(inputText)
     # Overwrite the existing content with new text
     with open(file_path, 'w') as file:
         file.write(processed_text)  # Writes the input text to the file
 
     print(f"File '{fileName}.txt' edited with new content.")
 
-    # Delete the old embedding (if it exists) and re-index the note
-    delete_embedding(fileName)
+    # Re-index the note; only chunks whose text changed are re-embedded
     index(fileName)
 
+# Function to edit a note kept in the SQLite database: the changed chunks are
+# embedded first, then the new text and embeddings are written in one transaction
+def _edit_db_note(fileName, inputText):
+    if not note_db.has_note(fileName):
+        raise FileNotFoundError(f"The note '{fileName}' does not exist.")
+    with span('transliteration'):
+        processed_text = process_user_input(inputText)
+
+    chunks = chunk_text(processed_text)
+    items, stale, reused = embed_changed_chunks([(fileName, chunks)], {fileName: note_db.chunk_ids(fileName)})
+    count('notes_indexed')
+    count('chunks_embedded', len(items))
+    count('chunks_reused', reused)
+    with span('store_write'):
+        note_db.save_note(fileName, inputText, processed_text, items, stale)
+        if lexical_index is not None:
+            lexical_index.update_many([(fileName, lexical_terms(processed_text))])
+
+    print(f"Note '{fileName}' edited with new content ({len(items)} of {len(chunks)} chunks re-embedded).")
+
 # Function to delete a note and its embedding
 def deleteNote(fileName):
+    if note_db is not None:
+        # The note's chunks are deleted with it, in the same transaction
+        if not note_db.delete_note(fileName):
+            raise FileNotFoundError(f"The note '{fileName}' does not exist.")
+        if lexical_index is not None:
+            lexical_index.remove_many([fileName])
+        print(f"Note '{fileName}' and its embeddings deleted.")
+        return
+
     # Combine the path and file name to get the file path
     file_path = os.path.join(NOTES_DIRECTORY, f"{fileName}.txt")
 
@@ -92,63 +172,369 @@ def deleteNote(fileName):
     # Delete the embedding associated with this note
     delete_embedding(fileName)
 
-# Function to delete the embedding of a note
+# Function to delete the embeddings of a note
 def delete_embedding(fileName):
-    # Path to the embedding file
-    embedding_file_path = os.path.join(EMBEDDINGS_DIRECTORY, f"{fileName}_embedding.npy")
-
-    # Check if the embedding file exists
-    if os.path.exists(embedding_file_path):
-        # Delete the embedding file
-        os.remove(embedding_file_path)
+    # Tombstone every chunk of the note in the store (if it has any)
+    chunk_ids = store.chunk_ids(fileName)
+    if ann_index is not None:
+        ann_index.delete_many(chunk_ids)
+    if manifest.remove(fileName):
+        manifest.save()
+    if lexical_index is not None:
+        lexical_index.remove_many([fileName])
+    if store.delete_many(chunk_ids):
+        if compressed_index is not None:
+            compressed_index.update()
         print(f"Embedding for '{fileName}.txt' deleted.")
     else:
         print(f"No embedding found for '{fileName}.txt' to delete.")
 
-# Function to compute the embedding of text and return it
-def compute_embedding(text):
-    # Tokenize and encode the text
-    encoding = tokenizer.batch_encode_plus(
-        [text],
-        padding=True,
-        truncation=True,
-        return_tensors='pt',
-        add_special_tokens=True
-    )
-
-    input_ids = encoding['input_ids']
-    attention_mask = encoding['attention_mask']
-
-    # Generate embeddings
-    with torch.no_grad():
-        outputs = model(input_ids, attention_mask=attention_mask)
-        embeddings = outputs.last_hidden_state.mean(dim=1)  # Average pooling along sequence length
-
+# Function to split a note into overlapping token windows keyed by content hash
+def chunk_text(text, max_tokens=INDEX_MAX_TOKENS, overlap=CHUNK_OVERLAP):
+    with span('tokenization'):
+        token_ids = engine.tokenizer(text, add_special_tokens=False)['input_ids']
+    return chunk_token_ids(token_ids, max_tokens, overlap)
+
+# Function to cut token ids into windows of max_tokens (with [CLS]/[SEP] added)
+def chunk_token_ids(token_ids, max_tokens=INDEX_MAX_TOKENS, overlap=CHUNK_OVERLAP):
+    window = max_tokens - 2
+    stride = max(1, window - overlap)
+
+    chunks = {}
+    start = 0
+    while True:
+        window_ids = token_ids[start:start + window]
+        # The model id is part of the hash so switching models re-embeds every chunk
+        digest = hashlib.sha1(engine.fingerprint().encode('utf-8') +
+                              np.asarray(window_ids, dtype=np.int32).tobytes()).hexdigest()[:16]
+        chunks[digest] = engine.tokenizer.build_inputs_with_special_tokens(window_ids)
+        if start + window >= len(token_ids):
+            break
+        start += stride
+
+    # Repeated windows in the same note share one entry
+    return list(chunks.items())
+
+# Function to embed many chunks, batching chunks of similar length together
+def embed_chunks(token_id_lists, batch_size=INDEX_BATCH_SIZE):
+    embeddings = [None] * len(token_id_lists)
+    order = sorted(range(len(token_id_lists)), key=lambda position: len(token_id_lists[position]))
+    for batch_start in range(0, len(order), batch_size):
+        batch = order[batch_start:batch_start + batch_size]
+        batch_embeddings = engine.embed_token_batch([token_id_lists[position] for position in batch])
+        for position, embedding in zip(batch, batch_embeddings):
+            embeddings[position] = embedding
     return embeddings
 
+# Function to bring the stored chunks of several notes in line with their text
+def index_chunks(notes, batch_size=INDEX_BATCH_SIZE):
+    existing = {fileName: store.chunk_ids(fileName) for fileName, _ in notes}
+    items, stale, reused = embed_changed_chunks(notes, existing, batch_size)
+    write_chunks(items, stale, len(notes), reused)
+    return len(items)
+
+# Function to embed the chunks of several notes that are not stored yet; it
+# only reads the store through `existing` (note -> stored chunk ids), so it can
+# run in a worker process
+def embed_changed_chunks(notes, existing, batch_size=INDEX_BATCH_SIZE):
+    pending = []
+    stale = []
+    for fileName, chunks in notes:
+        wanted = {f"{fileName}#{digest}": token_ids for digest, token_ids in chunks}
+        stored = set(existing.get(fileName, ()))
+        pending.extend((chunk_id, token_ids) for chunk_id, token_ids in wanted.items() if chunk_id not in stored)
+        stale.extend(stored - wanted.keys())
+
+    # Only chunks not already in the store go through the model
+    with span('embedding'):
+        embeddings = embed_chunks([token_ids for _, token_ids in pending], batch_size)
+    items = [(chunk_id, embedding) for (chunk_id, _), embedding in zip(pending, embeddings)]
+    reused = sum(len(chunks) for _, chunks in notes) - len(items)
+    return items, stale, reused
+
+# Function to write newly embedded chunks and drop stale ones (the only place
+# bulk indexing writes to the store)
+def write_chunks(items, stale, notes_indexed, reused):
+    count('notes_indexed', notes_indexed)
+    count('chunks_embedded', len(items))
+    count('chunks_reused', reused)
+
+    # Add the new chunks before dropping the old ones so a crash never leaves a
+    # note without embeddings (the SQLite store does both in one transaction)
+    with span('store_write'):
+        if note_db is not None:
+            note_db.save_chunks(items, stale)
+            return
+        store.add_many(items)
+        store.delete_many(stale)
+        if ann_index is not None:
+            ann_index.add_many(items)
+            ann_index.delete_many(stale)
+        if compressed_index is not None:
+            compressed_index.update()
+
+# Function to read a note along with its content hash and file status (None
+# for notes kept in the SQLite database)
+def read_note(fileName):
+    if note_db is not None:
+        with span('read_notes'):
+            file_content = note_db.note_text(fileName)
+        if file_content is None:
+            raise FileNotFoundError(f"The note '{fileName}' does not exist.")
+        return file_content, content_hash(file_content.encode('utf-8')), None
+
+    file_path = os.path.join(NOTES_DIRECTORY, f"{fileName}.txt")
+    with span('read_notes'), open(file_path, 'r', encoding='utf-8') as file:
+        file_content = file.read()
+    return file_content, content_hash(file_content.encode('utf-8')), os.stat(file_path)
+
 # Function to index the file data and store its embeddings
 def index(fileName):
     # Combine the path and file name to create the full file path
     file_path = os.path.join(NOTES_DIRECTORY, f"{fileName}.txt")
 
     # Check if the file exists
-    if not os.path.exists(file_path):
+    if note_db is None and not os.path.exists(file_path):
         raise FileNotFoundError(f"The file '{fileName}.txt' does not exist.")
 
     # Read the file content
-    with open(file_path, 'r', encoding='utf-8') as file:
-        file_content = file.read()
-
-    # Compute the embedding of the file content
-    embedding = compute_embedding(file_content).numpy()
-
-    # Path to save the embedding
-    embedding_file_path = os.path.join(EMBEDDINGS_DIRECTORY, f"{fileName}_embedding.npy")
-
-    # Save the embedding as a .npy file
-    np.save(embedding_file_path, embedding)
-    
-    print(f"Embedding for '{fileName}.txt' saved at: {embedding_file_path}")
+    file_content, digest, stat = read_note(fileName)
+
+    # Split the content into chunks and embed the ones that changed
+    chunks = chunk_text(file_content)
+    embedded = index_chunks([(fileName, chunks)])
+    if lexical_index is not None:
+        lexical_index.update_many([(fileName, lexical_terms(file_content))])
+    if note_db is None:
+        manifest.record(fileName, digest, stat, engine.fingerprint())
+        manifest.save()
+
+    location = note_db.path if note_db is not None else store.matrix_path
+    print(f"Embedding for '{fileName}.txt' saved at: {location} "
+          f"({embedded} of {len(chunks)} chunks re-embedded)")
+
+# Function to read, tokenize, chunk and embed one pool of notes; returns the
+# manifest records (with each note's BM25 terms when the lexical index is on),
+# new chunk embeddings, stale chunk ids and reused chunk count
+def embed_note_pool(pool, existing, batch_size=INDEX_BATCH_SIZE, max_tokens=INDEX_MAX_TOKENS):
+    notes = [read_note(fileName) for fileName in pool]
+
+    # Tokenize the whole pool at once; embed_chunks then sorts the chunks by
+    # length so each batch is padded to a similar length
+    with span('tokenization'):
+        token_ids = engine.tokenizer([file_content for file_content, _, _ in notes], add_special_tokens=False)['input_ids']
+    chunked = [(fileName, chunk_token_ids(ids, max_tokens)) for fileName, ids in zip(pool, token_ids)]
+    items, stale, reused = embed_changed_chunks(chunked, existing, batch_size)
+    records = [(fileName, digest, stat, lexical_terms(file_content) if lexical_index is not None else None)
+               for fileName, (file_content, digest, stat) in zip(pool, notes)]
+    return records, items, stale, reused
+
+# Function to write the results of embed_note_pool: the chunks, the notes' BM25
+# terms and their manifest records (saved by the caller)
+def write_note_pool(records, items, stale, reused, model_id):
+    write_chunks(items, stale, len(records), reused)
+    if lexical_index is not None:
+        lexical_index.update_many((fileName, terms) for fileName, _, _, terms in records)
+    if note_db is None:
+        for fileName, digest, stat, _ in records:
+            manifest.record(fileName, digest, stat, model_id)
+
+# Set up an indexing worker: cap its torch threads so the workers together do
+# not oversubscribe the CPUs
+def _init_index_worker(num_threads):
+    import torch
+
+    engine.num_threads = num_threads
+    torch.set_num_threads(num_threads)
+
+def _embed_note_pool_task(task):
+    return embed_note_pool(*task)
+
+# Function to index a list of notes in batches, streaming them one pool at a
+# time; with several workers the pools are embedded in parallel and this
+# process writes the results
+def index_notes(note_names, batch_size=INDEX_BATCH_SIZE, max_tokens=INDEX_MAX_TOKENS, bucket_batches=INDEX_BUCKET_BATCHES,
+                workers=INDEX_WORKERS):
+    total = len(note_names)
+    pool_size = batch_size * bucket_batches
+    model_id = engine.fingerprint()
+    start_time = time.perf_counter()
+
+    # Each note is in exactly one pool and only this process writes, so the
+    # chunk ids stored for a pool's notes cannot change before its results land
+    tasks = [(pool, {fileName: store.chunk_ids(fileName) for fileName in pool}, batch_size, max_tokens)
+             for pool in (note_names[pool_start:pool_start + pool_size] for pool_start in range(0, total, pool_size))]
+
+    worker_pool = None
+    if workers > 1 and len(tasks) > 1:
+        context = multiprocessing.get_context(INDEX_START_METHOD)
+        if INDEX_START_METHOD == "fork":
+            # Load the model before forking so the workers share its pages
+            engine.model
+        threads = INDEX_WORKER_THREADS or max(1, (os.cpu_count() or 1) // workers)
+        worker_pool = context.Pool(workers, initializer=_init_index_worker, initargs=(threads,))
+        results = worker_pool.imap_unordered(_embed_note_pool_task, tasks)
+        print(f"Indexing with {workers} workers ({threads} torch threads each)")
+    else:
+        results = map(_embed_note_pool_task, tasks)
+
+    indexed = 0
+    try:
+        for records, items, stale, reused in results:
+            write_note_pool(records, items, stale, reused, model_id)
+            indexed += len(records)
+            elapsed = time.perf_counter() - start_time
+            print(f"Indexed {indexed}/{total} notes ({indexed / elapsed:.1f} notes/sec)")
+    finally:
+        if worker_pool is not None:
+            worker_pool.terminate()
+            worker_pool.join()
+
+    elapsed = time.perf_counter() - start_time
+    if total and note_db is None:
+        manifest.save()
+        print(f"Indexed {total} notes in {elapsed:.1f}s ({total / elapsed:.1f} notes/sec)")
+    return total
+
+# Function to list every note, from NOTES_DIRECTORY or the SQLite database
+def list_notes():
+    if note_db is not None:
+        return note_db.all_notes()
+    return sorted(name[:-len('.txt')] for name in os.listdir(NOTES_DIRECTORY) if name.endswith('.txt'))
+
+# Function to re-index every note in batches
+def index_all(batch_size=INDEX_BATCH_SIZE, max_tokens=INDEX_MAX_TOKENS, bucket_batches=INDEX_BUCKET_BATCHES,
+              workers=INDEX_WORKERS):
+    return index_notes(list_notes(), batch_size, max_tokens, bucket_batches, workers)
+
+# Function to copy the .txt notes of NOTES_DIRECTORY into the SQLite database
+# and embed them there
+def import_note_files(batch_size=INDEX_BATCH_SIZE, workers=INDEX_WORKERS):
+    if note_db is None:
+        raise ValueError("STORAGE_BACKEND is not set to sqlite in the .env file")
+    imported = note_db.import_files(NOTES_DIRECTORY)
+    print(f"Imported {imported} notes from {NOTES_DIRECTORY} into {note_db.path}")
+    return index_all(batch_size=batch_size, workers=workers)
+
+# Function to tell whether a note on disk still matches its embeddings: notes
+# whose mtime, size and model match the manifest are skipped without being read,
+# and the rest are hashed to see if their content changed. Returns "fresh",
+# "touched" (same content, new mtime; the manifest entry is updated) or "stale"
+def note_status(fileName, stat, indexed, model_id):
+    if indexed and manifest.is_fresh(fileName, stat, model_id):
+        return "fresh"
+
+    _, digest, stat = read_note(fileName)
+    known = manifest.get(fileName)
+    if indexed and known is not None and known['hash'] == digest and known['model'] == model_id:
+        manifest.record(fileName, digest, stat, model_id)
+        return "touched"
+    return "stale"
+
+# Function to drop the embeddings, manifest entries and BM25 postings of notes
+# that no longer exist
+def drop_notes(fileNames):
+    vanished_chunks = [chunk_id for fileName in fileNames for chunk_id in store.chunk_ids(fileName)]
+    if ann_index is not None:
+        ann_index.delete_many(vanished_chunks)
+    store.delete_many(vanished_chunks)
+    if compressed_index is not None:
+        compressed_index.update()
+    for fileName in fileNames:
+        manifest.remove(fileName)
+    if lexical_index is not None:
+        lexical_index.remove_many(fileNames)
+
+# Function to bring the index in line with NOTES_DIRECTORY: embed new and changed
+# notes and drop the embeddings of notes that no longer exist
+def sync(batch_size=INDEX_BATCH_SIZE, max_tokens=INDEX_MAX_TOKENS, bucket_batches=INDEX_BUCKET_BATCHES,
+         workers=INDEX_WORKERS):
+    if note_db is not None:
+        raise ValueError("sync compares NOTES_DIRECTORY with the index; with STORAGE_BACKEND=sqlite "
+                         "every edit is already indexed (use reindex to re-embed everything)")
+    model_id = engine.fingerprint()
+    indexed_notes = set(store.note_names())
+    on_disk = set()
+    stale = []
+    touched = 0
+
+    # Step 1: Find the notes whose content or model changed
+    with os.scandir(NOTES_DIRECTORY) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.txt') or not entry.is_file():
+                continue
+            fileName = entry.name[:-len('.txt')]
+            on_disk.add(fileName)
+            status = note_status(fileName, entry.stat(), fileName in indexed_notes, model_id)
+            if status == "touched":
+                touched += 1
+            elif status == "stale":
+                stale.append(fileName)
+
+    # Step 2: Drop embeddings and manifest entries of notes that vanished
+    vanished = (indexed_notes | set(manifest.names())) - on_disk
+    drop_notes(vanished)
+
+    # Step 3: Embed the new and changed notes
+    if stale:
+        index_notes(sorted(stale), batch_size, max_tokens, bucket_batches, workers)
+    elif touched or vanished:
+        manifest.save()
+
+    print(f"Sync: {len(stale)} notes re-indexed, {len(vanished)} removed, "
+          f"{len(on_disk) - len(stale)} unchanged ({touched} with a new mtime only)")
+    return {'indexed': len(stale), 'removed': len(vanished), 'unchanged': len(on_disk) - len(stale)}
+
+# Function to sort the given notes of NOTES_DIRECTORY (used by watch, which
+# knows which files changed) into the ones to re-embed and the deleted ones to
+# drop; returns (stale, vanished, touched count)
+def plan_sync(fileNames):
+    if note_db is not None:
+        raise ValueError("STORAGE_BACKEND=sqlite keeps notes in the database, not in NOTES_DIRECTORY")
+    model_id = engine.fingerprint()
+    stale = []
+    vanished = []
+    touched = 0
+    for fileName in fileNames:
+        try:
+            stat = os.stat(os.path.join(NOTES_DIRECTORY, f"{fileName}.txt"))
+        except FileNotFoundError:
+            if store.chunk_ids(fileName) or manifest.get(fileName) is not None:
+                vanished.append(fileName)
+            continue
+        status = note_status(fileName, stat, bool(store.chunk_ids(fileName)), model_id)
+        if status == "touched":
+            touched += 1
+        elif status == "stale":
+            stale.append(fileName)
+    return stale, vanished, touched
+
+# Function to (re)build the ANN index over everything in the embedding store
+def build_ann_index(nlist=0):
+    if ann_index is None:
+        raise ValueError("ANN_INDEX is not enabled in the .env file")
+    ann_index.build(nlist=nlist)
+
+# Function to (re)build the BM25 index from the text of every note
+def build_lexical_index():
+    if lexical_index is None:
+        raise ValueError("LEXICAL_INDEX is not enabled in the .env file")
+    lexical_index.build((fileName, lexical_terms(read_note(fileName)[0])) for fileName in list_notes())
+
+# Function to train the compressed tier's PCA and encode every stored embedding
+def build_compressed_index(dim=0, dtype=""):
+    if compressed_index is None:
+        raise ValueError("COMPRESSED_INDEX is not enabled in the .env file")
+    compressed_index.build(dim=dim or COMPRESSED_DIM, dtype=dtype or COMPRESSED_DTYPE)
+
+# Function to compare the quantized/traced inference modes with fp32 on a sample of notes
+def inference_check(sample_size=64, modes=("int8", "traced", "int8-traced"), threads=(), batch_size=INDEX_BATCH_SIZE):
+    note_names = list_notes()
+    if not note_names:
+        raise ValueError("There are no notes to sample")
+    sample = random.Random(0).sample(note_names, min(sample_size, len(note_names)))
+    texts = [read_note(fileName)[0] for fileName in sample]
+    return compare_inference_modes(texts, modes=modes, threads=threads, batch_size=batch_size, max_tokens=INDEX_MAX_TOKENS)
 
 # Example usage:
 # createNote("myNote")
@@ -1,13 +1,69 @@
 import logging
 import os
-import pandas as pd
 
 # Ensure the functions from stage1.py are available
 from stage1 import (
-    label_words_in_sentences,
-    transliterate_telugu_words,
-    replace_transliterated_words
+    label_sentences,
+    transliterate_words,
+    replace_tokens,
+    english_vocabulary_fingerprint
 )
+from translit_cache import tables_fingerprint
+from metrics import span, count
+
+# Set TRANSLIT_DEBUG_DIR to dump every intermediate stage as CSV into that directory
+TRANSLIT_DEBUG_DIR = os.getenv("TRANSLIT_DEBUG_DIR")
+
+# Version of the tokenizing, labeling and rebuilding rules below; bump it when
+# they change so results cached from the old rules are dropped
+PIPELINE_VERSION = 1
+
+def pipeline_fingerprint():
+    """
+    Returns a fingerprint of everything the pipeline's output depends on: its
+    version, the transliteration tables and the English vocabulary.
+    """
+    return f"v{PIPELINE_VERSION}|{tables_fingerprint()}|{english_vocabulary_fingerprint()}"
+
+def process_user_inputs(user_sentences, debug_dir=TRANSLIT_DEBUG_DIR):
+    """
+    Processes several sentences through the transliteration pipeline in memory.
+
+    Each sentence is tokenized once; the tokens are labeled, the Telugu words
+    transliterated, and the sentence rebuilt from the same token lists.
+
+    Args:
+        user_sentences (list): Input sentences from the user.
+        debug_dir (str): Optional directory to dump the intermediate CSV files into.
+
+    Returns:
+        list: The processed sentences with Telugu words transliterated into Telugu script.
+    """
+    user_sentences = list(user_sentences)
+
+    # Step 1: Tokenize and label every sentence
+    with span('tokenize_and_label'):
+        labeled_sentences = label_sentences(user_sentences)
+
+    # Step 2: Transliterate the words labeled as Telugu
+    telugu_words = [token for labeled in labeled_sentences for token, label in labeled if label == 'tel']
+    with span('transliterate_words'):
+        transliterations = transliterate_words(telugu_words)
+
+    # Step 3: Replace the Latin-scripted Telugu words in each sentence (keys are
+    # lowercased so matching is case-insensitive)
+    with span('replace_tokens'):
+        mapping = {latin.lower(): telugu for latin, telugu in transliterations}
+        final_sentences = [replace_tokens([token for token, _ in labeled], mapping) for labeled in labeled_sentences]
+    count('sentences_processed', len(user_sentences))
+    count('telugu_words', len(telugu_words))
+
+    if debug_dir:
+        with span('debug_csv_writes'):
+            dump_debug_csvs(debug_dir, user_sentences, labeled_sentences, transliterations, final_sentences)
+
+    logging.info(f"Processed {len(final_sentences)} sentences.")
+    return final_sentences
 
 def process_user_input(user_sentence):
     """
@@ -19,49 +75,33 @@ def process_user_input(user_sentence):
     Returns:
         str: The processed sentence with Telugu words transliterated into Telugu script.
     """
-    # Define file paths
-    base_dir = os.getcwd()  # Current working directory
-    input_csv = os.path.join(base_dir, 'input.csv')  # Original input CSV with sentences
-    labeled_output_csv = os.path.join(base_dir, 'labeled_output.csv')  # Full labeled words
-    telugu_words_csv = os.path.join(base_dir, 'telugu_words.csv')  # Only Telugu words
-    conversion_input_csv = os.path.join(base_dir, 'telugu_conversion_input.csv')  # Input for transliteration
-    transliterated_output_csv = os.path.join(base_dir, 'telugu_terms_transliterated.csv')  # Transliteration output
-    final_output_csv = os.path.join(base_dir, 'final_output.csv')  # Final sentences with Telugu script
-
-    # Step 1: Write the user input to the input.csv file
-    input_data = pd.DataFrame({'sentence': [user_sentence]})
-    input_data.to_csv(input_csv, index=False)
-    logging.info("User input written to '{input_csv}'.")
-
-    # Step 2: Call the language detection and labeling function
-    label_words_in_sentences(
-        input_csv=input_csv,
-        output_labeled_csv=labeled_output_csv,
-        output_telugu_csv=telugu_words_csv,
-        conversion_input_csv=conversion_input_csv
-    )
-
-    # Step 3: Call the transliteration function
-    transliterate_telugu_words(
-        conversion_input_csv=conversion_input_csv,
-        transliterated_output_csv=transliterated_output_csv
-    )
-
-    # Step 4: Call the replacement function to update the original sentence
-    replace_transliterated_words(
-        original_input_csv=input_csv,
-        transliteration_csv=transliterated_output_csv,
-        final_output_csv=final_output_csv
-    )
-
-    # Step 5: Read the final output and return the modified sentence
-    df_final_output = pd.read_csv(final_output_csv)
-    final_sentence = df_final_output['sentence'].iloc[0]
-    
+    final_sentence = process_user_inputs([user_sentence])[0]
     logging.info(f"Final sentence: {final_sentence}")
     return final_sentence
 
+def dump_debug_csvs(debug_dir, sentences, labeled_sentences, transliterations, final_sentences):
+    """
+    Writes the intermediate stages of a pipeline run as the CSV files stage1.main() uses.
+    """
+    import pandas as pd
+
+    os.makedirs(debug_dir, exist_ok=True)
+    labeled = [pair for sentence_labels in labeled_sentences for pair in sentence_labels]
+    df_labeled = pd.DataFrame(labeled, columns=['word', 'label'])
+    df_telugu = df_labeled[df_labeled['label'] == 'tel']
+
+    pd.DataFrame({'sentence': sentences}).to_csv(os.path.join(debug_dir, 'input.csv'), index=False)
+    df_labeled.to_csv(os.path.join(debug_dir, 'labeled_output.csv'), index=False)
+    df_telugu.to_csv(os.path.join(debug_dir, 'telugu_words.csv'), index=False)
+    pd.DataFrame({'Latin': df_telugu['word'], 'Telugu': [''] * len(df_telugu)}).to_csv(
+        os.path.join(debug_dir, 'telugu_conversion_input.csv'), index=False)
+    pd.DataFrame(transliterations, columns=['Latin', 'Telugu']).to_csv(
+        os.path.join(debug_dir, 'telugu_terms_transliterated.csv'), index=False)
+    pd.DataFrame({'sentence': final_sentences}).to_csv(os.path.join(debug_dir, 'final_output.csv'), index=False)
+    logging.info(f"Debug CSVs written to '{debug_dir}'.")
+
 # Example usage
-user_sentence = "nenu oka katha chadivanu"  # Example Latin-scripted Telugu sentence
-output_sentence = process_user_input(user_sentence)
-logging.info("Processed Sentence: {output_sentence}")
+if __name__ == "__main__":
+    user_sentence = "nenu oka katha chadivanu"  # Example Latin-scripted Telugu sentence
+    output_sentence = process_user_input(user_sentence)
+    print(f"Processed Sentence: {output_sentence}")
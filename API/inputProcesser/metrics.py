@@ -0,0 +1,132 @@
+# metrics.py
+
+import os
+import json
+import time
+import threading
+import contextlib
+import contextvars
+
+# Optional JSON-lines file that receives one record per completed operation
+# (unset or empty disables it)
+METRICS_LOG = os.getenv("METRICS_LOG", "")
+
+_lock = threading.Lock()
+_span_totals = {}
+_counter_totals = {}
+_current = contextvars.ContextVar('metrics_profile', default=None)
+
+
+class Profile:
+    """
+    Per-stage timings and counters collected during one operation (a find, an
+    index, ...). Spans may nest, so their times can add up to more than the total.
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.spans = {}
+        self.counters = {}
+        self.total = 0.0
+        self._start = time.perf_counter()
+
+    def add_span(self, name, seconds):
+        calls, total = self.spans.get(name, (0, 0.0))
+        self.spans[name] = (calls + 1, total + seconds)
+
+    def add_count(self, name, amount):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def finish(self):
+        self.total = time.perf_counter() - self._start
+
+    def report(self):
+        """
+        Returns the profile as a JSON-serialisable dict.
+        """
+        return {
+            'operation': self.operation,
+            'total_ms': self.total * 1000,
+            'spans': {name: {'calls': calls, 'ms': seconds * 1000} for name, (calls, seconds) in self.spans.items()},
+            'counters': dict(self.counters),
+        }
+
+
+@contextlib.contextmanager
+def span(name):
+    """
+    Times the enclosed block as stage `name`, both in the running operation's
+    profile (if any) and in the process-wide totals.
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start_time
+        profile = _current.get()
+        if profile is not None:
+            profile.add_span(name, elapsed)
+        with _lock:
+            calls, total = _span_totals.get(name, (0, 0.0))
+            _span_totals[name] = (calls + 1, total + elapsed)
+
+
+def count(name, amount=1):
+    """
+    Adds `amount` to counter `name`.
+    """
+    profile = _current.get()
+    if profile is not None:
+        profile.add_count(name, amount)
+    with _lock:
+        _counter_totals[name] = _counter_totals.get(name, 0) + amount
+
+
+@contextlib.contextmanager
+def operation(name, log_path=None):
+    """
+    Collects the spans and counters recorded inside the block into a Profile.
+
+    Nested operations are folded into the outermost one. When the outermost
+    operation ends its profile is appended to METRICS_LOG (or `log_path`).
+
+    Yields:
+        Profile: The profile being filled in.
+    """
+    outer = _current.get()
+    if outer is not None:
+        yield outer
+        return
+
+    profile = Profile(name)
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+        profile.finish()
+        log_path = log_path or METRICS_LOG
+        if log_path:
+            write_record(log_path, profile)
+
+
+def write_record(log_path, profile):
+    """
+    Appends a profile to a JSON-lines file.
+    """
+    record = dict(profile.report(), timestamp=time.time(), pid=os.getpid())
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _lock:
+        with open(log_path, 'a', encoding='utf-8') as file:
+            file.write(line)
+
+
+def totals():
+    """
+    Returns the process-wide span timings and counters since startup.
+    """
+    with _lock:
+        return {
+            'spans': {name: {'calls': calls, 'ms': seconds * 1000} for name, (calls, seconds) in _span_totals.items()},
+            'counters': dict(_counter_totals),
+        }
@@ -1,15 +1,137 @@
-import nltk
-from nltk.corpus import words
-from nltk.tokenize import word_tokenize
 import string
-import pandas as pd
 import os
+import hashlib
+import re
 import csv
 import logging
 
-# Ensure NLTK data is downloaded
-nltk.download('punkt')
-nltk.download('words')
+# nltk and pandas are imported inside the functions that use them, so importing
+# this module (and every CLI command that does) stays fast
+
+PUNCTUATION = set(string.punctuation)
+
+# Tokens written entirely in Telugu script (zero-width joiners included) and
+# numerals are labeled directly instead of going through the English lookup
+TELUGU_SCRIPT = re.compile('[\u0C00-\u0C7F\u200C\u200D]+')
+NUMERAL = re.compile(r'\d[\d.,]*')
+
+# Sorted, lowercased English vocabulary (one word per line) built once from the
+# NLTK words corpus
+ENGLISH_VOCAB_PATH = os.getenv(
+    "ENGLISH_VOCAB_PATH",
+    os.path.join(os.path.expanduser('~'), '.cache', 'CSNTR', 'english_vocab.txt')
+)
+
+_english_vocab = None
+
+def ensure_nltk_data(resource, package):
+    """
+    Downloads an NLTK package only if its resource is not installed yet.
+    """
+    import nltk
+
+    try:
+        nltk.data.find(resource)
+    except LookupError:
+        nltk.download(package)
+
+def build_english_vocabulary(path=ENGLISH_VOCAB_PATH):
+    """
+    Writes the lowercased NLTK English word list to path as a sorted, de-duplicated text file.
+    """
+    from nltk.corpus import words
+
+    ensure_nltk_data('corpora/words', 'words')
+    vocab = sorted(set(w.lower() for w in words.words()))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write('\n'.join(vocab))
+    os.replace(tmp_path, path)
+    logging.info(f"English vocabulary of {len(vocab)} words saved to '{path}'.")
+
+def english_vocabulary():
+    """
+    Returns the lowercased English vocabulary, loading it on first use.
+
+    The vocabulary is read from the prebuilt file at ENGLISH_VOCAB_PATH (built
+    from NLTK the first time), which is much faster than walking the NLTK
+    corpus, and then kept for the life of the process.
+    """
+    global _english_vocab
+    if _english_vocab is None:
+        if not os.path.exists(ENGLISH_VOCAB_PATH):
+            build_english_vocabulary()
+        with open(ENGLISH_VOCAB_PATH, 'r', encoding='utf-8') as file:
+            _english_vocab = frozenset(file.read().split('\n'))
+    return _english_vocab
+
+def english_vocabulary_fingerprint(path=ENGLISH_VOCAB_PATH):
+    """
+    Returns a hash of the English vocabulary file (built first if missing).
+
+    Which words are labeled English depends on the vocabulary, so anything
+    cached from the pipeline's output is only valid for the file it used.
+    """
+    if not os.path.exists(path):
+        build_english_vocabulary(path)
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def label_tokens(tokens, english_vocab, punctuation=PUNCTUATION):
+    """
+    Labels already tokenized words as English, Telugu, punctuation or other.
+
+    Words already in Telugu script are labeled 'tel_script' and numerals 'num',
+    so neither is sent to the transliterator.
+
+    Args:
+        tokens (list): Tokens of one sentence.
+        english_vocab (set): Lowercased English vocabulary.
+        punctuation (set): Tokens to label as punctuation.
+
+    Returns:
+        list: (token, label) pairs.
+    """
+    labels = []
+    for token in tokens:
+        if token in punctuation:
+            labels.append('punct')
+            continue
+        if TELUGU_SCRIPT.fullmatch(token):
+            labels.append('tel_script')
+            continue
+        if NUMERAL.fullmatch(token):
+            labels.append('num')
+            continue
+        # Normalize the word (remove non-alphabetic characters and convert to lowercase)
+        word = ''.join(char for char in token if char.isalpha()).lower()
+        if word in english_vocab:
+            labels.append('en')  # English
+        elif word:  # Non-empty and not in English vocab
+            labels.append('tel')  # Telugu or other non-English
+        else:
+            labels.append('other')  # Unknown tokens
+    return list(zip(tokens, labels))
+
+def label_sentences(sentences):
+    """
+    Tokenizes each sentence once and labels its words, without touching disk.
+
+    Args:
+        sentences (list): Sentences to label.
+
+    Returns:
+        list: One list of (token, label) pairs per sentence.
+    """
+    from nltk.tokenize import word_tokenize
+
+    ensure_nltk_data('tokenizers/punkt_tab', 'punkt_tab')
+    english_vocab = english_vocabulary()
+    return [label_tokens(word_tokenize(sentence), english_vocab) for sentence in sentences]
 
 def label_words_in_sentences(input_csv, output_labeled_csv, output_telugu_csv, conversion_input_csv):
     """
@@ -21,27 +143,7 @@ def label_words_in_sentences(input_csv, output_labeled_csv, output_telugu_csv, c
         output_telugu_csv (str): Path to save only Telugu labeled words.
         conversion_input_csv (str): Path to save the conversion input CSV.
     """
-    # Define English vocabulary and punctuation
-    english_vocab = set(w.lower() for w in words.words())
-    punctuation = set(string.punctuation)
-
-    # Function to label words
-    def label_words(sentence):
-        tokens = word_tokenize(sentence)
-        labels = []
-        for token in tokens:
-            if token in punctuation:
-                labels.append('punct')
-                continue
-            # Normalize the word (remove non-alphabetic characters and convert to lowercase)
-            word = ''.join(char for char in token if char.isalpha()).lower()
-            if word in english_vocab:
-                labels.append('en')  # English
-            elif word:  # Non-empty and not in English vocab
-                labels.append('tel')  # Telugu or other non-English
-            else:
-                labels.append('other')  # Unknown tokens
-        return list(zip(tokens, labels))
+    import pandas as pd
 
     # Step 1: Read sentences from the input CSV file
     df_input = pd.read_csv(input_csv)
@@ -51,7 +153,7 @@ def label_words_in_sentences(input_csv, output_labeled_csv, output_telugu_csv, c
     logging.info("Loaded {len(sentences)} sentences from '{input_csv}'.")
 
     # Step 2: Label all sentences
-    all_labeled = [label_words(sentence) for sentence in sentences]
+    all_labeled = label_sentences(sentences)
     logging.info("Completed labeling of all sentences.")
 
     # Step 3: Flatten the data for DataFrame
@@ -87,6 +189,26 @@ def label_words_in_sentences(input_csv, output_labeled_csv, output_telugu_csv, c
     df_for_conversion.to_csv(conversion_input_csv, index=False)
     logging.info("Conversion input file saved to '{conversion_input_csv}'.")
 
+def transliterate_words(latin_words):
+    """
+    Transliterates Latin-scripted Telugu words into Telugu script through the memo cache.
+
+    Args:
+        latin_words (list): Latin-scripted words.
+
+    Returns:
+        list: (latin, telugu) pairs in input order.
+    """
+    # Import the cached transliteration function
+    try:
+        from translit_cache import get_cache
+    except ImportError as e:
+        # Name the module that is actually missing (translit_cache or one it imports)
+        raise ImportError(f"Module '{e.name or 'translit_cache'}' not found. Ensure it is installed and accessible.") from e
+
+    # Repeated words are served from the in-process or on-disk cache
+    return list(zip(latin_words, get_cache().transliterate_many(latin_words)))
+
 def transliterate_telugu_words(conversion_input_csv, transliterated_output_csv):
     """
     Reads Latin-scripted Telugu words from conversion_input_csv, transliterates them,
@@ -96,12 +218,6 @@ def transliterate_telugu_words(conversion_input_csv, transliterated_output_csv):
         conversion_input_csv (str): Path to the input CSV file with Latin words.
         transliterated_output_csv (str): Path to save the transliterated Telugu words.
     """
-    # Import the transliteration function
-    try:
-        from translit_enhance import transliterate_word_enhanced
-    except ImportError:
-        raise ImportError("Module 'translit_enhance' not found. Ensure it is installed and accessible.")
-
     input_path = conversion_input_csv
     output_path = transliterated_output_csv
 
@@ -113,13 +229,25 @@ def transliterate_telugu_words(conversion_input_csv, transliterated_output_csv):
         writer = csv.DictWriter(outfile, fieldnames=fieldnames)
         writer.writeheader()
         
-        for row in reader:
-            latin_word = row['Latin']
-            telugu_word = transliterate_word_enhanced(latin_word)
+        latin_words = [row['Latin'] for row in reader]
+        for latin_word, telugu_word in transliterate_words(latin_words):
             writer.writerow({'Latin': latin_word, 'Telugu': telugu_word})
     
     logging.info("Transliteration completed. Check '{transliterated_output_csv}' for results.")
 
+def replace_tokens(tokens, mapping):
+    """
+    Replaces tokens found (case-insensitively) in mapping and joins them into a sentence.
+
+    Args:
+        tokens (list): Tokens of one sentence.
+        mapping (dict): Lowercased Latin word -> Telugu script.
+
+    Returns:
+        str: The rebuilt sentence.
+    """
+    return ' '.join(mapping.get(token.lower(), token) for token in tokens)
+
 def replace_transliterated_words(original_input_csv, transliteration_csv, final_output_csv):
     """
     Replaces Latin-scripted Telugu words in the original sentences with their Telugu script equivalents.
@@ -129,8 +257,11 @@ def replace_transliterated_words(original_input_csv, transliteration_csv, final_
         transliteration_csv (str): Path to the CSV file with transliterated Telugu words.
         final_output_csv (str): Path to save the final modified sentences.
     """
+    import pandas as pd
+    from nltk.tokenize import word_tokenize
+
     # Ensure NLTK data is downloaded
-    nltk.download('punkt')
+    ensure_nltk_data('tokenizers/punkt_tab', 'punkt_tab')
 
     # Step 1: Read the original input sentences from the input CSV file
     df_input = pd.read_csv(original_input_csv)
@@ -150,20 +281,11 @@ def replace_transliterated_words(original_input_csv, transliteration_csv, final_
     latin_to_telugu = {latin.lower(): telugu for latin, telugu in zip(df_conversion['Latin'], df_conversion['Telugu'])}
     logging.info("Created Latin to Telugu mapping dictionary.")
 
-    # Step 4: Function to replace Latin-scripted Telugu words with Telugu script
-    def replace_latin_with_telugu(sentence, mapping):
-        tokens = word_tokenize(sentence)
-        modified_tokens = [
-            mapping.get(token.lower(), token)  # Replace if in mapping; else keep original
-            for token in tokens
-        ]
-        return ' '.join(modified_tokens)
-
-    # Step 5: Process each sentence
-    modified_sentences = [replace_latin_with_telugu(sentence, latin_to_telugu) for sentence in sentences]
+    # Step 4: Replace Latin-scripted Telugu words in each sentence with Telugu script
+    modified_sentences = [replace_tokens(word_tokenize(sentence), latin_to_telugu) for sentence in sentences]
     logging.info("Completed replacing transliterated words in all sentences.")
 
-    # Step 6: Save the final modified sentences into a new CSV file
+    # Step 5: Save the final modified sentences into a new CSV file
     df_final_output = pd.DataFrame({'sentence': modified_sentences})
     df_final_output.to_csv(final_output_csv, index=False)
     logging.info("Final sentences saved to '{final_output_csv}'.")
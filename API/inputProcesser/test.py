@@ -1,2 +1,6 @@
 import nltk
-nltk.download('punkt_tab')
\ No newline at end of file
+
+# Downloads the tokenizer data once when run as a script; importing this
+# module no longer touches the network
+if __name__ == "__main__":
+    nltk.download('punkt_tab')
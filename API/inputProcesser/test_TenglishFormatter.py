@@ -0,0 +1,20 @@
+import functools
+
+import TenglishFormatter
+import stage1
+
+
+def test_pipeline_fingerprint_follows_the_vocabulary_and_the_version(tmp_path, monkeypatch):
+    vocabulary = tmp_path / "english_vocab.txt"
+    vocabulary.write_text("book\nread", encoding='utf-8')
+    monkeypatch.setattr(TenglishFormatter, "english_vocabulary_fingerprint",
+                        functools.partial(stage1.english_vocabulary_fingerprint, str(vocabulary)))
+    fingerprint = TenglishFormatter.pipeline_fingerprint()
+    assert TenglishFormatter.pipeline_fingerprint() == fingerprint
+
+    vocabulary.write_text("book\nread\nnenu", encoding='utf-8')
+    changed_vocabulary = TenglishFormatter.pipeline_fingerprint()
+    assert changed_vocabulary != fingerprint
+
+    monkeypatch.setattr(TenglishFormatter, "PIPELINE_VERSION", TenglishFormatter.PIPELINE_VERSION + 1)
+    assert TenglishFormatter.pipeline_fingerprint() not in (fingerprint, changed_vocabulary)
@@ -0,0 +1,105 @@
+import random
+
+from tel_transliterate import latin_to_telugu
+from tel_vowel_signs import vowel_signs
+from translit_enhance import transliterate_word_enhanced
+
+# The implementation translit_enhance.py had before it was compiled into tries,
+# kept as the reference the trie version must agree with
+reference_vowels = ['a', 'aa', 'i', 'ii', 'u', 'uu', 'e', 'ee', 'ai', 'o', 'oo', 'au', 'ri']
+reference_consonants = [
+    'kshn', 'ksh', 'shn', 'kh', 'gh', 'ch', 'jh',
+    'th', 'dh', 'ph', 'bh', 'sh',
+    'gn', 'tr', 'tth', 'ddh', 'nj',
+    'nn', 'tt', 'dd',
+    'k', 'g', 'c', 'j',
+    't', 'd', 'n', 'p', 'b',
+    'm', 'y', 'r', 'l', 'v',
+    's', 'h',
+]
+consonants_sorted = sorted(reference_consonants, key=lambda x: -len(x))
+vowels_sorted = sorted(reference_vowels, key=lambda x: -len(x))
+
+
+def reference_transliterate_word(latin_word):
+    telugu_word = ""
+    i = 0
+    length = len(latin_word)
+
+    while i < length:
+        matched = False
+
+        for cons in consonants_sorted:
+            cons_len = len(cons)
+            segment = latin_word[i:i+cons_len].lower()
+            if segment == cons:
+                telugu_consonant = latin_to_telugu.get(cons)
+                if telugu_consonant:
+                    i += cons_len
+                    is_next_consonant = False
+                    for next_cons in consonants_sorted:
+                        next_cons_len = len(next_cons)
+                        if latin_word[i:i+next_cons_len].lower() == next_cons:
+                            is_next_consonant = True
+                            break
+                    if is_next_consonant:
+                        telugu_word += telugu_consonant + '్'
+                    else:
+                        vowel_matched = False
+                        for vowel in vowels_sorted:
+                            vowel_len = len(vowel)
+                            vowel_segment = latin_word[i:i+vowel_len].lower()
+                            if vowel_segment == vowel:
+                                vowel_sign = vowel_signs.get(vowel, '')
+                                telugu_word += telugu_consonant + vowel_sign
+                                i += vowel_len
+                                vowel_matched = True
+                                break
+                        if not vowel_matched:
+                            telugu_word += telugu_consonant
+                    matched = True
+                    break
+        if matched:
+            continue
+
+        for vowel in vowels_sorted:
+            vowel_len = len(vowel)
+            vowel_segment = latin_word[i:i+vowel_len].lower()
+            if vowel_segment == vowel:
+                telugu_vowel = latin_to_telugu.get(vowel)
+                if telugu_vowel:
+                    telugu_word += telugu_vowel
+                    i += vowel_len
+                matched = True
+                break
+        if matched:
+            continue
+
+        telugu_word += latin_word[i]
+        i += 1
+
+    return telugu_word
+
+
+# Pieces the random words are built from: every table key (in both cases), and
+# characters that are unmapped or whose lowercase form is special
+PIECES = sorted(set(reference_consonants + reference_vowels + list(latin_to_telugu) + list(vowel_signs)))
+PIECES += [piece.upper() for piece in PIECES] + [piece.capitalize() for piece in PIECES]
+PIECES += list("xzqfwAZ019-'.") + ["K", "İ", "Σ", "ß", "నె", " "]
+
+
+def random_words(count, seed=0):
+    rng = random.Random(seed)
+    return ["".join(rng.choice(PIECES) for _ in range(rng.randint(1, 8))) for _ in range(count)]
+
+
+def test_matches_the_reference_on_the_sample_words():
+    for word in ["nenu", "chadivanu", "oka", "katha", "kshnam", "tthaddhi", "Srii", "raamudu", ""]:
+        assert transliterate_word_enhanced(word) == reference_transliterate_word(word)
+
+
+def test_matches_the_reference_on_a_large_random_word_list():
+    mismatches = [(word, transliterate_word_enhanced(word), reference_transliterate_word(word))
+                  for word in random_words(50000)
+                  if transliterate_word_enhanced(word) != reference_transliterate_word(word)]
+    assert mismatches[:10] == []
@@ -0,0 +1,177 @@
+# translit_cache.py
+
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from tel_transliterate import latin_to_telugu
+from tel_vowel_signs import vowel_signs
+from translit_enhance import transliterate_word_enhanced, consonants, vowels
+from metrics import count
+
+# Words kept in the in-process LRU tier
+TRANSLIT_CACHE_SIZE = int(os.getenv("TRANSLIT_CACHE_SIZE", 50000))
+
+# SQLite file backing the on-disk tier (set to an empty string to disable it)
+TRANSLIT_CACHE_PATH = os.getenv(
+    "TRANSLIT_CACHE_PATH",
+    os.path.join(os.path.expanduser('~'), '.cache', 'CSNTR', 'translit_cache.sqlite3')
+)
+
+# Maximum number of words looked up in one SQL query
+_LOOKUP_CHUNK = 500
+
+
+def tables_fingerprint():
+    """
+    Returns a hash of every table the transliterator depends on.
+
+    Cached words are only valid for the tables they were computed with, so the
+    on-disk tier is cleared whenever this changes.
+    """
+    tables = [latin_to_telugu, vowel_signs, consonants, vowels]
+    return hashlib.sha1(json.dumps(tables, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class TransliterationCache:
+    """
+    Two-tier memo cache in front of transliterate_word_enhanced.
+
+    Lookups go to an in-process LRU first, then to a SQLite word -> Telugu table
+    that survives restarts, and only then to the transliterator. Hits and misses
+    are counted per tier.
+    """
+
+    def __init__(self, max_size=TRANSLIT_CACHE_SIZE, path=TRANSLIT_CACHE_PATH):
+        self.max_size = max_size
+        self.path = path
+        self.fingerprint = tables_fingerprint()
+        self._memory = OrderedDict()
+        self._connection = None
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # Open the on-disk tier, clearing it if it was built from other tables
+    def _disk(self):
+        if self._connection is None and self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            connection.execute("CREATE TABLE IF NOT EXISTS words (latin TEXT PRIMARY KEY, telugu TEXT NOT NULL)")
+            row = connection.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+            if row is None or row[0] != self.fingerprint:
+                with connection:
+                    connection.execute("DELETE FROM words")
+                    connection.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (self.fingerprint,))
+            self._connection = connection
+        return self._connection
+
+    def _remember(self, latin_word, telugu_word):
+        self._memory[latin_word] = telugu_word
+        self._memory.move_to_end(latin_word)
+        if len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def transliterate_many(self, latin_words):
+        """
+        Transliterates a list of words, computing each distinct uncached word once.
+
+        Args:
+            latin_words (list): Latin-scripted words.
+
+        Returns:
+            list: Telugu script for each word, in input order.
+        """
+        with self._lock:
+            results = {}
+            missing = []
+            for latin_word in dict.fromkeys(latin_words):
+                if latin_word in self._memory:
+                    self._memory.move_to_end(latin_word)
+                    results[latin_word] = self._memory[latin_word]
+                    self.memory_hits += 1
+                else:
+                    missing.append(latin_word)
+
+            # Look the remaining words up on disk in a few batched queries
+            connection = self._disk()
+            if connection is not None and missing:
+                for start in range(0, len(missing), _LOOKUP_CHUNK):
+                    chunk = missing[start:start + _LOOKUP_CHUNK]
+                    placeholders = ','.join('?' * len(chunk))
+                    query = f"SELECT latin, telugu FROM words WHERE latin IN ({placeholders})"
+                    for latin_word, telugu_word in connection.execute(query, chunk):
+                        results[latin_word] = telugu_word
+                        self._remember(latin_word, telugu_word)
+                        self.disk_hits += 1
+                missing = [latin_word for latin_word in missing if latin_word not in results]
+
+            # Compute what neither tier had and store it in both
+            computed = [(latin_word, transliterate_word_enhanced(latin_word)) for latin_word in missing]
+            self.misses += len(computed)
+            for latin_word, telugu_word in computed:
+                results[latin_word] = telugu_word
+                self._remember(latin_word, telugu_word)
+            if connection is not None and computed:
+                with connection:
+                    connection.executemany("INSERT OR REPLACE INTO words VALUES (?, ?)", computed)
+            count('translit_cache_misses', len(computed))
+            count('translit_cache_hits', len(results) - len(computed))
+
+            return [results[latin_word] for latin_word in latin_words]
+
+    def transliterate(self, latin_word):
+        """
+        Transliterates a single word through the cache.
+        """
+        return self.transliterate_many([latin_word])[0]
+
+    def stats(self):
+        """
+        Returns hit/miss counters for both tiers.
+        """
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            'memory_size': len(self._memory),
+        }
+
+    def clear(self):
+        """
+        Empties both tiers.
+        """
+        with self._lock:
+            self._memory.clear()
+            connection = self._disk()
+            if connection is not None:
+                with connection:
+                    connection.execute("DELETE FROM words")
+
+
+_cache = None
+
+
+def get_cache():
+    """
+    Returns the process-wide TransliterationCache.
+    """
+    global _cache
+    if _cache is None:
+        _cache = TransliterationCache()
+    return _cache
+
+
+def cache_stats():
+    """
+    Returns the hit/miss counters of the process-wide cache.
+    """
+    return get_cache().stats()
@@ -20,68 +20,95 @@ consonants = [
 consonants_sorted = sorted(consonants, key=lambda x: -len(x))
 vowels_sorted = sorted(vowels, key=lambda x: -len(x))
 
+# Marker for the end of a pattern inside a trie node
+_END = object()
+
+def _compile_trie(patterns):
+    """
+    Builds a character trie mapping each pattern to its value.
+
+    Args:
+        patterns (dict): Lowercase Latin pattern -> value.
+
+    Returns:
+        dict: Nested dicts keyed by character; the value of a complete pattern is stored under _END.
+    """
+    root = {}
+    for pattern, value in patterns.items():
+        node = root
+        for char in pattern:
+            node = node.setdefault(char, {})
+        node[_END] = value
+    return root
+
+# Consonants that can be emitted (they need a Telugu letter), every listed
+# consonant (used only to decide on the virama), and vowels with their
+# standalone letters and their signs after a consonant
+_consonant_trie = _compile_trie({cons: latin_to_telugu[cons] for cons in consonants_sorted if latin_to_telugu.get(cons)})
+_any_consonant_trie = _compile_trie({cons: True for cons in consonants_sorted})
+_vowel_trie = _compile_trie({vowel: latin_to_telugu[vowel] for vowel in vowels_sorted if latin_to_telugu.get(vowel)})
+_vowel_sign_trie = _compile_trie({vowel: vowel_signs.get(vowel, '') for vowel in vowels_sorted})
+
+def _longest_match(trie, lowered, i):
+    """
+    Returns (length, value) of the longest pattern in trie starting at lowered[i], or None.
+    """
+    node = trie
+    match = None
+    length = len(lowered)
+    j = i
+    while j < length:
+        node = node.get(lowered[j])
+        if node is None:
+            break
+        j += 1
+        if _END in node:
+            match = (j - i, node[_END])
+    return match
+
 def transliterate_word_enhanced(latin_word):
-    telugu_word = ""
+    # Patterns are matched case-insensitively. lower() only changes the length
+    # of a string for characters that can never match a pattern, in which case
+    # each character is lowered on its own to keep positions aligned.
+    lowered = latin_word.lower()
+    if len(lowered) != len(latin_word):
+        lowered = [char.lower() if len(char.lower()) == 1 else '' for char in latin_word]
+
+    telugu_chars = []
     i = 0
     length = len(latin_word)
-    
+
     while i < length:
-        matched = False
-        
-        # Attempt to match consonant
-        for cons in consonants_sorted:
-            cons_len = len(cons)
-            segment = latin_word[i:i+cons_len].lower()
-            if segment == cons:
-                telugu_consonant = latin_to_telugu.get(cons)
-                if telugu_consonant:
-                    i += cons_len
-                    # Check if the next segment starts with a consonant
-                    is_next_consonant = False
-                    for next_cons in consonants_sorted:
-                        next_cons_len = len(next_cons)
-                        if latin_word[i:i+next_cons_len].lower() == next_cons:
-                            is_next_consonant = True
-                            break
-                    if is_next_consonant:
-                        # Append consonant with virama to suppress inherent 'a'
-                        telugu_word += telugu_consonant + '్'
-                    else:
-                        # Attempt to match vowel after consonant
-                        vowel_matched = False
-                        for vowel in vowels_sorted:
-                            vowel_len = len(vowel)
-                            vowel_segment = latin_word[i:i+vowel_len].lower()
-                            if vowel_segment == vowel:
-                                vowel_sign = vowel_signs.get(vowel, '')
-                                telugu_word += telugu_consonant + vowel_sign
-                                i += vowel_len
-                                vowel_matched = True
-                                break
-                        if not vowel_matched:
-                            # No vowel follows; append consonant with inherent 'a'
-                            telugu_word += telugu_consonant
-                    matched = True
-                    break  # Consonant matched; proceed to next character
-        if matched:
-            continue  # Proceed to next iteration of the while loop
-        
-        # Attempt to match standalone vowel
-        for vowel in vowels_sorted:
-            vowel_len = len(vowel)
-            vowel_segment = latin_word[i:i+vowel_len].lower()
-            if vowel_segment == vowel:
-                telugu_vowel = latin_to_telugu.get(vowel)
-                if telugu_vowel:
-                    telugu_word += telugu_vowel
+        # Attempt to match the longest consonant
+        consonant = _longest_match(_consonant_trie, lowered, i)
+        if consonant:
+            cons_len, telugu_consonant = consonant
+            i += cons_len
+            if _longest_match(_any_consonant_trie, lowered, i):
+                # Next segment starts with a consonant: add the virama to suppress inherent 'a'
+                telugu_chars.append(telugu_consonant + '్')
+            else:
+                # Attempt to match vowel after consonant
+                vowel = _longest_match(_vowel_sign_trie, lowered, i)
+                if vowel:
+                    vowel_len, vowel_sign = vowel
+                    telugu_chars.append(telugu_consonant + vowel_sign)
                     i += vowel_len
-                matched = True
-                break
-        if matched:
-            continue  # Proceed to next iteration of the while loop
-        
-        # If no match found, append the character as is or handle accordingly
-        telugu_word += latin_word[i]
+                else:
+                    # No vowel follows; append consonant with inherent 'a'
+                    telugu_chars.append(telugu_consonant)
+            continue
+
+        # Attempt to match standalone vowel
+        vowel = _longest_match(_vowel_trie, lowered, i)
+        if vowel:
+            vowel_len, telugu_vowel = vowel
+            telugu_chars.append(telugu_vowel)
+            i += vowel_len
+            continue
+
+        # If no match found, append the character as is
+        telugu_chars.append(latin_word[i])
         i += 1
-    
-    return telugu_word
+
+    return ''.join(telugu_chars)
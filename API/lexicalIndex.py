@@ -0,0 +1,331 @@
+import os
+import re
+import json
+import math
+import threading
+import contextlib
+import numpy as np
+from collections import Counter
+
+from embeddingStore import exclusive_lock, read_generation, write_generation
+
+# File names used inside EMBEDDINGS_DIRECTORY
+LEXICAL_FILE = "lexical_index.npz"
+LEXICAL_LOG_FILE = "lexical_index.log"
+LEXICAL_LOCK_FILE = "lexical_index.lock"
+
+# How find uses the index: "prefilter" scores only the chunks of the best BM25
+# notes, "fuse" merges the dense and BM25 rankings (unset disables the index)
+LEXICAL_INDEX = os.getenv("LEXICAL_INDEX", "").lower()
+LEXICAL_MODES = ("prefilter", "fuse")
+if LEXICAL_INDEX and LEXICAL_INDEX not in LEXICAL_MODES:
+    raise ValueError(f"Unknown LEXICAL_INDEX '{LEXICAL_INDEX}' (expected one of {', '.join(LEXICAL_MODES)})")
+
+# Notes kept by the BM25 pass before dense scoring, and the BM25 parameters
+LEXICAL_CANDIDATES = int(os.getenv("LEXICAL_CANDIDATES", 200))
+BM25_K1 = float(os.getenv("BM25_K1", 1.2))
+BM25_B = float(os.getenv("BM25_B", 0.75))
+
+# The log is folded into the snapshot once it holds this share of the notes
+LEXICAL_COMPACT_RATIO = 0.25
+
+# Latin words, digits and whole Telugu words (vowel signs and viramas included)
+TOKEN = re.compile('[\\w\u0C00-\u0C7F\u200C\u200D]+')
+
+
+def lexical_terms(text):
+    """
+    Returns the term frequencies of a processed note or query.
+    """
+    return Counter(TOKEN.findall(text.lower()))
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over the terms of every note's processed text.
+
+    The snapshot stores the postings compactly as CSR arrays: for the i-th term,
+    doc_ids[offsets[i]:offsets[i + 1]] and tfs[...] hold the notes containing it
+    and how often. Notes indexed or deleted since the snapshot are appended to a
+    JSON-lines log (so an edit costs one small append) and kept as in-memory
+    delta postings, with the note's old postings tombstoned; once the log holds
+    LEXICAL_COMPACT_RATIO of the notes, compact() folds it into a new snapshot.
+
+    Writers hold an exclusive flock on LEXICAL_LOCK_FILE from their refresh to
+    the end of their append (and compaction), so no line another process
+    appends is lost when the log is folded in and emptied. Each compaction
+    bumps a counter in the lock file, which tells readers the snapshot changed
+    even within one mtime tick.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, LEXICAL_FILE)
+        self.log_path = os.path.join(directory, LEXICAL_LOG_FILE)
+        self.lock_path = os.path.join(directory, LEXICAL_LOCK_FILE)
+        self._lock_file = None
+        self._thread_lock = threading.RLock()
+        self._load()
+
+    # Hold the index's write lock for one change, picking up whatever other
+    # writers appended or compacted first; compact() inside a write reuses it
+    @contextlib.contextmanager
+    def _write_lock(self):
+        with self._thread_lock:
+            if self._lock_file is not None:
+                yield
+                return
+            with exclusive_lock(self.lock_path) as lock_file:
+                self._lock_file = lock_file
+                try:
+                    self.refresh()
+                    yield
+                finally:
+                    self._lock_file = None
+
+    def _load(self):
+        # Read the compaction counter first, so it is never newer than the snapshot
+        self._generation = read_generation(self.lock_path)
+        if os.path.exists(self.snapshot_path):
+            with np.load(self.snapshot_path) as snapshot:
+                self.terms = {term: position for position, term in enumerate(snapshot['terms'].tolist())}
+                self.offsets = snapshot['offsets']
+                self.doc_ids = snapshot['doc_ids']
+                self.tfs = snapshot['tfs']
+                self.notes = snapshot['notes'].tolist()
+                self.lengths = snapshot['lengths'].tolist()
+            self._snapshot_mtime = os.path.getmtime(self.snapshot_path)
+        else:
+            self.terms = {}
+            self.offsets = np.zeros(1, dtype=np.int64)
+            self.doc_ids = np.empty(0, dtype=np.int32)
+            self.tfs = np.empty(0, dtype=np.uint16)
+            self.notes = []
+            self.lengths = []
+            self._snapshot_mtime = None
+
+        self.rows = {note: doc for doc, note in enumerate(self.notes)}
+        self.total_length = sum(self.lengths)
+        self.delta = {}
+        self.log_entries = 0
+        self._log_offset = 0
+        self._arrays = None
+        self._replay_log()
+
+    # Apply log entries written since the last read (by this or another process)
+    def _replay_log(self):
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'rb') as file:
+            file.seek(self._log_offset)
+            data = file.read()
+        # Ignore a trailing line that is still being written
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            entry = json.loads(line)
+            self._apply(entry['note'], entry['terms'])
+            self.log_entries += 1
+        self._log_offset += len(complete)
+
+    def _apply(self, note, terms):
+        old_doc = self.rows.pop(note, None)
+        if old_doc is not None:
+            self.notes[old_doc] = None
+            self.total_length -= self.lengths[old_doc]
+            self.lengths[old_doc] = 0
+        if terms is not None:
+            doc = len(self.notes)
+            self.notes.append(note)
+            self.lengths.append(sum(terms.values()))
+            self.total_length += self.lengths[doc]
+            self.rows[note] = doc
+            for term, tf in terms.items():
+                self.delta.setdefault(term, []).append((doc, tf))
+        self._arrays = None
+
+    def refresh(self):
+        """
+        Picks up notes another process indexed or deleted since the last read.
+        """
+        mtime = os.path.getmtime(self.snapshot_path) if os.path.exists(self.snapshot_path) else None
+        log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        if (mtime != self._snapshot_mtime or log_size < self._log_offset
+                or read_generation(self.lock_path) != self._generation):
+            self._load()
+        elif log_size > self._log_offset:
+            self._replay_log()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, note):
+        return note in self.rows
+
+    def update_many(self, notes):
+        """
+        Indexes several (note, term frequencies) pairs, replacing earlier versions.
+        """
+        entries = [(note, dict(terms)) for note, terms in notes]
+        with self._write_lock():
+            self._append(entries)
+
+    def remove_many(self, notes):
+        """
+        Drops several notes from the index.
+
+        Returns:
+            int: Number of notes that were actually indexed.
+        """
+        notes = list(notes)
+        # Checked after the refresh, so notes another process indexed are removed too
+        with self._write_lock():
+            entries = [(note, None) for note in notes if note in self.rows]
+            self._append(entries)
+        return len(entries)
+
+    # Called with the write lock held
+    def _append(self, entries):
+        if not entries:
+            return
+        lines = "".join(json.dumps({'note': note, 'terms': terms}, ensure_ascii=False) + "\n" for note, terms in entries)
+        with open(self.log_path, 'a', encoding='utf-8') as file:
+            file.write(lines)
+        self._replay_log()
+        if self.log_entries >= max(1000, LEXICAL_COMPACT_RATIO * len(self.rows)):
+            self.compact()
+
+    def build(self, notes):
+        """
+        Replaces the whole index with the given (note, term frequencies) pairs.
+        """
+        notes = list(notes)
+        with self._write_lock():
+            self.terms = {}
+            self.offsets = np.zeros(1, dtype=np.int64)
+            self.doc_ids = np.empty(0, dtype=np.int32)
+            self.tfs = np.empty(0, dtype=np.uint16)
+            self.notes = []
+            self.lengths = []
+            self.rows = {}
+            self.total_length = 0
+            self.delta = {}
+            for note, terms in notes:
+                self._apply(note, terms)
+            self.compact()
+        print(f"Built lexical index over {len(self.rows)} notes ({len(self.terms)} terms, {self.doc_ids.size} postings).")
+
+    def compact(self):
+        """
+        Folds the delta postings into a new snapshot without tombstoned notes and empties the log.
+        """
+        with self._write_lock():
+            # Every posting as parallel (term, doc, tf) arrays, base then delta
+            delta_terms = [term for term in self.delta if term not in self.terms]
+            vocabulary = list(self.terms) + delta_terms
+            positions = dict(self.terms, **{term: len(self.terms) + i for i, term in enumerate(delta_terms)})
+            term_column = [np.repeat(np.arange(len(self.terms), dtype=np.int64), np.diff(self.offsets))]
+            doc_column = [self.doc_ids.astype(np.int64)]
+            tf_column = [self.tfs.astype(np.int64)]
+            for term, postings in self.delta.items():
+                postings = np.asarray(postings, dtype=np.int64).reshape(-1, 2)
+                term_column.append(np.full(len(postings), positions[term], dtype=np.int64))
+                doc_column.append(postings[:, 0])
+                tf_column.append(postings[:, 1])
+            term_column = np.concatenate(term_column)
+            doc_column = np.concatenate(doc_column)
+            tf_column = np.concatenate(tf_column)
+
+            # Drop tombstoned notes and renumber the live ones densely
+            live = np.fromiter((note is not None for note in self.notes), dtype=bool, count=len(self.notes))
+            new_ids = np.cumsum(live) - 1
+            keep = live[doc_column] if doc_column.size else np.zeros(0, dtype=bool)
+            term_column, doc_column, tf_column = term_column[keep], new_ids[doc_column[keep]], tf_column[keep]
+
+            # Group by term (docs stay ascending within a term) and drop unused terms
+            order = np.lexsort((doc_column, term_column))
+            term_column, doc_column, tf_column = term_column[order], doc_column[order], tf_column[order]
+            used, counts = np.unique(term_column, return_counts=True)
+            self.terms = {vocabulary[position]: i for i, position in enumerate(used.tolist())}
+            self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+            self.doc_ids = doc_column.astype(np.int32)
+            self.tfs = np.minimum(tf_column, np.iinfo(np.uint16).max).astype(np.uint16)
+            self.notes = [note for note in self.notes if note is not None]
+            self.lengths = [length for length, alive in zip(self.lengths, live) if alive]
+            self.rows = {note: doc for doc, note in enumerate(self.notes)}
+            self.delta = {}
+            self._arrays = None
+
+            # Write the snapshot before emptying the log; replaying a log over the
+            # snapshot it was folded into gives the same index
+            tmp_path = self.snapshot_path + ".tmp.npz"
+            np.savez(tmp_path, terms=np.array(list(self.terms), dtype=str), offsets=self.offsets,
+                     doc_ids=self.doc_ids, tfs=self.tfs, notes=np.array(self.notes, dtype=str),
+                     lengths=np.array(self.lengths, dtype=np.int32))
+            os.replace(tmp_path, self.snapshot_path)
+            open(self.log_path, 'w').close()
+            self._snapshot_mtime = os.path.getmtime(self.snapshot_path)
+            self._generation += 1
+            write_generation(self._lock_file, self._generation)
+            self.log_entries = 0
+            self._log_offset = 0
+
+    # Live-note mask and document lengths as arrays, rebuilt after every change
+    def _doc_arrays(self):
+        if self._arrays is None:
+            live = np.fromiter((note is not None for note in self.notes), dtype=bool, count=len(self.notes))
+            self._arrays = (live, np.asarray(self.lengths, dtype=np.float32))
+        return self._arrays
+
+    def postings(self, term):
+        """
+        Returns the live (doc ids, term frequencies) of a term.
+        """
+        docs = []
+        tfs = []
+        position = self.terms.get(term)
+        if position is not None:
+            start, end = self.offsets[position], self.offsets[position + 1]
+            docs.append(self.doc_ids[start:end].astype(np.int64))
+            tfs.append(self.tfs[start:end].astype(np.float32))
+        if term in self.delta:
+            postings = np.asarray(self.delta[term], dtype=np.int64).reshape(-1, 2)
+            docs.append(postings[:, 0])
+            tfs.append(postings[:, 1].astype(np.float32))
+        if not docs:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        docs = np.concatenate(docs)
+        tfs = np.concatenate(tfs)
+        live = self._doc_arrays()[0][docs]
+        return docs[live], tfs[live]
+
+    def search(self, query_text, k=LEXICAL_CANDIDATES, k1=BM25_K1, b=BM25_B):
+        """
+        Returns the k notes with the highest BM25 score for a processed query.
+
+        Returns:
+            list: (note, BM25 score) pairs, best first; notes sharing no term
+            with the query are never returned.
+        """
+        if not self.rows:
+            return []
+        _, lengths = self._doc_arrays()
+        note_count = len(self.rows)
+        average_length = max(self.total_length / note_count, 1e-6)
+
+        matched_docs = []
+        matched_scores = []
+        for term in lexical_terms(query_text):
+            docs, tfs = self.postings(term)
+            if docs.size == 0:
+                continue
+            idf = math.log(1 + (note_count - docs.size + 0.5) / (docs.size + 0.5))
+            norm = k1 * (1 - b + b * lengths[docs] / average_length)
+            matched_docs.append(docs)
+            matched_scores.append(idf * tfs * (k1 + 1) / (tfs + norm))
+        if not matched_docs:
+            return []
+
+        docs, inverse = np.unique(np.concatenate(matched_docs), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(matched_scores))
+        best = np.argsort(-scores, kind='stable')[:k]
+        return [(self.notes[docs[position]], float(scores[position])) for position in best]
@@ -0,0 +1,69 @@
+import os
+import json
+import hashlib
+
+# File name used inside EMBEDDINGS_DIRECTORY
+NOTES_MANIFEST_FILE = "notes_manifest.json"
+
+
+def content_hash(data):
+    """
+    Returns the SHA-1 hex digest of a note's raw bytes.
+    """
+    return hashlib.sha1(data).hexdigest()
+
+
+class NoteManifest:
+    """
+    Records what each note looked like when it was last indexed.
+
+    Every entry keeps the note's content hash, mtime (in nanoseconds), size and
+    the id of the model that embedded it. A note whose mtime and size still
+    match can be skipped without reading it; one whose mtime changed but whose
+    hash did not only needs its entry refreshed.
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, NOTES_MANIFEST_FILE)
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as file:
+                self.notes = json.load(file)
+        else:
+            self.notes = {}
+
+    def save(self):
+        """
+        Writes the manifest atomically.
+        """
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.notes, file)
+        os.replace(tmp_path, self.path)
+
+    def get(self, name):
+        return self.notes.get(name)
+
+    def names(self):
+        return list(self.notes)
+
+    def record(self, name, digest, stat, model_id):
+        """
+        Stores the state of a note that has just been indexed.
+        """
+        self.notes[name] = {
+            'hash': digest,
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'model': model_id,
+        }
+
+    def remove(self, name):
+        return self.notes.pop(name, None) is not None
+
+    def is_fresh(self, name, stat, model_id):
+        """
+        Returns True if the note's mtime, size and model all match its entry.
+        """
+        entry = self.notes.get(name)
+        return (entry is not None and entry['mtime'] == stat.st_mtime_ns
+                and entry['size'] == stat.st_size and entry['model'] == model_id)
@@ -0,0 +1,340 @@
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+import contextlib
+from dotenv import load_dotenv
+
+import indexerAPI
+from metrics import operation
+
+load_dotenv()
+
+# How long the notes must be quiet before a burst of edits is indexed, the
+# longest a change waits while edits keep coming, and notes indexed per batch
+WATCH_DEBOUNCE_SECONDS = float(os.getenv("WATCH_DEBOUNCE_SECONDS", 1.0))
+WATCH_MAX_DELAY_SECONDS = float(os.getenv("WATCH_MAX_DELAY_SECONDS", 10.0))
+WATCH_BATCH_NOTES = int(os.getenv("WATCH_BATCH_NOTES", 32))
+
+# How changes are detected: "inotify" (Linux), "poll" (scan NOTES_DIRECTORY
+# every WATCH_POLL_SECONDS) or "auto" (inotify when available)
+WATCH_BACKEND = os.getenv("WATCH_BACKEND", "auto").lower()
+WATCH_BACKENDS = ("auto", "inotify", "poll")
+WATCH_POLL_SECONDS = float(os.getenv("WATCH_POLL_SECONDS", 1.0))
+
+# How often an idle watcher checks whether it was asked to stop
+WATCH_IDLE_SECONDS = 1.0
+
+# inotify flags (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+# Editors either rewrite a note in place or write a new file and rename it over
+# the old one, so both kinds of events are watched
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+
+# struct inotify_event header: wd, mask, cookie, len (the name follows)
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def note_name(filename):
+    """
+    Returns the note a file in NOTES_DIRECTORY holds, or None if it is not a note.
+    """
+    return filename[:-len('.txt')] if filename.endswith('.txt') else None
+
+
+class InotifyChanges:
+    """
+    Reports the notes created, modified, moved or deleted in a directory
+    through Linux inotify, called via ctypes so nothing has to be installed.
+    """
+
+    backend = "inotify"
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or "libc.so.6", use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "inotify is not available on this system")
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        if libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(error, os.strerror(error), directory)
+
+    def changes(self, timeout):
+        """
+        Waits up to `timeout` seconds for events.
+
+        Returns:
+            set: Names of the notes that changed, or None if the kernel dropped
+            events (queue overflow) and the whole directory must be rescanned.
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        names = set()
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            filename = os.fsdecode(data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b"\0"))
+            offset += INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                raise FileNotFoundError("NOTES_DIRECTORY was moved or deleted while it was being watched.")
+            name = note_name(filename)
+            if name:
+                names.add(name)
+        return names
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingChanges:
+    """
+    Reports changed notes by comparing the mtime and size of every note with
+    the previous scan, for systems without inotify (or network file systems,
+    where inotify misses changes made on other hosts).
+    """
+
+    backend = "poll"
+
+    def __init__(self, directory, interval=WATCH_POLL_SECONDS):
+        self.directory = directory
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._last_scan = time.monotonic()
+
+    def _scan(self):
+        snapshot = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                name = note_name(entry.name)
+                if name and entry.is_file():
+                    stat = entry.stat()
+                    snapshot[name] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def changes(self, timeout):
+        """
+        Waits up to `timeout` seconds, scanning the directory at most every `interval` seconds.
+
+        Returns:
+            set: Names of the notes created, modified or deleted since the last scan.
+        """
+        wait = max(0.0, self._last_scan + self.interval - time.monotonic())
+        if wait > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(wait)
+
+        snapshot = self._scan()
+        self._last_scan = time.monotonic()
+        changed = {name for name in snapshot.keys() | self._snapshot.keys()
+                   if snapshot.get(name) != self._snapshot.get(name)}
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def open_changes(directory, backend=WATCH_BACKEND):
+    """
+    Returns the change source for `backend`, falling back from inotify to
+    polling when `backend` is "auto" and inotify cannot be used.
+    """
+    if backend not in WATCH_BACKENDS:
+        raise ValueError(f"Unknown WATCH_BACKEND '{backend}' (expected one of {', '.join(WATCH_BACKENDS)})")
+    if backend == "poll":
+        return PollingChanges(directory)
+    try:
+        return InotifyChanges(directory)
+    except OSError as e:
+        if backend == "inotify":
+            raise
+        print(f"inotify is unavailable ({e}); polling {directory} every {WATCH_POLL_SECONDS}s instead")
+        return PollingChanges(directory)
+
+
+class NoteWatcher:
+    """
+    Keeps the index in line with NOTES_DIRECTORY while notes are edited with
+    other programs.
+
+    Changed notes are collected until no change has arrived for `debounce`
+    seconds (or the oldest one has waited `max_delay` seconds, so a note that
+    is saved continuously is still picked up) and then indexed `batch_notes`
+    at a time: only notes whose content changed are re-embedded, with the
+    model kept loaded between batches, and deleted notes are dropped.
+
+    With a `lock` (the daemon's), the store is only read and written while
+    holding it; notes are read and embedded without it, so queries answered
+    by the same process are not held up by the embedding.
+    """
+
+    def __init__(self, debounce=WATCH_DEBOUNCE_SECONDS, max_delay=WATCH_MAX_DELAY_SECONDS,
+                 batch_notes=WATCH_BATCH_NOTES, backend=WATCH_BACKEND, lock=None):
+        if indexerAPI.note_db is not None:
+            raise ValueError("watch follows NOTES_DIRECTORY; with STORAGE_BACKEND=sqlite every edit is already indexed")
+        if not os.path.isdir(indexerAPI.NOTES_DIRECTORY):
+            raise FileNotFoundError(f"The directory '{indexerAPI.NOTES_DIRECTORY}' does not exist.")
+        self.directory = indexerAPI.NOTES_DIRECTORY
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.batch_notes = batch_notes
+        self.lock = lock
+        self.changes = open_changes(self.directory, backend)
+        self.stop_event = threading.Event()
+
+    def _locked(self):
+        return self.lock if self.lock is not None else contextlib.nullcontext()
+
+    def _log(self, message):
+        print(message, flush=True)
+
+    def run(self):
+        """
+        Indexes changes until stop() is called; the notes changed while nobody
+        was watching are synced first.
+        """
+        self._log(f"Watching {self.directory} ({self.changes.backend}, {self.debounce}s debounce)")
+        self.flush(None)
+
+        pending = set()
+        rescan = False
+        first_change = last_change = None
+        try:
+            while not self.stop_event.is_set():
+                if pending or rescan:
+                    deadline = min(last_change + self.debounce, first_change + self.max_delay)
+                    timeout = max(0.0, deadline - time.monotonic())
+                else:
+                    timeout = WATCH_IDLE_SECONDS
+                changed = self.changes.changes(timeout)
+
+                now = time.monotonic()
+                if changed is None or changed:
+                    first_change = first_change if first_change is not None else now
+                    last_change = now
+                    if changed is None:
+                        rescan = True
+                    else:
+                        pending |= changed
+                if (pending or rescan) and (now >= last_change + self.debounce or now >= first_change + self.max_delay):
+                    self.flush(None if rescan else pending)
+                    pending = set()
+                    rescan = False
+                    first_change = last_change = None
+        finally:
+            self.stop_event.set()
+            self.changes.close()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def flush(self, names):
+        """
+        Indexes the given notes (every note on disk or in the index if None).
+        A failure is reported and the watcher keeps going; the notes involved
+        are picked up again the next time they change.
+        """
+        start_time = time.perf_counter()
+        indexed = removed = 0
+        try:
+            with operation('watch'):
+                if names is None:
+                    with self._locked():
+                        names = (set(indexerAPI.list_notes()) | set(indexerAPI.store.note_names())
+                                 | set(indexerAPI.manifest.names()))
+                names = sorted(names)
+                for start in range(0, len(names), self.batch_notes):
+                    batch_indexed, batch_removed = self._sync_batch(names[start:start + self.batch_notes])
+                    indexed += batch_indexed
+                    removed += batch_removed
+        except Exception as e:
+            self._log(f"Watch: indexing failed ({type(e).__name__}: {e})")
+            return
+        if indexed or removed:
+            self._log(f"Watch: {indexed} notes re-indexed, {removed} removed "
+                      f"in {time.perf_counter() - start_time:.2f}s")
+
+    def _sync_batch(self, names):
+        with self._locked():
+            stale, vanished, touched = indexerAPI.plan_sync(names)
+            indexerAPI.drop_notes(vanished)
+            existing = {name: indexerAPI.store.chunk_ids(name) for name in stale}
+            if not stale:
+                if touched or vanished:
+                    indexerAPI.manifest.save()
+                return 0, len(vanished)
+
+        # Reading and embedding the notes only needs the model
+        records, items, stale_ids, reused = indexerAPI.embed_note_pool(stale, existing)
+
+        with self._locked():
+            # Another command may have re-indexed some of these notes meanwhile;
+            # everything that is not part of this version of them is dropped
+            keep = {chunk_id for ids in existing.values() for chunk_id in ids} - set(stale_ids)
+            keep.update(chunk_id for chunk_id, _ in items)
+            stale_ids = [chunk_id for name in stale for chunk_id in indexerAPI.store.chunk_ids(name)
+                         if chunk_id not in keep]
+            indexerAPI.write_note_pool(records, items, stale_ids, reused, indexerAPI.engine.fingerprint())
+            indexerAPI.manifest.save()
+        return len(stale), len(vanished)
+
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def start_watching(debounce=WATCH_DEBOUNCE_SECONDS, poll=False, lock=None):
+    """
+    Starts a NoteWatcher in a background thread of this process (the daemon),
+    unless one is already running.
+    """
+    global _watcher
+    with _watcher_lock:
+        if _watcher is not None and not _watcher.stop_event.is_set():
+            return {'directory': _watcher.directory, 'backend': _watcher.changes.backend, 'started': False}
+        _watcher = NoteWatcher(debounce=debounce, backend="poll" if poll else WATCH_BACKEND, lock=lock)
+        threading.Thread(target=_watcher.run, name="note-watcher", daemon=True).start()
+        return {'directory': _watcher.directory, 'backend': _watcher.changes.backend, 'started': True}
+
+
+def watch(debounce=WATCH_DEBOUNCE_SECONDS, poll=False):
+    """
+    Loads the model and indexes changes to NOTES_DIRECTORY in this process
+    until interrupted.
+    """
+    watcher = NoteWatcher(debounce=debounce, backend="poll" if poll else WATCH_BACKEND)
+    indexerAPI.engine.model
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
@@ -0,0 +1,187 @@
+import os
+import re
+import time
+import sqlite3
+import string
+import threading
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+
+from metrics import count
+
+# Entries kept per in-memory tier
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 10000))
+
+# Optional SQLite file backing an on-disk tier (unset or empty keeps the cache in memory only)
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "")
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_query(query):
+    """
+    Normalizes a raw query for use as a cache key.
+
+    Case is folded, punctuation (ASCII and Unicode) is dropped and runs of
+    whitespace are collapsed, so "Ravi  doctor?" and "ravi doctor" share an entry.
+    """
+    query = query.casefold()
+    query = ''.join(
+        ' ' if char in string.punctuation or unicodedata.category(char).startswith('P') else char
+        for char in query
+    )
+    return _WHITESPACE.sub(' ', query).strip()
+
+
+class _LRU:
+    """
+    Small ordered-dict LRU storing (value, cost in seconds) pairs.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+class QueryCache:
+    """
+    Caches the two expensive steps of a query: transliteration and embedding.
+
+    Raw queries are normalized and mapped to their processed text, and processed
+    text is mapped to its embedding, so two differently typed queries that
+    transliterate alike also share the embedding. Both maps have an in-memory
+    LRU and, when `path` is set, a SQLite tier. Everything is tied to a
+    fingerprint of the model and transliteration pipeline, and the cache is
+    cleared when that changes.
+    """
+
+    def __init__(self, fingerprint, max_size=QUERY_CACHE_SIZE, path=QUERY_CACHE_PATH):
+        self.fingerprint = fingerprint
+        self.path = path
+        self._processed = _LRU(max_size)
+        self._embeddings = _LRU(max_size)
+        self._connection = None
+        self._lock = threading.Lock()
+        self.hits = {'processed': 0, 'embedding': 0}
+        self.misses = {'processed': 0, 'embedding': 0}
+        self.seconds_saved = 0.0
+
+    # Open the on-disk tier, clearing it if it was built for another fingerprint
+    def _disk(self):
+        if self._connection is None and self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            connection.execute("CREATE TABLE IF NOT EXISTS processed "
+                               "(query TEXT PRIMARY KEY, text TEXT NOT NULL, cost REAL NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS embeddings "
+                               "(text TEXT PRIMARY KEY, embedding BLOB NOT NULL, cost REAL NOT NULL)")
+            row = connection.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+            if row is None or row[0] != self.fingerprint:
+                with connection:
+                    connection.execute("DELETE FROM processed")
+                    connection.execute("DELETE FROM embeddings")
+                    connection.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (self.fingerprint,))
+            self._connection = connection
+        return self._connection
+
+    def processed(self, query, compute):
+        """
+        Returns the processed text for a raw query, calling compute(query) on a miss.
+        """
+        return self.processed_many([query], lambda queries: [compute(query) for query in queries])[0]
+
+    def processed_many(self, queries, compute_many):
+        """
+        Returns the processed text for several raw queries, calling
+        compute_many(missing_queries) once for all the misses.
+        """
+        originals = dict(zip(map(normalize_query, queries), queries))
+        return self._cached_many('processed', self._processed, list(map(normalize_query, queries)),
+                                 lambda keys: compute_many([originals[key] for key in keys]),
+                                 "SELECT text, cost FROM processed WHERE query = ?",
+                                 "INSERT OR REPLACE INTO processed VALUES (?, ?, ?)",
+                                 encode=lambda text: text, decode=lambda text: text)
+
+    def embedding(self, processed_text, compute):
+        """
+        Returns the embedding for processed text, calling compute(processed_text) on a miss.
+        """
+        return self.embeddings_many([processed_text], lambda texts: [compute(text) for text in texts])[0]
+
+    def embeddings_many(self, processed_texts, compute_many):
+        """
+        Returns the embeddings for several processed texts, calling
+        compute_many(missing_texts) once for all the misses.
+        """
+        return self._cached_many('embedding', self._embeddings, list(processed_texts), compute_many,
+                                 "SELECT embedding, cost FROM embeddings WHERE text = ?",
+                                 "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                                 encode=lambda embedding: np.asarray(embedding, dtype=np.float32).tobytes(),
+                                 decode=lambda blob: np.frombuffer(blob, dtype=np.float32).reshape(1, -1))
+
+    def _cached_many(self, kind, memory, keys, compute_many, select_sql, insert_sql, encode, decode):
+        values = {}
+        with self._lock:
+            connection = self._disk()
+            for key in dict.fromkeys(keys):
+                entry = memory.get(key)
+                if entry is None and connection is not None:
+                    row = connection.execute(select_sql, (key,)).fetchone()
+                    if row is not None:
+                        entry = (decode(row[0]), row[1])
+                        memory.put(key, entry)
+                if entry is not None:
+                    self.hits[kind] += 1
+                    count(f'query_cache_{kind}_hits')
+                    self.seconds_saved += entry[1]
+                    values[key] = entry[0]
+
+        missing = [key for key in dict.fromkeys(keys) if key not in values]
+        if missing:
+            # Compute outside the lock so concurrent misses do not queue behind
+            # each other; a batch's cost is shared evenly between its entries
+            start_time = time.perf_counter()
+            computed = list(compute_many(missing))
+            cost = (time.perf_counter() - start_time) / len(missing)
+
+            count(f'query_cache_{kind}_misses', len(missing))
+            with self._lock:
+                self.misses[kind] += len(missing)
+                for key, value in zip(missing, computed):
+                    memory.put(key, (value, cost))
+                    values[key] = value
+                connection = self._disk()
+                if connection is not None:
+                    with connection:
+                        connection.executemany(insert_sql, [(key, encode(values[key]), cost) for key in missing])
+        return [values[key] for key in keys]
+
+    def stats(self):
+        """
+        Returns hit/miss counters, hit rates and the compute time saved by hits.
+        """
+        stats = {}
+        for kind in ('processed', 'embedding'):
+            lookups = self.hits[kind] + self.misses[kind]
+            stats[kind] = {
+                'hits': self.hits[kind],
+                'misses': self.misses[kind],
+                'hit_rate': self.hits[kind] / lookups if lookups else 0.0,
+            }
+        stats['seconds_saved'] = self.seconds_saved
+        return stats
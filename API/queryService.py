@@ -0,0 +1,139 @@
+import os
+import asyncio
+import threading
+import contextlib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# How long the service waits for more queries after the first one of a batch,
+# and the most queries it answers with one model call
+QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", 5))
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", 32))
+
+
+class BatchingQueryService:
+    """
+    asyncio front end that answers concurrent queries in micro-batches.
+
+    Queries that arrive within `window_ms` of the first one in a batch (up to
+    `max_batch` of them) are handed to `find_many` together, so they share one
+    batched tokenizer + model call and one scan of the embedding matrix instead
+    of one forward pass and one scan each. Each caller gets its own results.
+
+    `find_many(queries, k, exact, nprobe)` runs in a worker thread while holding
+    `lock` (if given), so the event loop stays responsive and batches never
+    overlap with writes guarded by the same lock.
+    """
+
+    def __init__(self, find_many, window_ms=QUERY_BATCH_WINDOW_MS, max_batch=QUERY_BATCH_SIZE, lock=None):
+        self.find_many = find_many
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.lock = lock
+        self.batches = 0
+        self.queries = 0
+        self._queue = None
+        self._task = None
+        self._loop = None
+
+    async def start(self):
+        """
+        Starts collecting queries on the running event loop.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops the batching task.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def find(self, query, k=3, exact=False, nprobe=None):
+        """
+        Queues a query and waits for its results, as retrievalAPI.find would return them.
+        """
+        future = self._loop.create_future()
+        await self._queue.put((query, k, exact, nprobe, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._dispatch(batch)
+
+    async def _dispatch(self, batch):
+        # Queries with different search options cannot share a scan; each group
+        # is scored for its largest k and every caller keeps its own top k
+        groups = {}
+        for request in batch:
+            groups.setdefault((request[2], request[3]), []).append(request)
+
+        for (exact, nprobe), requests in groups.items():
+            queries = [request[0] for request in requests]
+            k = max(request[1] for request in requests)
+            try:
+                results = await self._loop.run_in_executor(None, self._find_locked, queries, k, exact, nprobe)
+            except Exception as e:
+                for request in requests:
+                    if not request[4].done():
+                        request[4].set_exception(e)
+                continue
+            for request, result in zip(requests, results):
+                if not request[4].done():
+                    request[4].set_result(result[:request[1]])
+
+        self.batches += 1
+        self.queries += len(batch)
+
+    def _find_locked(self, queries, k, exact, nprobe):
+        with self.lock if self.lock is not None else contextlib.nullcontext():
+            return self.find_many(queries, k=k, exact=exact, nprobe=nprobe)
+
+    def run_in_thread(self):
+        """
+        Starts the service on an event loop in a background thread, for callers
+        that are not themselves asynchronous (see find_blocking).
+        """
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, name="query-batcher", daemon=True).start()
+        started.wait()
+
+    def find_blocking(self, query, k=3, exact=False, nprobe=None):
+        """
+        Thread-safe, blocking version of find() for a service started with run_in_thread().
+        """
+        return asyncio.run_coroutine_threadsafe(self.find(query, k, exact, nprobe), self._loop).result()
+
+    def stats(self):
+        """
+        Returns the number of batches run and the average batch size.
+        """
+        return {
+            'batches': self.batches,
+            'queries': self.queries,
+            'mean_batch_size': self.queries / self.batches if self.batches else 0.0,
+        }
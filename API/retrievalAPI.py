@@ -1,95 +1,170 @@
 from dotenv import load_dotenv
 import os
-import torch
 import numpy as np
-from transformers import BertTokenizer, BertModel
-from sklearn.metrics.pairwise import cosine_similarity
 
 import sys
 sys.path.append(os.path.abspath('../API/inputProcesser'))
 
 
 # Now import the function
-from TenglishFormatter import process_user_input
-
-# Set random seed for reproducibility
-random_seed = 42
-torch.manual_seed(random_seed)
-if torch.cuda.is_available():
-    torch.cuda.manual_seed(random_seed)
-
-# Initialize the multilingual tokenizer and model
-tokenizer = BertTokenizer.from_pretrained('bert-base-multilingual-cased')
-model = BertModel.from_pretrained('bert-base-multilingual-cased')
+from TenglishFormatter import process_user_input, process_user_inputs, pipeline_fingerprint
+from translit_cache import cache_stats as translit_cache_stats
+from embeddingStore import note_of
+from annIndex import IVFIndex, measure_recall
+from compressedIndex import CompressedIndex
+from sqliteStore import open_note_db
+from shardedStore import open_embedding_store
+from lexicalIndex import LexicalIndex, LEXICAL_INDEX, LEXICAL_CANDIDATES
+from embeddingEngine import get_engine, compute_embedding
+from queryCache import QueryCache
+from metrics import span, count
 
 load_dotenv()
 NOTES_DIRECTORY = os.getenv("NOTES_DIRECTORY")
 EMBEDDINGS_DIRECTORY = os.getenv("EMBEDDINGS_DIRECTORY")
-# Path where embeddings are stored
 
+# Consolidated store holding every embedding in one memory-mapped matrix (or
+# SHARDS such stores searched in parallel), or the SQLite database holding
+# notes and embeddings (STORAGE_BACKEND=sqlite)
+note_db = open_note_db(EMBEDDINGS_DIRECTORY)
+store = note_db if note_db is not None else open_embedding_store(EMBEDDINGS_DIRECTORY)
 
-# Function to compute the embedding of a document or query
-def compute_embedding(text):
-    # Tokenize and encode the text
-    encoding = tokenizer.batch_encode_plus(
-        [text],
-        padding=True,
-        truncation=True,
-        return_tensors='pt',
-        add_special_tokens=True
-    )
+# Optional approximate nearest-neighbour index (ANN_INDEX=ivf in the .env file)
+ANN_INDEX = os.getenv("ANN_INDEX", "").lower()
+ann_index = IVFIndex(store) if ANN_INDEX == "ivf" else None
 
-    input_ids = encoding['input_ids']
-    attention_mask = encoding['attention_mask']
+# Optional compressed first-pass tier with full-precision re-ranking
+# (COMPRESSED_INDEX=on in the .env file)
+COMPRESSED_INDEX = os.getenv("COMPRESSED_INDEX", "").lower() in ("1", "on", "true")
+compressed_index = CompressedIndex(store) if COMPRESSED_INDEX else None
 
-    # Generate embeddings
-    with torch.no_grad():
-        outputs = model(input_ids, attention_mask=attention_mask)
-        embeddings = outputs.last_hidden_state.mean(dim=1)  # Average pooling along sequence length
+# Optional BM25 index used to prefilter or fuse candidates before dense scoring
+# (LEXICAL_INDEX=prefilter or fuse in the .env file)
+lexical_index = LexicalIndex(EMBEDDINGS_DIRECTORY) if LEXICAL_INDEX else None
 
-    return embeddings.numpy()
+# Rank offset of reciprocal rank fusion: a note's fused score is the sum of
+# 1 / (RRF_K + rank) over the dense and BM25 rankings
+RRF_K = 60
 
-# Function to load embeddings from the .npy files
-def load_embeddings():
-    embeddings = {}
-    
-    # Iterate through all the files in the embeddings directory
-    for filename in os.listdir(EMBEDDINGS_DIRECTORY):
-        if filename.endswith('_embedding.npy'):
-            file_path = os.path.join(EMBEDDINGS_DIRECTORY, filename)
-            document_name = filename.replace('_embedding.npy', '')
-            
-            # Load the embedding and store it
-            embeddings[document_name] = np.load(file_path)
-
-    return embeddings
-
-# Function to find the top 3 most similar documents based on a query
-def find(query):
-    
-    processed_query = process_user_input(query)
-    
-    # Step 2: Compute the embedding for the processed query
-    query_embedding = compute_embedding(processed_query)
-    
-    # Step 2: Load all pre-computed embeddings
-    document_embeddings = load_embeddings()
+# Cache of processed queries and query embedding, invalidated when the model or
+# the transliteration pipeline (version, tables or English vocabulary) change
+query_cache = QueryCache(f"{get_engine().fingerprint()}|{pipeline_fingerprint()}")
+
+# Chunks fetched per requested note before aggregating chunk scores per note
+CHUNK_OVERSAMPLE = int(os.getenv("CHUNK_OVERSAMPLE", 4))
+
+
+# Function to find the k best notes by scoring their chunks and keeping each
+# note's best chunk score; with the lexical index on (and not exact), the
+# processed query text narrows or fuses the candidates first
+def search_notes(query_embedding, k, exact=False, nprobe=None, query_text=None):
+    if lexical_index is not None and query_text is not None and not exact:
+        if LEXICAL_INDEX == "prefilter":
+            candidates = lexical_index.search(query_text, max(LEXICAL_CANDIDATES, k))
+            count('lexical_candidates', len(candidates))
+            # Queries without enough matching terms fall back to dense search
+            if len(candidates) >= k:
+                best = score_notes(query_embedding, [note for note, _ in candidates])
+                return sorted(best.items(), key=lambda item: -item[1])[:k]
+        else:
+            return fuse_rankings(query_embedding, query_text, k, nprobe)
+    return dense_search(query_embedding, k, exact=exact, nprobe=nprobe)
 
-    # Step 3: Calculate cosine similarity between the query and all documents
-    similarity_scores = {}
-    for doc_name, doc_embedding in document_embeddings.items():
-        similarity = cosine_similarity(doc_embedding, query_embedding)[0][0]
-        similarity_scores[doc_name] = similarity
+# Function to score only the chunks of the given notes, returning each note's
+# best cosine similarity
+def score_notes(query_embedding, notes):
+    chunk_ids = [chunk_id for note in notes for chunk_id in store.chunk_ids(note)]
+    return best_per_note(store.search_among(query_embedding, chunk_ids))
 
-    # Step 4: Sort the documents by similarity scores in descending order
-    sorted_docs = sorted(similarity_scores.items(), key=lambda item: item[1], reverse=True)
+# Function to merge the dense and BM25 rankings by reciprocal rank fusion; each
+# note keeps its cosine similarity as its score, ordered by the fused rank
+def fuse_rankings(query_embedding, query_text, k, nprobe=None):
+    depth = k * CHUNK_OVERSAMPLE
+    dense = dense_search(query_embedding, depth, nprobe=nprobe)
+    lexical = lexical_index.search(query_text, depth)
+    count('lexical_candidates', len(lexical))
 
-    # Step 5: Retrieve the top 3 matching documents
-    top_3_docs = sorted_docs[:3]
+    fused = {}
+    for ranking in (dense, lexical):
+        for rank, (note, _) in enumerate(ranking):
+            fused[note] = fused.get(note, 0.0) + 1 / (RRF_K + rank + 1)
+    top = sorted(fused, key=lambda note: -fused[note])[:k]
 
-    # Step 6: Retrieve the content of the top 3 documents
+    similarities = dict(dense)
+    missing = [note for note in top if note not in similarities]
+    similarities.update(score_notes(query_embedding, missing) if missing else {})
+    return [(note, similarities[note]) for note in top if note in similarities]
+
+# Function to rank notes by dense scoring alone
+def dense_search(query_embedding, k, exact=False, nprobe=None):
+    use_ann = ann_index is not None and not exact
+    if use_ann:
+        ann_index.refresh()
+    use_compressed = compressed_index is not None and not exact
+    if use_compressed:
+        compressed_index.refresh()
+
+    fetch = k * CHUNK_OVERSAMPLE
+    while True:
+        if use_ann and ann_index.trained:
+            hits = ann_index.search(query_embedding, fetch, nprobe=nprobe)
+        elif use_compressed and compressed_index.trained:
+            hits = compressed_index.search(query_embedding, fetch)
+        else:
+            hits = store.search(query_embedding, fetch)
+
+        # Fetch more chunks if several of the top ones came from the same notes
+        best = best_per_note(hits)
+        if len(best) >= k or len(hits) < fetch:
+            return list(best.items())[:k]
+        fetch *= 2
+
+# Function to keep each note's best chunk score; hits are sorted best first, so
+# the first chunk seen for a note is its best
+def best_per_note(hits):
+    best = {}
+    for chunk_id, similarity in hits:
+        best.setdefault(note_of(chunk_id), similarity)
+    return best
+
+# Function to run search_notes for several query embeddings, scanning the
+# matrix once for all of them when no ANN, compressed or lexical index is in use
+def search_notes_many(query_embeddings, k, exact=False, nprobe=None, query_texts=None):
+    if lexical_index is not None and query_texts is not None and not exact:
+        return [search_notes(query_embedding, k, nprobe=nprobe, query_text=query_text)
+                for query_embedding, query_text in zip(query_embeddings, query_texts)]
+    if not exact:
+        for index in (ann_index, compressed_index):
+            if index is not None:
+                index.refresh()
+    uses_index = not exact and ((ann_index is not None and ann_index.trained) or
+                                (compressed_index is not None and compressed_index.trained))
+    if uses_index:
+        return [dense_search(query_embedding, k, exact=exact, nprobe=nprobe) for query_embedding in query_embeddings]
+
+    fetch = k * CHUNK_OVERSAMPLE
     results = []
-    for doc_name, similarity in top_3_docs:
+    for query_embedding, hits in zip(query_embeddings, store.search_many(query_embeddings, fetch)):
+        best = best_per_note(hits)
+        if len(best) >= k or len(hits) < fetch:
+            results.append(list(best.items())[:k])
+        else:
+            # Rare: too many of the top chunks share notes, so widen this query alone
+            results.append(dense_search(query_embedding, k, exact=exact, nprobe=nprobe))
+    return results
+
+# Function to read the content of the notes found for a query
+def read_results(top_k_docs):
+    results = []
+    for doc_name, similarity in top_k_docs:
+        if note_db is not None:
+            content = note_db.note_text(doc_name)
+            if content is not None:
+                results.append((doc_name, similarity, content))
+            else:
+                print(f"Note '{doc_name}' not found.")
+            continue
+
         # Read the document content from the corresponding note file
         note_path = os.path.join(NOTES_DIRECTORY, f"{doc_name}.txt")
         if os.path.exists(note_path):
@@ -98,9 +173,92 @@ def find(query):
                 results.append((doc_name, similarity, content))
         else:
             print(f"Note file for '{doc_name}' not found.")
+    count('notes_returned', len(results))
+    return results
+
+# Function to find the top k most similar documents based on a query
+# (exact=True bypasses the ANN and compressed indexes; nprobe overrides the ANN
+# index's recall/latency knob)
+def find(query, k=3, exact=False, nprobe=None):
+    
+    # Step 1: Transliterate the query (cached on the normalized query text)
+    with span('transliteration'):
+        processed_query = query_cache.processed(query, process_user_input)
+    
+    # Step 2: Compute the embedding for the processed query (cached on the processed text)
+    with span('query_embedding'):
+        query_embedding = query_cache.embedding(processed_query, compute_embedding)
+    
+    # Step 3: Pick up notes indexed by other processes since the last query
+    with span('load_embeddings'):
+        store.refresh()
+        if lexical_index is not None:
+            lexical_index.refresh()
+
+    # Step 4: Score the query against the normalized chunk matrix, either
+    # through the ANN index, through the compressed tier with re-ranking, or
+    # block by block (optionally only for the notes the BM25 index picked),
+    # and aggregate the scores per note
+    with span('scoring'):
+        top_k_docs = search_notes(query_embedding, k, exact=exact, nprobe=nprobe, query_text=processed_query)
+
+    # Step 5: Retrieve the content of the top k documents
+    with span('read_notes'):
+        results = read_results(top_k_docs)
     
     return results
 
+# Function to answer several queries at once: the uncached queries are
+# transliterated together, embedded in one batched forward pass and scored in
+# one scan of the matrix
+def find_many(queries, k=3, exact=False, nprobe=None):
+    queries = list(queries)
+    if not queries:
+        return []
+
+    with span('transliteration'):
+        processed_queries = query_cache.processed_many(queries, process_user_inputs)
+
+    with span('query_embedding'):
+        query_embeddings = query_cache.embeddings_many(
+            processed_queries, lambda texts: [row.reshape(1, -1) for row in get_engine().compute_embeddings(texts)])
+
+    with span('load_embeddings'):
+        store.refresh()
+        if lexical_index is not None:
+            lexical_index.refresh()
+
+    with span('scoring'):
+        top_k_docs = search_notes_many(np.vstack(query_embeddings), k, exact=exact, nprobe=nprobe,
+                                       query_texts=processed_queries)
+
+    with span('read_notes'):
+        return [read_results(docs) for docs in top_k_docs]
+
+# Function to measure how many of the exact top k results the ANN index returns
+def ann_recall(k=10, queries=100, nprobe=None):
+    if ann_index is None:
+        raise ValueError("ANN_INDEX is not enabled in the .env file")
+    store.refresh()
+    ann_index.refresh()
+    return measure_recall(store, ann_index, k=k, queries=queries, nprobe=nprobe)
+
+# Function to measure recall@k of the compressed tier against exact search, both
+# for its first pass alone and after re-ranking the shortlist
+def compressed_recall(k=10, queries=100, shortlist=None):
+    if compressed_index is None:
+        raise ValueError("COMPRESSED_INDEX is not enabled in the .env file")
+    store.refresh()
+    compressed_index.refresh()
+    return {
+        'first_pass': measure_recall(store, compressed_index, k=k, queries=queries, shortlist=k),
+        'reranked': measure_recall(store, compressed_index, k=k, queries=queries, shortlist=shortlist),
+    }
+
+# Function to report the query and transliteration cache counters
+def cache_stats():
+    return {'query': query_cache.stats(), 'transliteration': translit_cache_stats()}
+
 # Example usage
 if __name__ == "__main__":
     query_text = "Ravi doctor అవ్వాలని అనుకున్నాడు, కానీ Arun?"
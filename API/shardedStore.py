@@ -0,0 +1,329 @@
+import os
+import re
+import json
+import heapq
+import shutil
+import hashlib
+import itertools
+import multiprocessing
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from embeddingStore import EmbeddingStore, MATRIX_FILE, MANIFEST_FILE, note_of
+
+load_dotenv()
+
+# Number of shards the embeddings are split into (0 or 1 keeps one store), and
+# optionally the host:port of a shard server per shard (see serve_shard); without
+# addresses every shard is searched in this process
+SHARDS = int(os.getenv("SHARDS", 0))
+SHARD_ADDRESSES = [address.strip() for address in os.getenv("SHARD_ADDRESSES", "").split(",") if address.strip()]
+
+# File inside EMBEDDINGS_DIRECTORY recording how many shards it holds
+SHARD_LAYOUT_FILE = "shards.json"
+
+# Entries copied per write while rebalancing
+REBALANCE_BLOCK_ROWS = 50000
+
+
+def shard_of(note, shards):
+    """
+    Returns the shard a note belongs to; the hash does not depend on the
+    process, so every process and host agrees on it.
+    """
+    return int(hashlib.sha1(note.encode('utf-8')).hexdigest()[:8], 16) % shards
+
+
+def shard_directory(directory, shard):
+    return os.path.join(directory, f"shard_{shard:02d}")
+
+
+def read_layout(directory):
+    """
+    Returns the number of shards in `directory` (1 for a single store, 0 if it is empty).
+    """
+    layout_path = os.path.join(directory, SHARD_LAYOUT_FILE)
+    if os.path.exists(layout_path):
+        with open(layout_path, 'r', encoding='utf-8') as file:
+            return json.load(file)['shards']
+    return 1 if os.path.exists(os.path.join(directory, MANIFEST_FILE)) else 0
+
+
+def write_layout(directory, shards):
+    layout_path = os.path.join(directory, SHARD_LAYOUT_FILE)
+    tmp_path = layout_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump({'shards': shards}, file)
+    os.replace(tmp_path, layout_path)
+
+
+def open_embedding_store(directory, shards=SHARDS, addresses=SHARD_ADDRESSES):
+    """
+    Opens the embedding store of `directory`: a single EmbeddingStore, or a
+    ShardedStore when SHARDS is above 1.
+    """
+    shards = max(shards, 1)
+    layout = read_layout(directory)
+    if layout and layout != shards:
+        raise ValueError(f"EMBEDDINGS_DIRECTORY holds {layout} shard(s) but SHARDS is {shards}; "
+                         f"run `rebalance --shards {shards}` first")
+    if shards == 1:
+        return EmbeddingStore(directory)
+    if addresses and len(addresses) != shards:
+        raise ValueError(f"SHARD_ADDRESSES lists {len(addresses)} servers for {shards} shards")
+    if not layout:
+        os.makedirs(directory, exist_ok=True)
+        write_layout(directory, shards)
+    return ShardedStore(directory, shards, addresses)
+
+
+def merge_hits(hit_lists, k):
+    """
+    Merges per-shard (name, score) lists into the overall top k, best first.
+    """
+    return heapq.nlargest(k, itertools.chain.from_iterable(hit_lists), key=lambda hit: hit[1])
+
+
+class RemoteShard:
+    """
+    Search-only client for a shard loaded by serve_shard in another process
+    (or on another host). The server refreshes its store before every search.
+    """
+
+    def __init__(self, address):
+        self.host, port = address.rsplit(':', 1)
+        self.port = int(port)
+
+    def refresh(self):
+        pass
+
+    def _call(self, command, **params):
+        from daemonAPI import call
+
+        return call(command, params, host=self.host, port=self.port)
+
+    def search_many(self, query_vectors, k):
+        results = self._call('search_many', query_vectors=np.asarray(query_vectors, dtype=np.float32).tolist(), k=k)
+        return [[tuple(hit) for hit in hits] for hits in results]
+
+    def search(self, query_vector, k):
+        return self.search_many(np.asarray(query_vector).reshape(1, -1), k)[0]
+
+    def search_among(self, query_vector, names):
+        return [tuple(hit) for hit in self._call('search_among', query_vector=np.asarray(query_vector).reshape(-1).tolist(),
+                                                  names=list(names))]
+
+
+class ShardedStore:
+    """
+    Splits the embeddings into `shards` EmbeddingStores by a stable hash of the
+    note name, so all chunks of a note live in the same shard.
+
+    Writes go to the shard directories (shard_00, shard_01, ... inside
+    EMBEDDINGS_DIRECTORY). Searches fan out to every shard in parallel, either
+    to the local stores (their matrix scans release the GIL) or to shard servers
+    given by `addresses`, and the per-shard top k lists are merged. It offers
+    the same interface as EmbeddingStore for the indexer and find.
+    """
+
+    def __init__(self, directory, shards, addresses=()):
+        self.directory = directory
+        self.matrix_path = os.path.join(directory, "shard_*", MATRIX_FILE)
+        self.shards = [EmbeddingStore(shard_directory(directory, shard)) for shard in range(shards)]
+        self.searchers = [RemoteShard(address) for address in addresses] if addresses else self.shards
+        self._executor = ThreadPoolExecutor(max_workers=shards, thread_name_prefix="shard-search")
+
+    def shard_for(self, name):
+        return self.shards[shard_of(note_of(name), len(self.shards))]
+
+    @property
+    def dim(self):
+        return next((shard.dim for shard in self.shards if shard.dim is not None), None)
+
+    @property
+    def version(self):
+        return sum(shard.version for shard in self.shards)
+
+    def refresh(self):
+        for shard in self.shards:
+            shard.refresh()
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def __contains__(self, name):
+        return name in self.shard_for(name)
+
+    def names(self):
+        return [name for shard in self.shards for name in shard.names()]
+
+    def note_names(self):
+        return [note for shard in self.shards for note in shard.note_names()]
+
+    def chunk_ids(self, note):
+        return self.shards[shard_of(note, len(self.shards))].chunk_ids(note)
+
+    def get(self, name):
+        return self.shard_for(name).get(name)
+
+    def tombstones(self):
+        return sum(shard.tombstones() for shard in self.shards)
+
+    def _group(self, names):
+        groups = {}
+        for name in names:
+            groups.setdefault(shard_of(note_of(name), len(self.shards)), []).append(name)
+        return groups
+
+    def add_many(self, items):
+        """
+        Stores (name, vector) pairs, one write per shard touched.
+        """
+        groups = {}
+        for name, vector in items:
+            groups.setdefault(shard_of(note_of(name), len(self.shards)), []).append((name, vector))
+        for shard, shard_items in groups.items():
+            self.shards[shard].add_many(shard_items)
+
+    def delete_many(self, names):
+        """
+        Tombstones entries, one manifest update per shard touched.
+
+        Returns:
+            int: Number of entries that were actually deleted.
+        """
+        return sum(self.shards[shard].delete_many(shard_names) for shard, shard_names in self._group(names).items())
+
+    def search(self, query_vector, k):
+        """
+        Returns the k entries most similar to `query_vector` over all shards.
+        """
+        return self.search_many(np.asarray(query_vector).reshape(1, -1), k)[0]
+
+    def search_many(self, query_vectors, k):
+        """
+        Sends every query to every shard at once and merges each query's results.
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32).reshape(len(query_vectors), -1)
+        per_shard = list(self._executor.map(lambda searcher: searcher.search_many(query_vectors, k), self.searchers))
+        return [merge_hits([hits[query] for hits in per_shard], k) for query in range(query_vectors.shape[0])]
+
+    def search_among(self, query_vector, names):
+        """
+        Scores `query_vector` against the given entries only, asking just the shards that hold them.
+        """
+        groups = self._group(names)
+        per_shard = self._executor.map(lambda shard: self.searchers[shard].search_among(query_vector, groups[shard]),
+                                       list(groups))
+        return merge_hits(list(per_shard), len(names))
+
+
+def rebalance(shards, directory=None):
+    """
+    Moves every entry of `directory` (EMBEDDINGS_DIRECTORY by default) to the shard its note hashes to under
+    `shards` shards (1 turns a sharded store back into a single one).
+
+    Entries are written to their new shard before being deleted from the old
+    one, so an interrupted rebalance loses nothing; running it again finishes it.
+
+    Returns:
+        int: Number of entries moved.
+    """
+    directory = directory or os.getenv("EMBEDDINGS_DIRECTORY")
+    shards = max(shards, 1)
+    if shards == 1:
+        target_dirs = [directory]
+    else:
+        target_dirs = [shard_directory(directory, shard) for shard in range(shards)]
+
+    # Entries may sit in the single store or in any shard directory, including
+    # ones left over from a larger shard count or an interrupted rebalance
+    source_dirs = [directory] + sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                                       if re.fullmatch(r"shard_\d+", name))
+    stores = {path: EmbeddingStore(path) for path in dict.fromkeys(source_dirs + target_dirs)}
+
+    moved = 0
+    for source_dir in source_dirs:
+        source = stores[source_dir]
+        moves = {}
+        for name in source.names():
+            target_dir = target_dirs[shard_of(note_of(name), shards) if shards > 1 else 0]
+            if target_dir != source_dir:
+                moves.setdefault(target_dir, []).append(name)
+        for target_dir, names in moves.items():
+            for start in range(0, len(names), REBALANCE_BLOCK_ROWS):
+                block = names[start:start + REBALANCE_BLOCK_ROWS]
+                matrix = source.matrix()
+                stores[target_dir].add_many((name, matrix[source.rows[name]]) for name in block)
+                source.delete_many(block)
+                moved += len(block)
+
+    # Everything outside the target directories has been moved out
+    for source_dir in source_dirs:
+        if source_dir in target_dirs:
+            continue
+        if source_dir == directory:
+            for path in (os.path.join(directory, MATRIX_FILE), os.path.join(directory, MANIFEST_FILE)):
+                if os.path.exists(path):
+                    os.remove(path)
+        else:
+            shutil.rmtree(source_dir)
+    write_layout(directory, shards)
+
+    print(f"Moved {moved} entries into {shards} shard(s); restart any daemon or shard servers with SHARDS={shards}")
+    return moved
+
+
+def serve_shard(shard, host, port, directory=None):
+    """
+    Loads one shard and answers search requests for it on host:port until
+    interrupted (point SHARD_ADDRESSES at these servers).
+    """
+    from daemonAPI import DaemonHandler, DaemonServer, daemon_token
+
+    directory = directory or os.getenv("EMBEDDINGS_DIRECTORY")
+    store = EmbeddingStore(shard_directory(directory, shard))
+
+    def search_many(query_vectors, k):
+        store.refresh()
+        return store.search_many(np.asarray(query_vectors, dtype=np.float32), k)
+
+    def search_among(query_vector, names):
+        store.refresh()
+        return store.search_among(np.asarray(query_vector, dtype=np.float32), names)
+
+    def stats():
+        store.refresh()
+        return {'shard': shard, 'chunks': len(store), 'tombstones': store.tombstones()}
+
+    # Shard servers share the daemon's token file (copy it to other hosts)
+    DaemonHandler.token = daemon_token(directory, create=True)
+    DaemonHandler.commands = {'search_many': search_many, 'search_among': search_among, 'stats': stats}
+    server = DaemonServer((host, port), DaemonHandler)
+    print(f"Shard {shard} ({len(store)} chunks) listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def serve_shards(host, base_port, shards=SHARDS, directory=None):
+    """
+    Starts one shard server process per shard on consecutive ports, for
+    running a sharded setup on one machine; returns when they are interrupted.
+    """
+    processes = [multiprocessing.Process(target=serve_shard, args=(shard, host, base_port + shard, directory))
+                 for shard in range(shards)]
+    for process in processes:
+        process.start()
+    addresses = ",".join(f"{host}:{base_port + shard}" for shard in range(shards))
+    print(f"Set SHARD_ADDRESSES={addresses} to search these servers")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
@@ -0,0 +1,275 @@
+import os
+import time
+import sqlite3
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+from embeddingStore import normalize_rows, note_of, top_k_rows, top_k_rows_many, SCORE_BLOCK_ROWS
+
+load_dotenv()
+
+# Where notes and embeddings live: "files" (NOTES_DIRECTORY plus the embedding
+# store) or "sqlite" (one database, SQLITE_PATH or notes.sqlite3 inside
+# EMBEDDINGS_DIRECTORY)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "files").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "")
+SQLITE_FILE = "notes.sqlite3"
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS notes (name TEXT PRIMARY KEY, text TEXT NOT NULL DEFAULT '', "
+    "processed TEXT NOT NULL DEFAULT '', updated REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, "
+    "note TEXT NOT NULL REFERENCES notes(name) ON DELETE CASCADE, embedding BLOB NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS chunks_note ON chunks(note)",
+]
+
+
+class SQLiteNoteStore:
+    """
+    Keeps note text, processed text and chunk embeddings in one SQLite database.
+
+    A note and its chunks are written in a single transaction, so an edit and
+    its re-embedding either both land or neither does. The database runs in WAL
+    mode so queries are not blocked by a writer, and statements are reused
+    through sqlite3's statement cache with bulk inserts via executemany.
+
+    For searching it offers the same read interface as EmbeddingStore
+    (refresh, search, search_many, names, chunk_ids, ...): the embeddings are
+    loaded into one normalized in-memory matrix, reloaded whenever this or
+    another connection has changed the database.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, cached_statements=256)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("PRAGMA foreign_keys=ON")
+        with self._connection:
+            for statement in SCHEMA:
+                self._connection.execute(statement)
+
+        self.dim = None
+        self.ids = []
+        self.rows = {}
+        self.version = 0
+        self._matrix = None
+        self._data_version = None
+        self._dirty = True
+
+    # Notes
+
+    def has_note(self, name):
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM notes WHERE name = ?", (name,)).fetchone() is not None
+
+    def create_note(self, name):
+        """
+        Creates an empty note.
+
+        Returns:
+            bool: False if a note with that name already exists.
+        """
+        with self._lock, self._connection:
+            cursor = self._connection.execute("INSERT OR IGNORE INTO notes (name, updated) VALUES (?, ?)",
+                                              (name, time.time()))
+        return cursor.rowcount > 0
+
+    def note_text(self, name):
+        """
+        Returns the processed text of a note, or None if it does not exist.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT processed FROM notes WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def all_notes(self):
+        """
+        Returns the names of every note, embedded or not.
+        """
+        with self._lock:
+            return [row[0] for row in self._connection.execute("SELECT name FROM notes ORDER BY name")]
+
+    def save_note(self, name, text, processed, items, stale):
+        """
+        Stores a note's new text together with its new chunk embeddings and
+        drops its stale chunks, all in one transaction.
+        """
+        self.save_notes([(name, text, processed)], items, stale)
+
+    def save_notes(self, notes, items, stale):
+        """
+        Creates or replaces several (name, text, processed) notes along with
+        their new chunk embeddings and stale chunk ids, in one transaction.
+        """
+        updated = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO notes (name, text, processed, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET text = excluded.text, processed = excluded.processed, "
+                "updated = excluded.updated",
+                [(name, text, processed, updated) for name, text, processed in notes])
+            self._write_chunks(items, stale)
+            self._dirty = True
+
+    def save_chunks(self, items, stale):
+        """
+        Adds new (chunk id, vector) pairs and drops stale chunk ids, for any
+        number of notes, in one transaction.
+        """
+        with self._lock, self._connection:
+            self._write_chunks(items, stale)
+            self._dirty = True
+
+    def _write_chunks(self, items, stale):
+        if items:
+            vectors = normalize_rows(np.stack([np.asarray(vector, dtype=np.float32).reshape(-1) for _, vector in items]))
+            if self.dim is not None and vectors.shape[1] != self.dim:
+                raise ValueError(f"Embeddings have {vectors.shape[1]} dimensions, expected {self.dim}.")
+            self._connection.executemany("INSERT OR REPLACE INTO chunks (id, note, embedding) VALUES (?, ?, ?)",
+                                         [(chunk_id, note_of(chunk_id), vector.tobytes())
+                                          for (chunk_id, _), vector in zip(items, vectors)])
+        if stale:
+            self._connection.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in stale])
+
+    def delete_note(self, name):
+        """
+        Deletes a note and (through the foreign key) its chunks.
+
+        Returns:
+            bool: False if the note did not exist.
+        """
+        with self._lock, self._connection:
+            cursor = self._connection.execute("DELETE FROM notes WHERE name = ?", (name,))
+            self._dirty = True
+        return cursor.rowcount > 0
+
+    # Embeddings (same read interface as EmbeddingStore)
+
+    def refresh(self):
+        """
+        Reloads the embedding matrix if the database changed since it was last read.
+        """
+        with self._lock:
+            data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+            if not self._dirty and data_version == self._data_version:
+                return
+            rows = self._connection.execute("SELECT id, embedding FROM chunks ORDER BY rowid").fetchall()
+            self._data_version = data_version
+            self._dirty = False
+
+            self.ids = [chunk_id for chunk_id, _ in rows]
+            self.rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+            if rows:
+                self._matrix = np.frombuffer(b''.join(blob for _, blob in rows),
+                                             dtype=np.float32).reshape(len(rows), -1)
+                self.dim = self._matrix.shape[1]
+            else:
+                self._matrix = np.empty((0, self.dim or 0), dtype=np.float32)
+            self.version += 1
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, name):
+        return name in self.rows
+
+    def names(self):
+        return list(self.rows)
+
+    def note_names(self):
+        """
+        Returns the names of all notes that have at least one stored chunk.
+        """
+        with self._lock:
+            return [row[0] for row in self._connection.execute("SELECT DISTINCT note FROM chunks")]
+
+    def chunk_ids(self, note):
+        with self._lock:
+            return [row[0] for row in self._connection.execute("SELECT id FROM chunks WHERE note = ?", (note,))]
+
+    def matrix(self):
+        if self._matrix is None:
+            self.refresh()
+        return self._matrix
+
+    def tombstones(self):
+        return 0
+
+    def get(self, name):
+        row = self.rows.get(name)
+        return None if row is None else np.array(self.matrix()[row])
+
+    def search(self, query_vector, k, block_rows=SCORE_BLOCK_ROWS):
+        """
+        Returns the k stored chunks most similar to `query_vector` as (id, cosine) pairs.
+        """
+        if not self.rows:
+            return []
+        query_vector = normalize_rows(np.asarray(query_vector).reshape(-1))
+        rows, scores = top_k_rows(self.matrix(), query_vector, k, block_rows=block_rows)
+        return [(self.ids[row], float(score)) for row, score in zip(rows, scores)]
+
+    def search_many(self, query_vectors, k, block_rows=SCORE_BLOCK_ROWS):
+        """
+        Runs search() for several queries with a single scan of the matrix.
+        """
+        query_vectors = normalize_rows(np.asarray(query_vectors).reshape(len(query_vectors), -1))
+        if not self.rows:
+            return [[] for _ in range(query_vectors.shape[0])]
+        results = top_k_rows_many(self.matrix(), query_vectors, k, block_rows=block_rows)
+        return [[(self.ids[row], float(score)) for row, score in zip(rows, scores)] for rows, scores in results]
+
+    def search_among(self, query_vector, names):
+        """
+        Scores `query_vector` against the given chunks only.
+        """
+        rows = np.sort(np.array([self.rows[name] for name in names if name in self.rows], dtype=np.int64))
+        if rows.size == 0:
+            return []
+        query_vector = normalize_rows(np.asarray(query_vector).reshape(-1))
+        positions, scores = top_k_rows(self.matrix()[rows], query_vector, rows.size)
+        return [(self.ids[rows[position]], float(score)) for position, score in zip(positions, scores)]
+
+    def import_files(self, notes_directory):
+        """
+        Copies every .txt note of a notes directory into the database (as both
+        text and processed text, since notes on disk are already processed).
+
+        Notes already in the database only get their processed text updated:
+        their raw text is kept, and so are their chunks (INSERT OR REPLACE
+        would delete the row and, through the foreign key, every chunk), so
+        re-importing re-embeds only what changed.
+
+        Returns:
+            int: Number of notes imported.
+        """
+        records = []
+        for filename in sorted(os.listdir(notes_directory)):
+            if filename.endswith('.txt'):
+                with open(os.path.join(notes_directory, filename), 'r', encoding='utf-8') as file:
+                    content = file.read()
+                records.append((filename[:-len('.txt')], content, content, time.time()))
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO notes (name, text, processed, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET processed = excluded.processed, updated = excluded.updated "
+                "WHERE processed != excluded.processed", records)
+        return len(records)
+
+
+def open_note_db(embeddings_directory):
+    """
+    Opens the SQLite note store when STORAGE_BACKEND=sqlite.
+
+    Returns:
+        SQLiteNoteStore: The store, or None for the default "files" backend.
+    """
+    if STORAGE_BACKEND == "files":
+        return None
+    if STORAGE_BACKEND != "sqlite":
+        raise ValueError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}', expected 'files' or 'sqlite'")
+    return SQLiteNoteStore(SQLITE_PATH or os.path.join(embeddings_directory, SQLITE_FILE))
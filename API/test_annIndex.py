@@ -0,0 +1,62 @@
+import numpy as np
+
+from annIndex import IVFIndex
+from embeddingStore import EmbeddingStore
+
+
+def vectors(count, dim=8, seed=0):
+    matrix = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def built_index(tmp_path, count=40):
+    store = EmbeddingStore(str(tmp_path))
+    store.add_many((f"note{i}#c", vector) for i, vector in enumerate(vectors(count)))
+    IVFIndex(store).build(nlist=4)
+    return store
+
+
+def test_stale_instances_both_persist_their_assignments(tmp_path):
+    built_index(tmp_path)
+    first = IVFIndex(EmbeddingStore(str(tmp_path)))
+    second = IVFIndex(EmbeddingStore(str(tmp_path)))
+    new = vectors(3, seed=1)
+
+    first.add("alpha#c", new[0])
+    # second still holds the assignments it loaded at startup
+    second.add("beta#c", new[1])
+    second.delete("note0#c")
+    first.add("gamma#c", new[2])
+
+    assignments = IVFIndex(EmbeddingStore(str(tmp_path))).assignments
+    assert {"alpha#c", "beta#c", "gamma#c"} <= set(assignments)
+    assert "note0#c" not in assignments
+    assert len(assignments) == 42
+
+
+def test_refresh_sees_writes_within_the_same_mtime_tick(tmp_path, monkeypatch):
+    built_index(tmp_path)
+    reader = IVFIndex(EmbeddingStore(str(tmp_path)))
+    writer = IVFIndex(EmbeddingStore(str(tmp_path)))
+
+    # Pretend the filesystem's mtime did not move between the two writes
+    monkeypatch.setattr("annIndex.os.path.getmtime", lambda path: 0.0)
+    reader._load()
+    writer._load()
+    writer.delete("note1#c")
+
+    reader.refresh()
+    assert "note1#c" not in reader.assignments
+
+
+def test_search_finds_entries_added_by_another_instance(tmp_path):
+    store = built_index(tmp_path)
+    reader = IVFIndex(store)
+    writer = IVFIndex(EmbeddingStore(str(tmp_path)))
+    vector = vectors(1, seed=7)[0]
+    writer.store.add("fresh#c", vector)
+    writer.add("fresh#c", vector)
+
+    store.refresh()
+    reader.refresh()
+    assert reader.search(vector, 1, nprobe=4)[0][0] == "fresh#c"
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+import bulkImport
+
+
+@pytest.fixture
+def importer(indexer, monkeypatch):
+    # Records are imported as already processed text
+    monkeypatch.setattr(bulkImport, "process_user_inputs", lambda texts: list(texts))
+    return indexer
+
+
+def write_jsonl(path, records):
+    path.write_text("".join(json.dumps({'name': name, 'text': text}) + "\n" for name, text in records),
+                    encoding='utf-8')
+
+
+def test_repeated_note_in_a_batch_keeps_only_its_last_version(importer, tmp_path):
+    source = tmp_path / "notes.jsonl"
+    write_jsonl(source, [("alpha", "first version"), ("beta", "other note"), ("alpha", "second version")])
+
+    assert bulkImport.import_notes(str(source), batch_notes=8) == 2
+    chunk_ids = importer.store.chunk_ids("alpha")
+    assert len(chunk_ids) == 1
+    assert (tmp_path / "notes" / "alpha.txt").read_text(encoding='utf-8') == "second version"
+    wanted = importer.chunk_text("second version")
+    assert chunk_ids == [f"alpha#{digest}" for digest, _ in wanted]
+
+
+def test_reimporting_unchanged_notes_embeds_nothing(importer, tmp_path):
+    source = tmp_path / "notes.jsonl"
+    write_jsonl(source, [(f"note{i}", f"text of note {i}") for i in range(10)])
+    bulkImport.import_notes(str(source), batch_notes=4)
+    assert len(importer.embedded) == 10
+
+    bulkImport.import_notes(str(source), batch_notes=4, restart=True)
+    assert len(importer.embedded) == 10
+    assert len(importer.store) == 10
+
+
+def test_interrupted_import_resumes_after_its_checkpoint(importer, tmp_path, monkeypatch):
+    source = tmp_path / "notes.jsonl"
+    write_jsonl(source, [(f"note{i}", f"text of note {i}") for i in range(12)])
+
+    write = bulkImport.BulkImporter._write
+    written = []
+
+    def failing_write(self, batch, items):
+        if len(written) == 2:
+            raise RuntimeError("disk full")
+        write(self, batch, items)
+        written.append(batch)
+
+    monkeypatch.setattr(bulkImport.BulkImporter, "_write", failing_write)
+    with pytest.raises(RuntimeError, match="disk full"):
+        bulkImport.import_notes(str(source), batch_notes=4)
+    assert len(importer.store) == 8
+    assert bulkImport.ImportCheckpoint(importer.EMBEDDINGS_DIRECTORY).get(str(source)) == {'position': 7, 'imported': 8}
+
+    monkeypatch.setattr(bulkImport.BulkImporter, "_write", write)
+    assert bulkImport.import_notes(str(source), batch_notes=4) == 4
+    assert len(importer.store) == 12
+    assert sorted(importer.manifest.names()) == sorted(f"note{i}" for i in range(12))
@@ -0,0 +1,122 @@
+import os
+import json
+import stat
+import contextlib
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import daemonAPI
+import metrics
+
+
+def test_run_local_reports_the_real_error_when_the_operation_cannot_start(monkeypatch):
+    @contextlib.contextmanager
+    def broken_operation(name):
+        raise RuntimeError("metrics unavailable")
+        yield
+
+    monkeypatch.setattr(daemonAPI, "resolve", lambda command: lambda: "unreachable")
+    monkeypatch.setattr(metrics, "operation", broken_operation)
+    with pytest.raises(RuntimeError, match="metrics unavailable"):
+        daemonAPI.run_local('metrics', {})
+    assert daemonAPI.last_profile is None
+
+
+def test_run_local_records_the_profile(monkeypatch):
+    monkeypatch.setattr(daemonAPI, "resolve", lambda command: lambda value: value * 2)
+    assert daemonAPI.run_local('double', {'value': 21}) == 42
+    assert daemonAPI.last_profile['operation'] == 'double'
+
+
+def test_daemon_returns_only_the_output_of_each_command(monkeypatch, capsys):
+    monkeypatch.setattr(daemonAPI.sys, "stdout", daemonAPI.CommandOutput(daemonAPI.sys.stdout))
+    in_command = threading.Event()
+    background_printed = threading.Event()
+
+    def chatty(label):
+        print(f"{label} started")
+        in_command.set()
+        background_printed.wait(5)
+        print(f"{label} finished")
+        return label
+
+    def background():
+        in_command.wait(5)
+        print("watcher output")
+        background_printed.set()
+
+    monkeypatch.setattr(daemonAPI.DaemonHandler, "commands", {'chatty': chatty})
+    monkeypatch.setattr(daemonAPI.DaemonHandler, "token", "secret")
+    server = daemonAPI.DaemonServer(("127.0.0.1", 0), daemonAPI.DaemonHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    watcher = threading.Thread(target=background)
+    watcher.start()
+    try:
+        host, port = server.server_address
+        assert daemonAPI.call('chatty', {'label': "one"}, host=host, port=port, token="secret") == "one"
+    finally:
+        server.shutdown()
+        server.server_close()
+        watcher.join()
+
+    printed = capsys.readouterr().out
+    assert printed.count("watcher output") == 1
+    assert "one started\none finished\n" in printed
+    assert "watcher output" not in printed.split("one started")[1]
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    """
+    A daemon on a free port with one command that records its calls, and the
+    token from a fresh token file.
+    """
+    calls = []
+    monkeypatch.setattr(daemonAPI.DaemonHandler, "commands", {'delete': lambda **params: calls.append(params)})
+    monkeypatch.setattr(daemonAPI.DaemonHandler, "token", daemonAPI.daemon_token(str(tmp_path), create=True))
+    server = daemonAPI.DaemonServer(("127.0.0.1", 0), daemonAPI.DaemonHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.calls = calls
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, headers):
+    host, port = server.server_address
+    request = urllib.request.Request(f"http://{host}:{port}/delete", data=json.dumps({'fileName': "x"}).encode('utf-8'),
+                                     headers=headers, method='POST')
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_token_file_is_private_and_reused(tmp_path):
+    token = daemonAPI.daemon_token(str(tmp_path), create=True)
+    assert token and daemonAPI.daemon_token(str(tmp_path), create=True) == token
+    assert stat.S_IMODE(os.stat(tmp_path / daemonAPI.TOKEN_FILE).st_mode) == 0o600
+
+
+def test_commands_without_the_token_are_refused(daemon):
+    json_type = {'Content-Type': 'application/json'}
+    assert post(daemon, json_type) == 403
+    assert post(daemon, dict(json_type, **{daemonAPI.TOKEN_HEADER: "guess"})) == 403
+    assert daemon.calls == []
+
+    token = {daemonAPI.TOKEN_HEADER: daemonAPI.DaemonHandler.token}
+    assert post(daemon, dict(json_type, **token)) == 200
+    assert daemon.calls == [{'fileName': "x"}]
+
+
+def test_cross_site_requests_are_refused(daemon):
+    token = {daemonAPI.TOKEN_HEADER: daemonAPI.DaemonHandler.token}
+    # A form post from a web page cannot send application/json without a preflight
+    assert post(daemon, dict(token, **{'Content-Type': 'text/plain'})) == 415
+    # A page on another site whose name resolves to this machine
+    assert post(daemon, dict(token, **{'Content-Type': 'application/json', 'Host': "evil.example:8765"})) == 403
+    assert daemon.calls == []
@@ -0,0 +1,106 @@
+import os
+import multiprocessing
+
+import numpy as np
+
+from embeddingStore import EmbeddingStore
+
+
+def unit(seed, dim=8):
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_stale_instances_both_persist_their_writes(tmp_path):
+    first = EmbeddingStore(str(tmp_path))
+    second = EmbeddingStore(str(tmp_path))
+    first.add("alpha#1", unit(1))
+    # second still holds the empty manifest it loaded at startup
+    second.add("beta#1", unit(2))
+    first.delete("gamma#1")
+    first.add("alpha#2", unit(3))
+
+    store = EmbeddingStore(str(tmp_path))
+    assert sorted(store.names()) == ["alpha#1", "alpha#2", "beta#1"]
+    np.testing.assert_allclose(store.get("alpha#1"), unit(1), rtol=1e-5)
+    np.testing.assert_allclose(store.get("beta#1"), unit(2), rtol=1e-5)
+
+
+def test_stale_delete_does_not_resurrect_or_drop_other_writes(tmp_path):
+    first = EmbeddingStore(str(tmp_path))
+    first.add_many([("alpha#1", unit(1)), ("beta#1", unit(2))])
+    second = EmbeddingStore(str(tmp_path))
+    first.add("gamma#1", unit(3))
+    second.delete("alpha#1")
+
+    store = EmbeddingStore(str(tmp_path))
+    assert sorted(store.names()) == ["beta#1", "gamma#1"]
+    np.testing.assert_allclose(store.get("gamma#1"), unit(3), rtol=1e-5)
+
+
+def _write_notes(directory, worker, notes):
+    store = EmbeddingStore(directory)
+    for note in range(notes):
+        store.add(f"w{worker}n{note}#c", unit(worker * 1000 + note))
+
+
+def test_concurrent_processes_keep_every_entry(tmp_path):
+    processes = [multiprocessing.Process(target=_write_notes, args=(str(tmp_path), worker, 25)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    store = EmbeddingStore(str(tmp_path))
+    assert len(store) == 100
+    for worker in range(4):
+        np.testing.assert_allclose(store.get(f"w{worker}n24#c"), unit(worker * 1000 + 24), rtol=1e-5)
+
+
+def test_tombstones_are_compacted_once_they_reach_the_ratio(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.add_many((f"note{i}#c", unit(i)) for i in range(8))
+    store.add("note0#c", unit(100))
+    assert store.tombstones() == 1
+    assert os.path.getsize(store.matrix_path) == 9 * 8 * 4
+
+    # A second tombstone makes 2 of 9 rows; a third crosses COMPACT_RATIO
+    store.delete("note1#c")
+    assert store.tombstones() == 2
+    store.delete("note2#c")
+    assert store.tombstones() == 0
+    assert os.path.getsize(store.matrix_path) == 6 * 8 * 4
+
+    reopened = EmbeddingStore(str(tmp_path))
+    assert sorted(reopened.names()) == sorted(["note0#c"] + [f"note{i}#c" for i in range(3, 8)])
+    np.testing.assert_allclose(reopened.get("note0#c"), unit(100), rtol=1e-5)
+    for i in range(3, 8):
+        np.testing.assert_allclose(reopened.get(f"note{i}#c"), unit(i), rtol=1e-5)
+    assert [name for name, _ in reopened.search(unit(5), 1)] == ["note5#c"]
+
+
+def test_stale_instance_reads_the_compacted_matrix(tmp_path):
+    writer = EmbeddingStore(str(tmp_path))
+    writer.add_many((f"note{i}#c", unit(i)) for i in range(4))
+    reader = EmbeddingStore(str(tmp_path))
+    writer.delete_many(["note0#c", "note1#c"])
+
+    reader.refresh()
+    assert sorted(reader.names()) == ["note2#c", "note3#c"]
+    np.testing.assert_allclose(reader.get("note3#c"), unit(3), rtol=1e-5)
+
+
+def test_legacy_embedding_files_are_migrated_once(tmp_path):
+    for i, name in enumerate(["alpha", "beta", "gamma"]):
+        np.save(tmp_path / f"{name}_embedding.npy", (unit(i) * (i + 2)).reshape(1, -1))
+
+    store = EmbeddingStore(str(tmp_path))
+    assert sorted(store.names()) == ["alpha", "beta", "gamma"]
+    assert not [f for f in os.listdir(tmp_path) if f.endswith("_embedding.npy")]
+    # Rows are normalized on the way in
+    np.testing.assert_allclose(store.get("gamma"), unit(2), rtol=1e-5)
+
+    reopened = EmbeddingStore(str(tmp_path))
+    assert len(reopened) == 3
+    assert os.path.getsize(reopened.matrix_path) == 3 * 8 * 4
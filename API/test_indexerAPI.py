@@ -0,0 +1,66 @@
+import os
+
+
+def write_note(indexer, name, text):
+    path = os.path.join(indexer.NOTES_DIRECTORY, f"{name}.txt")
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(text)
+    return path
+
+
+def test_sync_embeds_only_new_and_changed_notes_and_drops_deleted_ones(indexer):
+    for i in range(5):
+        write_note(indexer, f"note{i}", f"text of note {i}")
+    assert indexer.sync(workers=0) == {'indexed': 5, 'removed': 0, 'unchanged': 0}
+    assert len(indexer.embedded) == 5
+    assert sorted(indexer.manifest.names()) == [f"note{i}" for i in range(5)]
+
+    # Nothing changed: every note is fresh by mtime and size
+    assert indexer.sync(workers=0) == {'indexed': 0, 'removed': 0, 'unchanged': 5}
+    assert len(indexer.embedded) == 5
+
+    # A new mtime with the same content only refreshes the manifest entry
+    path = os.path.join(indexer.NOTES_DIRECTORY, "note1.txt")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 5_000_000_000))
+    assert indexer.sync(workers=0) == {'indexed': 0, 'removed': 0, 'unchanged': 5}
+    assert len(indexer.embedded) == 5
+    assert indexer.manifest.get("note1")['mtime'] == os.stat(path).st_mtime_ns
+
+    # Changed, added and deleted notes
+    old_chunks = indexer.store.chunk_ids("note2")
+    write_note(indexer, "note2", "a different text")
+    write_note(indexer, "note5", "a brand new note")
+    os.remove(os.path.join(indexer.NOTES_DIRECTORY, "note3.txt"))
+    assert indexer.sync(workers=0) == {'indexed': 2, 'removed': 1, 'unchanged': 3}
+    assert len(indexer.embedded) == 7
+    assert indexer.store.chunk_ids("note2") != old_chunks
+    assert indexer.store.chunk_ids("note3") == [] and indexer.manifest.get("note3") is None
+
+    # The manifest on disk matches the index
+    reloaded = type(indexer.manifest)(indexer.EMBEDDINGS_DIRECTORY)
+    assert sorted(reloaded.names()) == sorted(indexer.store.note_names()) == ["note0", "note1", "note2", "note4", "note5"]
+
+
+def test_sync_reembeds_every_note_after_a_model_change(indexer, monkeypatch):
+    for i in range(3):
+        write_note(indexer, f"note{i}", f"text of note {i}")
+    indexer.sync(workers=0)
+    monkeypatch.setattr(type(indexer.engine), "fingerprint", lambda self: "another-model")
+
+    assert indexer.sync(workers=0) == {'indexed': 3, 'removed': 0, 'unchanged': 0}
+    assert {entry['model'] for entry in map(indexer.manifest.get, indexer.manifest.names())} == {"another-model"}
+
+
+def test_plan_sync_sorts_the_given_notes(indexer):
+    for i in range(3):
+        write_note(indexer, f"note{i}", f"text of note {i}")
+    indexer.sync(workers=0)
+    write_note(indexer, "note0", "edited")
+    os.remove(os.path.join(indexer.NOTES_DIRECTORY, "note1.txt"))
+    write_note(indexer, "note9", "new")
+
+    stale, vanished, touched = indexer.plan_sync(["note0", "note1", "note2", "note9", "never-existed"])
+    assert sorted(stale) == ["note0", "note9"]
+    assert vanished == ["note1"]
+    assert touched == 0
@@ -0,0 +1,119 @@
+import os
+import multiprocessing
+
+import pytest
+
+from lexicalIndex import LexicalIndex, lexical_terms
+
+NOTES = {
+    "alpha": "nenu oka katha chadivanu",
+    "beta": "manchi katha idi",
+    "gamma": "the book is on the table",
+    "delta": "nenu book chadivanu table meeda",
+}
+
+QUERIES = ["nenu katha", "book table", "chadivanu", "manchi", "missing word"]
+
+
+def results(index):
+    return {query: [(note, pytest.approx(score)) for note, score in index.search(query, k=10)] for query in QUERIES}
+
+
+def rebuilt(directory, notes):
+    directory.mkdir(exist_ok=True)
+    index = LexicalIndex(str(directory))
+    index.build((note, lexical_terms(text)) for note, text in notes.items())
+    return index
+
+
+def edit(index, notes):
+    index.update_many([("beta", lexical_terms("katha kaadu book")), ("epsilon", lexical_terms("kotha note table"))])
+    index.remove_many(["gamma", "missing"])
+    notes = dict(notes, beta="katha kaadu book", epsilon="kotha note table")
+    del notes["gamma"]
+    return notes
+
+
+def test_log_is_replayed_by_new_and_stale_readers(tmp_path):
+    writer = rebuilt(tmp_path / "index", NOTES)
+    reader = LexicalIndex(str(tmp_path / "index"))
+    final = edit(writer, NOTES)
+    assert writer.log_entries == 3
+
+    expected = results(rebuilt(tmp_path / "reference", final))
+    assert results(writer) == expected
+    assert results(LexicalIndex(str(tmp_path / "index"))) == expected
+    reader.refresh()
+    assert results(reader) == expected
+    assert "gamma" not in reader and "epsilon" in reader
+
+
+def test_partially_written_log_line_is_ignored_until_complete(tmp_path):
+    writer = rebuilt(tmp_path, NOTES)
+    writer.update_many([("beta", lexical_terms("katha kaadu"))])
+    with open(writer.log_path, 'a', encoding='utf-8') as file:
+        file.write('{"note": "zeta", "terms"')
+
+    reader = LexicalIndex(str(tmp_path))
+    assert reader.log_entries == 1 and "zeta" not in reader
+    with open(writer.log_path, 'a', encoding='utf-8') as file:
+        file.write(': {"kotha": 1}}\n')
+    reader.refresh()
+    assert reader.search("kotha") and reader.search("kotha")[0][0] == "zeta"
+
+
+def test_compaction_folds_the_log_into_the_snapshot(tmp_path):
+    writer = rebuilt(tmp_path / "index", NOTES)
+    final = edit(writer, NOTES)
+    before = results(writer)
+
+    writer.compact()
+    assert writer.log_entries == 0
+    assert os.path.getsize(writer.log_path) == 0
+    assert writer.notes == [note for note in writer.notes if note is not None]
+    assert results(writer) == before
+
+    reopened = LexicalIndex(str(tmp_path / "index"))
+    assert sorted(reopened.rows) == sorted(final)
+    assert results(reopened) == results(rebuilt(tmp_path / "reference", final))
+
+
+def test_log_is_compacted_automatically_once_it_is_large(tmp_path):
+    index = rebuilt(tmp_path, NOTES)
+    for start in range(0, 1000, 100):
+        index.update_many((f"note{i}", lexical_terms(f"word{i} katha")) for i in range(start, start + 100))
+    assert index.log_entries == 0
+    assert os.path.getsize(index.log_path) == 0
+    assert len(LexicalIndex(str(tmp_path))) == len(NOTES) + 1000
+
+
+def test_stale_instance_removes_notes_another_process_indexed(tmp_path):
+    writer = rebuilt(tmp_path, NOTES)
+    stale = LexicalIndex(str(tmp_path))
+    writer.update_many([("epsilon", lexical_terms("kotha note"))])
+
+    assert stale.remove_many(["epsilon"]) == 1
+    assert "epsilon" not in LexicalIndex(str(tmp_path))
+    assert LexicalIndex(str(tmp_path)).search("kotha") == []
+
+
+def _append_notes(directory, worker, notes):
+    index = LexicalIndex(directory)
+    for start in range(0, notes, 10):
+        index.update_many((f"w{worker}n{i}", lexical_terms(f"word{worker} katha {i}")) for i in range(start, start + 10))
+
+
+def test_concurrent_writers_keep_every_note_across_compactions(tmp_path):
+    rebuilt(tmp_path, NOTES)
+    processes = [multiprocessing.Process(target=_append_notes, args=(str(tmp_path), worker, 400)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    index = LexicalIndex(str(tmp_path))
+    assert len(index) == len(NOTES) + 1600
+    assert index.log_entries < 1600
+    for worker in range(4):
+        assert len(index.search(f"word{worker}", k=1000)) == 400
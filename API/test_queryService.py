@@ -0,0 +1,101 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from queryService import BatchingQueryService
+
+
+class FakeFindMany:
+    """
+    Stands in for retrievalAPI.find_many: records each call and returns k
+    (query, rank) hits per query, failing for exact searches of "boom".
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, queries, k, exact, nprobe):
+        self.calls.append((list(queries), k, exact, nprobe))
+        if exact and "boom" in queries:
+            raise ValueError("exact search failed")
+        return [[(query, rank) for rank in range(k)] for query in queries]
+
+
+def run_service(service, requests, delays=None):
+    """
+    Sends (query, k, exact, nprobe) requests concurrently, each after its delay
+    in seconds, and returns every request's result or exception.
+    """
+    async def main():
+        await service.start()
+
+        async def send(request, delay):
+            await asyncio.sleep(delay)
+            return await service.find(*request)
+
+        try:
+            return await asyncio.gather(*(send(request, delay) for request, delay in
+                                          zip(requests, delays or [0] * len(requests))), return_exceptions=True)
+        finally:
+            await service.stop()
+
+    return asyncio.run(main())
+
+
+def test_queries_within_the_window_share_one_call():
+    find_many = FakeFindMany()
+    service = BatchingQueryService(find_many, window_ms=200)
+    results = run_service(service, [("nenu", 2, False, None), ("katha", 1, False, None), ("book", 3, False, None)])
+
+    assert find_many.calls == [(["nenu", "katha", "book"], 3, False, None)]
+    assert results == [[("nenu", 0), ("nenu", 1)], [("katha", 0)], [("book", 0), ("book", 1), ("book", 2)]]
+    assert service.stats() == {'batches': 1, 'queries': 3, 'mean_batch_size': 3.0}
+
+
+def test_queries_after_the_window_start_a_new_batch():
+    find_many = FakeFindMany()
+    service = BatchingQueryService(find_many, window_ms=20)
+    run_service(service, [("nenu", 1, False, None), ("katha", 1, False, None)], delays=[0, 0.3])
+
+    assert [call[0] for call in find_many.calls] == [["nenu"], ["katha"]]
+
+
+def test_batches_are_split_at_max_batch():
+    find_many = FakeFindMany()
+    service = BatchingQueryService(find_many, window_ms=200, max_batch=2)
+    results = run_service(service, [(f"q{i}", 1, False, None) for i in range(5)])
+
+    assert [len(call[0]) for call in find_many.calls] == [2, 2, 1]
+    assert results == [[(f"q{i}", 0)] for i in range(5)]
+
+
+def test_queries_are_grouped_by_search_options():
+    find_many = FakeFindMany()
+    service = BatchingQueryService(find_many, window_ms=200)
+    run_service(service, [("a", 1, False, None), ("b", 2, True, None), ("c", 3, False, 4), ("d", 1, False, None)])
+
+    assert sorted(find_many.calls, key=lambda call: call[0]) == [
+        (["a", "d"], 1, False, None), (["b"], 2, True, None), (["c"], 3, False, 4)]
+    assert service.stats()['batches'] == 1
+
+
+def test_an_error_reaches_only_the_requests_of_its_group():
+    find_many = FakeFindMany()
+    service = BatchingQueryService(find_many, window_ms=200)
+    results = run_service(service, [("boom", 1, True, None), ("fine", 1, False, None), ("also", 1, True, None)])
+
+    assert isinstance(results[0], ValueError) and isinstance(results[2], ValueError)
+    assert results[1] == [("fine", 0)]
+
+
+def test_find_blocking_batches_calls_from_several_threads():
+    find_many = FakeFindMany()
+    lock = threading.Lock()
+    service = BatchingQueryService(find_many, window_ms=200, lock=lock)
+    service.run_in_thread()
+
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda i: service.find_blocking(f"q{i}", k=1), range(4)))
+    assert results == [[(f"q{i}", 0)] for i in range(4)]
+    assert len(find_many.calls) == 1 and sorted(find_many.calls[0][0]) == [f"q{i}" for i in range(4)]
+    assert not lock.locked()
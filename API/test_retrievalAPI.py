@@ -0,0 +1,10 @@
+import retrievalAPI
+
+
+def test_find_many_without_queries_returns_nothing(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("no query should be processed")
+
+    monkeypatch.setattr(retrievalAPI.query_cache, "processed_many", fail)
+    assert retrievalAPI.find_many([]) == []
+    assert retrievalAPI.find_many(iter(())) == []
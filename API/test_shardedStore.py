@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+
+import shardedStore
+from embeddingStore import EmbeddingStore
+from shardedStore import ShardedStore, rebalance, read_layout, shard_of
+
+
+def vectors(count, dim=8, seed=0):
+    matrix = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def entries(count):
+    # Two chunks per note, so a note's chunks have to move together
+    return [f"note{i // 2}#c{i % 2}" for i in range(count)]
+
+
+def test_rebalance_between_shard_counts_keeps_every_entry_and_search(tmp_path):
+    directory = str(tmp_path)
+    names = entries(60)
+    matrix = vectors(60)
+    EmbeddingStore(directory).add_many(zip(names, matrix))
+    expected = EmbeddingStore(directory).search(matrix[7], 5)
+
+    # Every entry leaves the single store for a shard directory
+    assert rebalance(3, directory) == 60
+    assert rebalance(2, directory) > 0
+    assert read_layout(directory) == 2
+    assert not os.path.exists(os.path.join(directory, "shard_02"))
+
+    store = ShardedStore(directory, 2)
+    assert sorted(store.names()) == sorted(names)
+    for i, shard in enumerate(store.shards):
+        assert {shard_of(note, 2) for note in shard.note_names()} <= {i}
+    assert [name for name, _ in store.search(matrix[7], 5)] == [name for name, _ in expected]
+
+    # Already balanced: nothing to move
+    assert rebalance(2, directory) == 0
+
+
+def test_interrupted_rebalance_loses_nothing_and_finishes_when_run_again(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    names = entries(40)
+    matrix = vectors(40)
+    EmbeddingStore(directory).add_many(zip(names, matrix))
+
+    monkeypatch.setattr(shardedStore, "REBALANCE_BLOCK_ROWS", 3)
+    delete_many = EmbeddingStore.delete_many
+    calls = []
+
+    def failing_delete_many(self, block):
+        calls.append(block)
+        if len(calls) == 3:
+            raise OSError("disk full")
+        return delete_many(self, block)
+
+    monkeypatch.setattr(EmbeddingStore, "delete_many", failing_delete_many)
+    with pytest.raises(OSError, match="disk full"):
+        rebalance(4, directory)
+
+    # Entries copied but not yet deleted exist twice, never zero times
+    stores = [EmbeddingStore(directory)] + [EmbeddingStore(os.path.join(directory, f"shard_{i:02d}")) for i in range(4)]
+    assert set(names) <= {name for store in stores for name in store.names()}
+
+    monkeypatch.setattr(EmbeddingStore, "delete_many", delete_many)
+    rebalance(4, directory)
+    store = ShardedStore(directory, 4)
+    assert sorted(store.names()) == sorted(names)
+    for i, name in enumerate(names):
+        np.testing.assert_allclose(store.get(name), matrix[i], rtol=1e-5)
+
+
+def test_rebalance_collects_entries_from_three_digit_shard_directories(tmp_path):
+    directory = str(tmp_path)
+    names = entries(10)
+    matrix = vectors(10)
+    EmbeddingStore(shardedStore.shard_directory(directory, 100)).add_many(zip(names, matrix))
+
+    assert rebalance(2, directory) == 10
+    assert not os.path.exists(os.path.join(directory, "shard_100"))
+    assert sorted(ShardedStore(directory, 2).names()) == sorted(names)
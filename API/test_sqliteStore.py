@@ -0,0 +1,20 @@
+import numpy as np
+
+from sqliteStore import SQLiteNoteStore
+
+
+def test_import_files_keeps_existing_chunks_and_raw_text(tmp_path):
+    notes = tmp_path / "notes"
+    notes.mkdir()
+    (notes / "alpha.txt").write_text("processed alpha", encoding='utf-8')
+    (notes / "beta.txt").write_text("processed beta", encoding='utf-8')
+
+    store = SQLiteNoteStore(str(tmp_path / "notes.sqlite3"))
+    store.save_notes([("alpha", "raw alpha", "processed alpha")], [("alpha#1", np.ones(4))], [])
+    assert store.import_files(str(notes)) == 2
+
+    store.refresh()
+    assert store.chunk_ids("alpha") == ["alpha#1"]
+    assert store._connection.execute("SELECT text FROM notes WHERE name = 'alpha'").fetchone()[0] == "raw alpha"
+    assert store.note_text("beta") == "processed beta"
+    assert store.all_notes() == ["alpha", "beta"]
@@ -0,0 +1,273 @@
+import click
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Add the directories where the API modules are located
+sys.path.append(os.path.abspath('../API'))
+sys.path.append(os.path.abspath('../API/inputProcesser'))
+
+from corpus import generate_sentences, telugu_latin_words, write_corpus
+
+# Settings recorded with every run so results can be compared like for like
+RECORDED_SETTINGS = [
+    "MODEL_NAME", "INFERENCE_MODE", "TORCH_NUM_THREADS", "INDEX_BATCH_SIZE", "INDEX_MAX_TOKENS",
+    "ANN_INDEX", "IVF_NPROBE", "COMPRESSED_INDEX", "COMPRESSED_DIM", "COMPRESSED_DTYPE", "LEXICAL_INDEX",
+    "LEXICAL_CANDIDATES",
+]
+
+# Rows of synthetic embeddings appended to the store per write when padding it
+PAD_BLOCK_ROWS = 50000
+
+
+def check_padding(sizes, index_limit):
+    """
+    Rejects runs that would need synthetic padding with the SQLite backend: the
+    padding writes to the embedding store directly, which that backend does
+    not allow. (--index-limit is at least 1, so the padding always knows the
+    embedding size from a note embedded with the model.)
+    """
+    if os.getenv("STORAGE_BACKEND", "files").lower() == "sqlite" and max(sizes, default=0) > index_limit:
+        raise click.UsageError("Synthetic embeddings cannot be added with STORAGE_BACKEND=sqlite; "
+                               f"set --index-limit to at least {max(sizes)} to embed every note.")
+
+
+def isolated_env(root, name, **settings):
+    """
+    Environment for a benchmark subprocess whose transliteration cache and
+    English vocabulary live under root, so runs neither start from nor fill the
+    user's caches. The vocabulary is copied from ENGLISH_VOCAB_PATH when it
+    exists (building it from NLTK is not what is being measured).
+    """
+    from stage1 import ENGLISH_VOCAB_PATH
+
+    vocab_path = os.path.join(root, "english_vocab.txt")
+    if not os.path.exists(vocab_path) and os.path.exists(ENGLISH_VOCAB_PATH):
+        shutil.copyfile(ENGLISH_VOCAB_PATH, vocab_path)
+    return dict(os.environ, TRANSLIT_CACHE_PATH=os.path.join(root, f"translit_cache_{name}.sqlite"),
+                ENGLISH_VOCAB_PATH=vocab_path, QUERY_CACHE_PATH="", **settings)
+
+
+def run_json(command, env):
+    """
+    Runs a hidden subcommand of this script and returns the JSON it printed last.
+    """
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__)] + command,
+                               env=env, stdout=subprocess.PIPE, check=True)
+    return json.loads(completed.stdout.decode('utf-8').strip().splitlines()[-1])
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        return peak_rss_mb()
+
+
+def latency_summary(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'count': int(latencies.size),
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+    }
+
+
+def bench_transliteration(word_count):
+    from translit_enhance import transliterate_word_enhanced
+
+    latin_words = telugu_latin_words(word_count)
+    start_time = time.perf_counter()
+    for latin_word in latin_words:
+        transliterate_word_enhanced(latin_word)
+    elapsed = time.perf_counter() - start_time
+    return {'words': word_count, 'seconds': elapsed, 'words_per_sec': word_count / elapsed}
+
+
+def bench_process_user_input(sentence_count):
+    from TenglishFormatter import process_user_input
+
+    sentences = generate_sentences(sentence_count)
+    process_user_input(sentences[0])  # loads the vocabulary and tokenizer data
+
+    latencies = []
+    for sentence in sentences:
+        start_time = time.perf_counter()
+        process_user_input(sentence)
+        latencies.append(time.perf_counter() - start_time)
+    elapsed = sum(latencies)
+    return dict(latency_summary(latencies), sentences=sentence_count, seconds=elapsed,
+                sentences_per_sec=sentence_count / elapsed)
+
+
+def bench_size(size, index_limit, single_notes, queries, k, exact):
+    """
+    Runs the indexing and retrieval benchmarks for one corpus size. Expects
+    NOTES_DIRECTORY and EMBEDDINGS_DIRECTORY to point at empty directories.
+    """
+    result = {'notes': size}
+
+    start_time = time.perf_counter()
+    names = write_corpus(os.environ["NOTES_DIRECTORY"], size, seed=size)
+    result['corpus_seconds'] = time.perf_counter() - start_time
+
+    import indexerAPI
+
+    # Single-note index() calls, then the batched path used by reindex/sync
+    indexed = min(size, index_limit)
+    single = names[:min(single_notes, indexed)]
+    start_time = time.perf_counter()
+    for name in single:
+        indexerAPI.index(name)
+    elapsed = time.perf_counter() - start_time
+    result['index'] = {'notes': len(single), 'seconds': elapsed,
+                       'notes_per_sec': len(single) / elapsed if elapsed else 0.0}
+
+    batched = names[len(single):indexed]
+    start_time = time.perf_counter()
+    indexerAPI.index_notes(batched)
+    elapsed = time.perf_counter() - start_time
+    result['index_batched'] = {'notes': len(batched), 'seconds': elapsed,
+                               'notes_per_sec': len(batched) / elapsed if elapsed else 0.0}
+
+    # Notes past index_limit get random unit vectors so find scans a store of
+    # the full size without embedding every note with the model
+    store = indexerAPI.store
+    rng = np.random.default_rng(size)
+    for start in range(indexed, size, PAD_BLOCK_ROWS):
+        block = names[start:start + PAD_BLOCK_ROWS]
+        vectors = rng.standard_normal((len(block), store.dim), dtype=np.float32)
+        store.add_many((f"{name}#synthetic", vector) for name, vector in zip(block, vectors))
+    result['synthetic_embeddings'] = size - indexed
+    if indexerAPI.ann_index is not None:
+        indexerAPI.build_ann_index()
+    if indexerAPI.compressed_index is not None:
+        indexerAPI.build_compressed_index()
+
+    import retrievalAPI
+
+    # Every query is distinct, so the query cache never answers from memory
+    retrievalAPI.find("nenu", k=k, exact=exact)
+    rss_before = current_rss_mb()
+    latencies = []
+    for query in generate_sentences(queries, seed=size + 1):
+        start_time = time.perf_counter()
+        retrievalAPI.find(query, k=k, exact=exact)
+        latencies.append(time.perf_counter() - start_time)
+    result['find'] = dict(latency_summary(latencies), k=k, exact=exact,
+                          rss_before_mb=rss_before, rss_after_mb=current_rss_mb(), peak_rss_mb=peak_rss_mb())
+    return result
+
+
+@click.group()
+def cli():
+    """Benchmarks for transliteration, labeling, embedding, indexing and retrieval."""
+    pass
+
+# Command to run the whole suite
+@cli.command()
+@click.option('--sizes', default="1000,10000,100000,1000000", show_default=True, help="Comma-separated corpus sizes.")
+@click.option('--words', default=200000, show_default=True, help="Words passed to transliterate_word_enhanced.")
+@click.option('--sentences', default=2000, show_default=True, help="Sentences passed to process_user_input.")
+@click.option('--index-limit', default=2000, show_default=True, type=click.IntRange(min=1), help="Notes embedded with the model per size; the rest get synthetic embeddings.")
+@click.option('--single-notes', default=50, show_default=True, help="Notes indexed one index() call at a time.")
+@click.option('--queries', default=200, show_default=True, help="find calls timed per size.")
+@click.option('--top-k', 'top_k', default=3, show_default=True, help="Results per find call.")
+@click.option('--exact', is_flag=True, help="Bypass the ANN and compressed indexes.")
+@click.option('--workdir', default=None, help="Directory for the generated corpora (default: a temporary directory).")
+@click.option('--output', default=None, help="File to write the JSON results to (default: stdout).")
+def run(sizes, words, sentences, index_limit, single_notes, queries, top_k, exact, workdir, output):
+    """Run every benchmark and emit the results as JSON."""
+    results = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'settings': {name: os.getenv(name) for name in RECORDED_SETTINGS if os.getenv(name) is not None},
+    }
+
+    sizes = [int(size) for size in sizes.split(',') if size]
+    check_padding(sizes, index_limit)
+
+    # The pipeline and every size run in their own process so module-level
+    # state (store, caches, loaded model) and peak memory are measured from a
+    # clean start
+    with tempfile.TemporaryDirectory(dir=workdir) as root:
+        pipeline_result = run_json(['pipeline', '--words', str(words), '--sentences', str(sentences)],
+                                   isolated_env(root, "pipeline"))
+        results.update(pipeline_result)
+        click.echo(f"transliterate_word_enhanced: {results['transliteration']['words_per_sec']:.0f} words/sec", err=True)
+        click.echo(f"process_user_input: {results['process_user_input']['sentences_per_sec']:.1f} sentences/sec", err=True)
+
+        results['sizes'] = []
+        for size in sizes:
+            env = isolated_env(root, f"size_{size}",
+                               NOTES_DIRECTORY=os.path.join(root, f"notes_{size}"),
+                               EMBEDDINGS_DIRECTORY=os.path.join(root, f"embeddings_{size}"))
+            command = ['size', str(size),
+                       '--index-limit', str(index_limit), '--single-notes', str(single_notes),
+                       '--queries', str(queries), '--top-k', str(top_k)] + (['--exact'] if exact else [])
+            size_result = run_json(command, env)
+            results['sizes'].append(size_result)
+            click.echo(f"{size} notes: index {size_result['index_batched']['notes_per_sec']:.1f} notes/sec, "
+                       f"find p50 {size_result['find']['p50_ms']:.1f} ms / p99 {size_result['find']['p99_ms']:.1f} ms, "
+                       f"peak RSS {size_result['find']['peak_rss_mb']:.0f} MB", err=True)
+
+    report = json.dumps(results, indent=2)
+    if output:
+        with open(output, 'w', encoding='utf-8') as file:
+            file.write(report + "\n")
+    else:
+        click.echo(report)
+
+# Command used by `run` to benchmark the transliteration pipeline in a fresh process
+@cli.command(hidden=True)
+@click.option('--words', default=200000)
+@click.option('--sentences', default=2000)
+def pipeline(words, sentences):
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        result = {'transliteration': bench_transliteration(words),
+                  'process_user_input': bench_process_user_input(sentences)}
+    finally:
+        sys.stdout = stdout
+    click.echo(json.dumps(result))
+
+# Command used by `run` to benchmark one corpus size in a fresh process
+@cli.command(hidden=True)
+@click.argument('size', type=int)
+@click.option('--index-limit', default=2000, type=click.IntRange(min=1))
+@click.option('--single-notes', default=50)
+@click.option('--queries', default=200)
+@click.option('--top-k', 'top_k', default=3)
+@click.option('--exact', is_flag=True)
+def size(size, index_limit, single_notes, queries, top_k, exact):
+    check_padding([size], index_limit)
+    # The API modules print progress, so it goes to stderr and only the JSON
+    # result line goes to stdout
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        result = bench_size(size, index_limit, single_notes, queries, top_k, exact)
+    finally:
+        sys.stdout = stdout
+    click.echo(json.dumps(result))
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,85 @@
+import os
+import random
+
+# Latin-scripted Telugu words, English words, Telugu-script words and names
+# mixed in roughly the proportions seen in real notes
+TELUGU_LATIN_WORDS = [
+    "nenu", "meeru", "atanu", "aame", "manamu", "vaallu", "oka", "katha", "chadivanu", "vellanu",
+    "vachadu", "vachindi", "intiki", "pani", "chesanu", "chesadu", "ravali", "kavali", "ani",
+    "anukunnadu", "anukundi", "chala", "baga", "undi", "ledu", "emi", "enduku", "ela", "ippudu",
+    "repu", "ninna", "illu", "amma", "nanna", "anna", "akka", "thammudu", "chelli", "snehithudu",
+    "pustakam", "samayam", "roju", "raatri", "udayam", "bhojanam", "neellu", "vooru", "dabbulu",
+    "kotha", "paata", "peddha", "chinna", "manchi", "cheddha", "kaadu", "avunu", "kuda", "malli",
+]
+ENGLISH_WORDS = [
+    "doctor", "office", "meeting", "project", "school", "friend", "movie", "exam", "interview",
+    "visa", "family", "money", "plans", "weekend", "market", "train", "bus", "ticket", "college",
+    "results", "phone", "call", "message", "party", "birthday", "hospital", "report", "deadline",
+    "manager", "salary", "holiday", "trip", "hotel", "flight", "late", "early", "today", "tomorrow",
+    "finally", "because", "but", "and", "the", "was", "with", "after", "before", "really", "good",
+]
+TELUGU_SCRIPT_WORDS = ["కానీ", "ఆమె", "ఒకరోజు", "వల్ల", "మరియు", "ఇంటికి", "అక్కడ", "తన", "ఎంతో", "రోజు"]
+NAMES = ["Ravi", "Arun", "Anitha", "Sita", "Kiran", "Lakshmi", "Suresh", "Priya", "Venkat", "Divya"]
+
+SENTENCE_ENDINGS = [".", ".", ".", "?", "!"]
+
+
+def generate_sentence(rng, min_words=6, max_words=14):
+    """
+    Returns one synthetic Tenglish sentence.
+    """
+    words = []
+    for _ in range(rng.randint(min_words, max_words)):
+        roll = rng.random()
+        if roll < 0.45:
+            words.append(rng.choice(TELUGU_LATIN_WORDS))
+        elif roll < 0.80:
+            words.append(rng.choice(ENGLISH_WORDS))
+        elif roll < 0.90:
+            words.append(rng.choice(TELUGU_SCRIPT_WORDS))
+        else:
+            words.append(rng.choice(NAMES))
+    words[0] = words[0][:1].upper() + words[0][1:]
+    return " ".join(words) + rng.choice(SENTENCE_ENDINGS)
+
+
+def generate_note(rng, min_sentences=3, max_sentences=8):
+    """
+    Returns the text of one synthetic note.
+    """
+    return " ".join(generate_sentence(rng) for _ in range(rng.randint(min_sentences, max_sentences)))
+
+
+def generate_sentences(count, seed=0):
+    """
+    Returns `count` synthetic sentences.
+    """
+    rng = random.Random(seed)
+    return [generate_sentence(rng) for _ in range(count)]
+
+
+def telugu_latin_words(count, seed=0):
+    """
+    Returns `count` Latin-scripted Telugu words drawn from the corpus vocabulary.
+    """
+    rng = random.Random(seed)
+    return [rng.choice(TELUGU_LATIN_WORDS) for _ in range(count)]
+
+
+def write_corpus(directory, count, seed=0):
+    """
+    Writes `count` synthetic notes named note0000000.txt, note0000001.txt, ...
+    into `directory`.
+
+    Returns:
+        list: The note names, in order.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    names = []
+    for number in range(count):
+        name = f"note{number:07d}"
+        with open(os.path.join(directory, f"{name}.txt"), 'w', encoding='utf-8') as file:
+            file.write(generate_note(rng))
+        names.append(name)
+    return names
@@ -3,16 +3,35 @@ import click
 import sys
 import os
 
-# Add the directory where retrievalAPI.py and indexerAPI.py are located
+# Add the directories where retrievalAPI.py and indexerAPI.py are located, and
+# where the modules they share with the input processor (metrics.py) live, so
+# commands that import only one API module still find them
 sys.path.append(os.path.abspath('../API'))
+sys.path.append(os.path.abspath('../API/inputProcesser'))
 
-from retrievalAPI import find
-from indexerAPI import createNote, editNote, index, deleteNote
+# Commands run on the warm daemon when it is up and in this process otherwise
+import daemonAPI
+from daemonAPI import run_command, serve as serve_daemon, DAEMON_HOST, DAEMON_PORT, DAEMON_BATCH_QUERIES
 
 @click.group()
-def cli():
+@click.option('--profile', is_flag=True, help="Print a per-stage timing breakdown after the command.")
+@click.pass_context
+def cli(ctx, profile):
     """A command-line interface for managing notes and querying documents."""
-    pass
+    ctx.obj = {'profile': profile}
+
+# Print the profile of the command that just ran when --profile is given
+@cli.result_callback()
+@click.pass_context
+def print_profile(ctx, result, **kwargs):
+    report = daemonAPI.last_profile
+    if not ctx.obj['profile'] or report is None:
+        return
+    click.echo(f"\nProfile of '{report['operation']}': {report['total_ms']:.1f} ms total")
+    for name, stage in sorted(report['spans'].items(), key=lambda item: -item[1]['ms']):
+        click.echo(f"  {name:<30} {stage['ms']:10.2f} ms  ({stage['calls']} calls)")
+    for name, value in sorted(report['counters'].items()):
+        click.echo(f"  {name:<30} {value:>10}")
 
 # Command to create a new note
 @cli.command()
@@ -20,7 +39,7 @@ def cli():
 def create(filename):
     """Create a new note with FILENAME."""
     try:
-        createNote(filename)
+        run_command('create', fileName=filename)
         click.echo(f"Note '{filename}' created successfully.")
     except FileExistsError as e:
         click.echo(str(e))
@@ -32,7 +51,7 @@ def create(filename):
 def edit(filename, text):
     """Edit the note with FILENAME by replacing its content with TEXT."""
     try:
-        editNote(filename, text)
+        run_command('edit', fileName=filename, inputText=text)
         click.echo(f"Note '{filename}' edited successfully.")
     except FileNotFoundError as e:
         click.echo(str(e))
@@ -43,18 +62,78 @@ def edit(filename, text):
 def index_note(filename):
     """Index the note with FILENAME."""
     try:
-        index(filename)
+        run_command('index', fileName=filename)
         click.echo(f"Note '{filename}' indexed successfully.")
     except FileNotFoundError as e:
         click.echo(str(e))
 
+# Command to re-index every note in batches
+@cli.command()
+@click.option('--batch-size', default=0, show_default=True, help="Notes per model forward pass (0 uses INDEX_BATCH_SIZE).")
+@click.option('--max-tokens', default=0, show_default=True, help="Tokens per chunk of a note (0 uses INDEX_MAX_TOKENS).")
+@click.option('--workers', default=0, show_default=True, help="Worker processes (0 uses INDEX_WORKERS).")
+def reindex(batch_size, max_tokens, workers):
+    """Re-index every note in the notes directory."""
+    params = {key: value for key, value in
+              (('batch_size', batch_size), ('max_tokens', max_tokens), ('workers', workers)) if value}
+    count = run_command('reindex', **params)
+    click.echo(f"{count} notes re-indexed successfully.")
+
+# Command to index new and changed notes and drop deleted ones
+@cli.command()
+@click.option('--batch-size', default=0, show_default=True, help="Notes per model forward pass (0 uses INDEX_BATCH_SIZE).")
+@click.option('--workers', default=0, show_default=True, help="Worker processes (0 uses INDEX_WORKERS).")
+def sync(batch_size, workers):
+    """Bring the index in line with the notes directory."""
+    params = {key: value for key, value in (('batch_size', batch_size), ('workers', workers)) if value}
+    try:
+        summary = run_command('sync', **params)
+    except ValueError as e:
+        click.echo(str(e))
+        return
+    click.echo(f"Sync complete: {summary['indexed']} indexed, {summary['removed']} removed, "
+               f"{summary['unchanged']} unchanged.")
+
+# Command to move the notes directory into the SQLite database
+@cli.command()
+@click.option('--batch-size', default=0, show_default=True, help="Notes per model forward pass (0 uses INDEX_BATCH_SIZE).")
+@click.option('--workers', default=0, show_default=True, help="Worker processes (0 uses INDEX_WORKERS).")
+def import_files(batch_size, workers):
+    """Copy the .txt notes into the SQLite database (STORAGE_BACKEND=sqlite) and index them."""
+    params = {key: value for key, value in (('batch_size', batch_size), ('workers', workers)) if value}
+    try:
+        count = run_command('import_files', **params)
+        click.echo(f"{count} notes imported and indexed successfully.")
+    except ValueError as e:
+        click.echo(str(e))
+
+# Command to stream a JSONL or CSV file of notes into the index
+@cli.command(name='import')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']), default=None, help="Input format (default: from the file extension).")
+@click.option('--name-field', default="name", show_default=True, help="Field holding the note name.")
+@click.option('--text-field', default="text", show_default=True, help="Field holding the note text.")
+@click.option('--batch-notes', default=64, show_default=True, help="Notes passed between pipeline stages at a time.")
+@click.option('--queue-size', default=4, show_default=True, help="Batches each stage may queue up.")
+@click.option('--checkpoint-every', default=5000, show_default=True, help="Notes between checkpoints.")
+@click.option('--restart', is_flag=True, help="Ignore the checkpoint and import from the first record.")
+def import_notes(path, fmt, name_field, text_field, batch_notes, queue_size, checkpoint_every, restart):
+    """Import notes from a JSONL or CSV file, resuming an interrupted import."""
+    try:
+        count = run_command('import', path=os.path.abspath(path), fmt=fmt, name_field=name_field,
+                            text_field=text_field, batch_notes=batch_notes, queue_size=queue_size,
+                            checkpoint_every=checkpoint_every, restart=restart)
+        click.echo(f"{count} notes imported successfully.")
+    except (FileNotFoundError, ValueError) as e:
+        click.echo(str(e))
+
 # Command to delete a note
 @cli.command()
 @click.argument('filename')
 def delete(filename):
     """Delete the note with FILENAME."""
     try:
-        deleteNote(filename)
+        run_command('delete', fileName=filename)
         click.echo(f"Note '{filename}' and its embedding deleted successfully.")
     except FileNotFoundError as e:
         click.echo(str(e))
@@ -62,15 +141,180 @@ def delete(filename):
 # Command to query documents
 @cli.command()
 @click.argument('query_text')
-def query(query_text):
-    """Find the top 3 most similar documents for the QUERY_TEXT."""
-    results = find(query_text)
+@click.option('--top-k', 'top_k', default=3, show_default=True, help="Number of documents to return.")
+@click.option('--exact', is_flag=True, help="Bypass the ANN index and score every document.")
+@click.option('--nprobe', type=int, default=None, help="ANN lists to scan (higher is slower but more accurate).")
+def query(query_text, top_k, exact, nprobe):
+    """Find the top K most similar documents for the QUERY_TEXT."""
+    results = run_command('find', query=query_text, k=top_k, exact=exact, nprobe=nprobe)
     if results:
-        click.echo(f"\nTop 3 results for the query: {query_text}")
+        click.echo(f"\nTop {len(results)} results for the query: {query_text}")
         for idx, (doc_name, similarity, content) in enumerate(results):
             click.echo(f"\nRank {idx + 1}:\nDocument: {doc_name}\nSimilarity: {similarity:.4f}\nContent:\n{content}\n")
     else:
         click.echo("No similar documents found.")
 
+# Command to build the ANN index
+@cli.command()
+@click.option('--nlist', default=0, show_default=True, help="Number of IVF lists (0 picks 4 * sqrt(corpus size)).")
+def build_ann(nlist):
+    """Train the IVF index over every stored embedding."""
+    try:
+        run_command('build_ann', nlist=nlist)
+    except ValueError as e:
+        click.echo(str(e))
+
+# Command to compare the ANN index against exact search
+@cli.command()
+@click.option('--top-k', 'top_k', default=10, show_default=True, help="Number of documents compared per query.")
+@click.option('--queries', default=100, show_default=True, help="Number of stored notes used as queries.")
+@click.option('--nprobe', type=int, default=None, help="ANN lists to scan.")
+def ann_recall_check(top_k, queries, nprobe):
+    """Report recall@K of the ANN index against exact search."""
+    try:
+        recall = run_command('ann_recall', k=top_k, queries=queries, nprobe=nprobe)
+        click.echo(f"Recall@{top_k}: {recall:.4f}")
+    except ValueError as e:
+        click.echo(str(e))
+
+# Command to build the compressed first-pass tier
+@cli.command()
+@click.option('--dim', default=0, show_default=True, help="PCA dimensions kept (0 uses COMPRESSED_DIM).")
+@click.option('--dtype', type=click.Choice(['', 'int8', 'float16']), default='', help="Storage type (default: COMPRESSED_DTYPE).")
+def build_compressed(dim, dtype):
+    """Train the PCA projection and encode every stored embedding."""
+    try:
+        run_command('build_compressed', dim=dim, dtype=dtype)
+    except ValueError as e:
+        click.echo(str(e))
+
+# Command to build the BM25 index used to prefilter or fuse query candidates
+@cli.command()
+def build_lexical():
+    """Rebuild the BM25 index from the processed text of every note."""
+    try:
+        run_command('build_lexical')
+    except ValueError as e:
+        click.echo(str(e))
+
+# Command to compare the compressed tier against exact search
+@cli.command()
+@click.option('--top-k', 'top_k', default=10, show_default=True, help="Number of documents compared per query.")
+@click.option('--queries', default=100, show_default=True, help="Number of stored notes used as queries.")
+@click.option('--shortlist', type=int, default=None, help="Rows re-ranked at full precision (default: COMPRESSED_RERANK * K).")
+def compressed_recall_check(top_k, queries, shortlist):
+    """Report recall@K of the compressed tier against exact search."""
+    try:
+        recall = run_command('compressed_recall', k=top_k, queries=queries, shortlist=shortlist)
+        click.echo(f"Recall@{top_k} (first pass only): {recall['first_pass']:.4f}")
+        click.echo(f"Recall@{top_k} (re-ranked): {recall['reranked']:.4f}")
+    except ValueError as e:
+        click.echo(str(e))
+
+# Command to compare the optimized inference modes with fp32
+@cli.command()
+@click.option('--sample', default=64, show_default=True, help="Number of notes embedded per mode.")
+@click.option('--modes', default="int8,traced,int8-traced", show_default=True, help="Comma-separated modes compared with fp32.")
+@click.option('--threads', default="", help="Comma-separated intra-op thread counts to try (default: torch's).")
+def inference_check(sample, modes, threads):
+    """Report the speedup and cosine drift of each inference mode against fp32."""
+    try:
+        results = run_command('inference_check', sample_size=sample, modes=modes.split(','),
+                              threads=[int(count) for count in threads.split(',') if count])
+    except ValueError as e:
+        click.echo(str(e))
+        return
+    for row in results:
+        click.echo(f"{row['mode']:<12} threads={row['threads']:<3} {row['texts_per_sec']:8.1f} notes/sec  "
+                   f"speedup {row['speedup']:.2f}x  cosine mean {row['mean_cosine']:.4f} min {row['min_cosine']:.4f}")
+
+# Command to show cache hit rates
+@cli.command()
+def cache_stats():
+    """Show hit rates of the query and transliteration caches."""
+    stats = run_command('cache_stats')
+    query_stats = stats['query']
+    for kind in ('processed', 'embedding'):
+        click.echo(f"Query {kind}: {query_stats[kind]['hits']} hits, {query_stats[kind]['misses']} misses "
+                   f"({query_stats[kind]['hit_rate']:.1%} hit rate)")
+    click.echo(f"Query time saved: {query_stats['seconds_saved']:.2f}s")
+    translit = stats['transliteration']
+    click.echo(f"Transliteration: {translit['memory_hits']} memory hits, {translit['disk_hits']} disk hits, "
+               f"{translit['misses']} misses ({translit['hit_rate']:.1%} hit rate)")
+
+# Command to show the time spent per stage since the process started
+@cli.command()
+def metrics():
+    """Show cumulative per-stage timings and counters (of the daemon, if running)."""
+    totals = run_command('metrics')
+    for name, stage in sorted(totals['spans'].items(), key=lambda item: -item[1]['ms']):
+        click.echo(f"{name:<30} {stage['ms']:12.2f} ms  ({stage['calls']} calls)")
+    for name, value in sorted(totals['counters'].items()):
+        click.echo(f"{name:<30} {value:>12}")
+
+# Command to run the warm daemon
+@cli.command()
+@click.option('--host', default=DAEMON_HOST, show_default=True, help="Address to listen on.")
+@click.option('--port', default=DAEMON_PORT, show_default=True, help="Port to listen on.")
+@click.option('--batch-queries/--no-batch-queries', default=DAEMON_BATCH_QUERIES, show_default=True,
+              help="Answer concurrent queries in micro-batches.")
+@click.option('--watch', is_flag=True, help="Also re-index notes as they change in NOTES_DIRECTORY.")
+def serve(host, port, batch_queries, watch):
+    """Keep the model and index loaded and serve the other commands."""
+    serve_daemon(host=host, port=port, batch_queries=batch_queries, watch=watch)
+
+# Command to re-index notes as they are edited with other programs
+@cli.command()
+@click.option('--debounce', type=float, default=None, help="Seconds without changes before a burst of edits is indexed (default: WATCH_DEBOUNCE_SECONDS).")
+@click.option('--poll', is_flag=True, help="Scan NOTES_DIRECTORY periodically instead of using inotify.")
+def watch(debounce, poll):
+    """Re-index notes created, edited or deleted in NOTES_DIRECTORY."""
+    from noteWatcher import watch as watch_notes, WATCH_DEBOUNCE_SECONDS
+    debounce = WATCH_DEBOUNCE_SECONDS if debounce is None else debounce
+    try:
+        # A running daemon watches in the background with its warm model;
+        # otherwise this process loads the model and watches until interrupted
+        if daemonAPI.daemon_available():
+            status = run_command('watch', debounce=debounce, poll=poll)
+            state = "now watching" if status['started'] else "already watching"
+            click.echo(f"The daemon is {state} {status['directory']} ({status['backend']}).")
+        else:
+            watch_notes(debounce=debounce, poll=poll)
+    except (ValueError, FileNotFoundError) as e:
+        click.echo(str(e))
+
+# Command to move the embeddings into a different number of shards
+@cli.command()
+@click.option('--shards', type=int, required=True, help="New number of shards (1 merges them into one store).")
+def rebalance(shards):
+    """Move every embedding to its shard under a new shard count."""
+    if daemonAPI.daemon_available():
+        click.echo("Stop the daemon and any shard servers before rebalancing.")
+        return
+    from shardedStore import rebalance as rebalance_shards
+    rebalance_shards(shards)
+
+# Command to serve one shard to a daemon or CLI configured with SHARD_ADDRESSES
+@cli.command()
+@click.option('--shard', type=int, required=True, help="Shard number to load.")
+@click.option('--host', default="127.0.0.1", show_default=True, help="Address to listen on.")
+@click.option('--port', type=int, required=True, help="Port to listen on.")
+def serve_shard(shard, host, port):
+    """Keep one shard loaded and answer searches against it."""
+    from shardedStore import serve_shard as serve_one_shard
+    serve_one_shard(shard, host, port)
+
+# Command to run a server for every shard on this machine
+@cli.command()
+@click.option('--host', default="127.0.0.1", show_default=True, help="Address to listen on.")
+@click.option('--base-port', default=8770, show_default=True, help="Port of shard 0; shard i uses base-port + i.")
+def serve_shards(host, base_port):
+    """Start one shard server process per shard (SHARDS) on consecutive ports."""
+    from shardedStore import serve_shards as serve_all_shards, SHARDS
+    if SHARDS < 2:
+        click.echo("SHARDS is not set above 1 in the .env file")
+        return
+    serve_all_shards(host, base_port)
+
 if __name__ == "__main__":
     cli()
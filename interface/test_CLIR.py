@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+INTERFACE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+API_DIRECTORY = os.path.join(os.path.dirname(INTERFACE_DIRECTORY), 'API')
+sys.path.append(API_DIRECTORY)
+sys.path.append(os.path.join(API_DIRECTORY, 'inputProcesser'))
+
+# Modules that model-free commands must not import, and the wall-clock budget
+# of the fastest of a few runs of one in a fresh interpreter
+HEAVY_MODULES = ["torch", "transformers", "sklearn", "pandas", "nltk"]
+STARTUP_BUDGET_MS = 500
+
+# Runs one CLIR command in this interpreter, then reports which heavy modules it loaded
+STARTUP_PROBE = """
+import json, runpy, sys
+sys.argv = ['CLIR.py'] + sys.argv[1:]
+try:
+    runpy.run_path('CLIR.py', run_name='__main__')
+except SystemExit as e:
+    if e.code:
+        raise
+print(json.dumps([name for name in %r if name in sys.modules]), file=sys.stderr)
+""" % (HEAVY_MODULES,)
+
+
+@pytest.fixture
+def cli(tmp_path):
+    """
+    Runs CLIR.py the way users do (from interface/, in a fresh interpreter)
+    against empty note and embedding directories, with no daemon reachable.
+    """
+    env = dict(os.environ,
+               NOTES_DIRECTORY=str(tmp_path / "notes"),
+               EMBEDDINGS_DIRECTORY=str(tmp_path / "embeddings"),
+               STORAGE_BACKEND="files", SHARDS="0", DAEMON_PORT="1",
+               QUERY_CACHE_PATH="", METRICS_LOG="")
+    (tmp_path / "notes").mkdir()
+    (tmp_path / "embeddings").mkdir()
+
+    def run(*args, **env_overrides):
+        return subprocess.run([sys.executable, "CLIR.py", *args], cwd=INTERFACE_DIRECTORY,
+                              env=dict(env, **env_overrides), capture_output=True, text=True)
+
+    def probe(*args):
+        return subprocess.run([sys.executable, "-c", STARTUP_PROBE, *args], cwd=INTERFACE_DIRECTORY,
+                              env=env, capture_output=True, text=True)
+
+    run.tmp_path = tmp_path
+    run.probe = probe
+    return run
+
+
+@pytest.mark.parametrize("command", ["create", "delete"])
+def test_model_free_commands_start_fast_without_heavy_modules(cli, command):
+    latencies = []
+    for run in range(3):
+        if command == "delete":
+            (cli.tmp_path / "notes" / f"probe{run}.txt").write_text("")
+        start_time = time.perf_counter()
+        completed = cli.probe(command, f"probe{run}")
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        assert completed.returncode == 0, completed.stderr
+        assert json.loads(completed.stderr.strip().splitlines()[-1]) == []
+    assert min(latencies) < STARTUP_BUDGET_MS
+
+
+def test_metrics_runs_without_other_api_modules(cli):
+    completed = cli("metrics")
+    assert completed.returncode == 0, completed.stderr
+    assert "Traceback" not in completed.stderr
+
+
+def test_rebalance_moves_every_embedding_into_its_shard(cli):
+    from embeddingStore import EmbeddingStore
+    from shardedStore import ShardedStore, read_layout, shard_of
+
+    directory = str(cli.tmp_path / "embeddings")
+    vectors = np.random.default_rng(0).standard_normal((40, 8)).astype(np.float32)
+    EmbeddingStore(directory).add_many((f"note{i}#c{i}", vector) for i, vector in enumerate(vectors))
+
+    completed = cli("rebalance", "--shards", "3")
+    assert completed.returncode == 0, completed.stderr
+    assert "Moved 40 entries into 3 shard(s)" in completed.stdout
+    assert read_layout(directory) == 3
+
+    store = ShardedStore(directory, 3)
+    assert sorted(store.names()) == sorted(f"note{i}#c{i}" for i in range(40))
+    for i, shard in enumerate(store.shards):
+        assert all(shard_of(f"note{n}", 3) == i for n in range(40) if f"note{n}#c{n}" in shard)
+    np.testing.assert_allclose(store.get("note7#c7"), vectors[7] / np.linalg.norm(vectors[7]), rtol=1e-5)
+
+    # Back to a single store
+    completed = cli("rebalance", "--shards", "1")
+    assert completed.returncode == 0, completed.stderr
+    assert read_layout(directory) == 1
+    assert len(EmbeddingStore(directory)) == 40
+
+
+def test_serve_shards_imports_the_shard_module(cli):
+    completed = cli("serve-shards")
+    assert completed.returncode == 0, completed.stderr
+    assert "SHARDS is not set above 1" in completed.stdout
+
+
+@pytest.mark.parametrize("args, expected", [
+    (["reindex"], {}),
+    (["reindex", "--batch-size", "4", "--max-tokens", "128"], {'batch_size': 4, 'max_tokens': 128}),
+    (["sync"], {}),
+    (["sync", "--batch-size", "4", "--workers", "2"], {'batch_size': 4, 'workers': 2}),
+    (["import-files"], {}),
+])
+def test_indexing_options_fall_back_to_the_env_settings(monkeypatch, args, expected):
+    monkeypatch.chdir(INTERFACE_DIRECTORY)
+    import CLIR
+
+    calls = []
+    monkeypatch.setattr(CLIR, "run_command", lambda command, **params: calls.append(params) or
+                        {'indexed': 0, 'removed': 0, 'unchanged': 0})
+    result = CliRunner().invoke(CLIR.cli, args)
+    assert result.exit_code == 0, result.output
+    assert calls == [expected]